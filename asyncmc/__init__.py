@@ -10,6 +10,18 @@ Usage example::
 """
 
 from .client import Client
-from .exceptions import ClientException, ValidationException
+from .exceptions import (
+    ClientException, HostOverloadedError, ValidationException)
+from .metrics import MetricsSink, Stats
+from .hotkeys import HotKeys
+from .host import SocketOptions
+from .keys import KeyPipeline
+from .protocol import LazyValue
+from .sharedcache import SharedCache
 
-__all__ = ('Client', 'ClientException', 'ValidationException')
+__all__ = (
+    'Client', 'ClientException', 'HostOverloadedError',
+    'ValidationException',
+    'MetricsSink', 'Stats', 'HotKeys', 'SocketOptions',
+    'KeyPipeline', 'LazyValue', 'SharedCache'
+)
@@ -0,0 +1,119 @@
+"""Admission control of the requests to every server.
+
+Without limits a server which slows down collects a connection and a
+coroutine for every request sent its way until the process runs out
+of file descriptors. With C{host_max_in_flight}, at most that many
+commands run at a server at once, C{host_max_waiting} more requests
+wait up to C{host_wait_timeout} seconds for one of them to finish and
+the rest fail right away with L{HostOverloadedError}::
+
+    mc = asyncmc.Client(
+        servers=[...], host_max_in_flight=64, host_max_waiting=64,
+        host_wait_timeout=0.05)
+
+Reads treat the keys of an overloaded server as misses, so a sick
+server costs hit ratio instead of the whole application. Writes raise
+the error. A command takes a slot of its server when it is sent and gives
+it back once its reply is read, however long the connection is held.
+"""
+from collections import deque
+
+import tornado.ioloop
+from tornado.concurrent import Future
+
+from .exceptions import HostOverloadedError
+from .metrics import clock
+
+
+class HostLimit(object):
+    """Slots of the requests in flight to one server.
+
+    @ivar in_flight: number of commands holding a slot.
+    @ivar shed: number of requests rejected.
+    """
+
+    def __init__(self, name, max_in_flight, max_waiting=0, wait_timeout=0.1,
+                 metrics=None):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.metrics = metrics
+        self.in_flight = 0
+        self.shed = 0
+        self._waiters = deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def acquire(self):
+        """Future resolved once the request holds a slot.
+
+        @raises: HostOverloadedError if the waiting queue is full or
+            no slot was freed within C{wait_timeout}.
+        """
+        future = Future()
+        if self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            future.set_result(None)
+            return future
+        if len(self._waiters) >= self.max_waiting:
+            raise self._reject('{} requests in flight'.format(self.in_flight))
+
+        loop = tornado.ioloop.IOLoop.current()
+        timeout = loop.call_later(self.wait_timeout, self._expire, future)
+        self._waiters.append((future, timeout, clock()))
+        return future
+
+    def release(self):
+        """Frees the slot or hands it over to the oldest waiter."""
+        if self._waiters:
+            future, timeout, start = self._waiters.popleft()
+            tornado.ioloop.IOLoop.current().remove_timeout(timeout)
+            if self.metrics is not None:
+                self.metrics.admission_wait(self.name, clock() - start)
+            future.set_result(None)
+        else:
+            self.in_flight -= 1
+
+    def _expire(self, future):
+        for waiter in self._waiters:
+            if waiter[0] is future:
+                self._waiters.remove(waiter)
+                break
+        future.set_exception(self._reject(
+            'no slot freed in {}s'.format(self.wait_timeout)))
+
+    def _reject(self, reason):
+        self.shed += 1
+        if self.metrics is not None:
+            self.metrics.shed(self.name)
+        return HostOverloadedError(
+            'server {} overloaded'.format(self.name), reason)
+
+
+class AdmissionControl(object):
+    """Limits of every server, shared by the connections of a pool.
+
+    @param max_in_flight: commands running at a server at once.
+    @param max_waiting: requests waiting for a slot of a server.
+    @param wait_timeout: seconds a request waits for a slot.
+    """
+
+    def __init__(self, max_in_flight, max_waiting=0, wait_timeout=0.1,
+                 metrics=None):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.metrics = metrics
+        self.limits = {}
+
+    def limit(self, name):
+        """L{HostLimit} of the server C{"host:port"}."""
+        limit = self.limits.get(name)
+        if limit is None:
+            limit = self.limits[name] = HostLimit(
+                name, self.max_in_flight, self.max_waiting,
+                self.wait_timeout, self.metrics)
+        return limit
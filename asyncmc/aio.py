@@ -0,0 +1,390 @@
+"""Native asyncio memcached client.
+
+Same commands and the same value encoding as L{asyncmc.Client}, but
+written with C{async def} on top of asyncio streams, so a call costs
+one coroutine and no tornado Future layers. It runs on any asyncio
+loop, including uvloop and Tornado 5+ (which runs on asyncio)::
+
+    from asyncmc.aio import Client
+
+    async def out():
+        mc = Client(servers=['localhost:11211'])
+        await mc.set(b"some_key", b"Some value")
+        value = await mc.get(b"some_key")
+        values = await mc.multi_get(b"some_key", b"other_key")
+        await mc.delete(b"another_key")
+        mc.close()
+
+It spreads keys over the servers by modulo hash only: replicas,
+server weights, hedged reads and admission control are features of
+L{asyncmc.Client} and are not supported here.
+
+Requires python 3.5+.
+"""
+import asyncio
+import collections
+import time
+
+from . import constants as const
+from . import protocol
+from .distribution import parse_weight
+from .exceptions import (ClientException, ConnectionDeadError,
+                         ValidationException)
+from .host import SocketOptions
+from .keys import KeyPipeline
+from .metrics import clock
+from .protocol import MultiGetResult
+
+# writes are not awaited until this much data is buffered
+WRITE_HIGH_WATER = 64 * 1024
+
+
+class HostPool(object):
+    """Idle connections to one server."""
+
+    def __init__(self, server, maxsize, metrics=None, socket_options=None):
+        self.host, self.port = protocol.parse_server(server)
+        self.maxsize = maxsize
+        self.metrics = metrics
+        self.socket_options = socket_options or SocketOptions()
+        self.deaduntil = 0
+        self.disconect_reason = None
+        self.connected = False
+        self._idle = collections.deque()
+
+    def __str__(self):
+        return protocol.format_server(self.host, self.port)
+
+    def mark_dead(self, reason):
+        if self.metrics is not None and self.deaduntil < time.time():
+            self.metrics.host_dead(str(self), str(reason))
+        self.disconect_reason = str(reason)
+        self.deaduntil = time.time() + const.DEAD_RETRY
+        self.close()
+
+    async def acquire(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof():
+                return reader, writer
+            writer.close()
+
+        if self.deaduntil > time.time():
+            raise ConnectionDeadError(
+                'socket host "{}" port "{}" disconected because "{}"'.format(
+                    self.host, self.port, self.disconect_reason))
+        if self.port is None:
+            connect = asyncio.open_unix_connection(self.host)
+        else:
+            connect = asyncio.open_connection(self.host, self.port)
+        try:
+            conn = await asyncio.wait_for(connect, const.SOCKET_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.mark_dead('connect: {}'.format(e or 'timeout'))
+            raise ConnectionDeadError(
+                'socket host "{}" port "{}" disconected because "{}"'.format(
+                    self.host, self.port, self.disconect_reason))
+        # asyncio creates the socket, so the options are set once it is
+        # connected; the stream buffers are asyncio's own
+        self.socket_options.apply(conn[1].get_extra_info('socket'))
+        if self.metrics is not None:
+            self.metrics.connect(str(self), reconnect=self.connected)
+        self.connected = True
+        return conn
+
+    def release(self, conn):
+        if len(self._idle) < self.maxsize:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class Client(object):
+    """asyncio memcached client.
+
+    @param servers: list of C{"host:port"} or C{"unix:/path"} servers.
+    @param pool_size: maximal number of idle connections kept per server.
+    @param metrics: optional L{MetricsSink}.
+    @param socket_options: optional L{SocketOptions} of the connections.
+    @param keys: optional L{KeyPipeline} with the key prefix and hashing.
+    """
+
+    def __init__(self, servers=("localhost:11211",), pool_size=15,
+                 metrics=None, socket_options=None, keys=None):
+        self.metrics = metrics
+        self.keys = keys or KeyPipeline()
+        self.hosts = []
+        for server in servers:
+            server, weight = parse_weight(server)
+            if weight != 1:
+                raise ValidationException(
+                    'server weights are not supported by aio.Client', server)
+            self.hosts.append(
+                HostPool(server, pool_size, metrics, socket_options))
+
+    def _get_host(self, key):
+        return self.hosts[protocol.server_hash(key) % len(self.hosts)]
+
+    def _key(self, key):
+        return self.keys(key)
+
+    def close(self):
+        for host in self.hosts:
+            host.close()
+
+    async def _execute(self, host, cmd, read, *args):
+        """Sends the command and reads the reply with C{read(reader)}.
+
+        A connection which failed or was cancelled in the middle of
+        a command is closed, never returned to the pool.
+        """
+        start = clock() if self.metrics is not None else None
+        reader, writer = await host.acquire()
+        try:
+            writer.write(cmd)
+            if writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                await writer.drain()
+            result = await read(reader, *args)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            host.mark_dead(e)
+            raise ConnectionDeadError(
+                'socket host "{}" disconected because "{}"'.format(host, e))
+        except BaseException:
+            writer.close()
+            raise
+        host.release((reader, writer))
+        if start is not None:
+            self.metrics.command(
+                cmd.split(b' ', 1)[0].rstrip(), str(host), clock() - start)
+            self.metrics.bytes_sent(str(host), len(cmd))
+        return result
+
+    @staticmethod
+    async def _read_line(reader):
+        line = await reader.readuntil(b'\r\n')
+        return line[:-2]
+
+    @staticmethod
+    async def _read_nothing(reader):
+        return None
+
+    @staticmethod
+    async def _read_values(reader, received):
+        line = await reader.readuntil(b'\r\n')
+        while line != b'END\r\n':
+            key, flags, length = protocol.parse_value(line)
+            val = await reader.readexactly(length + 2)
+            if key in received:
+                raise ClientException('duplicate results from servers')
+            received[key] = (flags, val[:-2])
+            line = await reader.readuntil(b'\r\n')
+        return received
+
+    @staticmethod
+    async def _read_stats(reader):
+        result = {}
+        line = await reader.readuntil(b'\r\n')
+        while line != b'END\r\n':
+            protocol.parse_stat(line, result)
+            line = await reader.readuntil(b'\r\n')
+        return result
+
+    async def _fetch_values(self, host, keys):
+        cmd = b'get ' + b' '.join(keys) + b'\r\n'
+        try:
+            received = await self._execute(
+                host, cmd, self._read_values, {})
+        except ConnectionDeadError:
+            return None
+        if self.metrics is not None:
+            self.metrics.lookups(
+                str(host), len(received), len(keys) - len(received))
+        return received
+
+    async def get(self, key, default=None):
+        """Gets a single value from the server.
+
+        @return: the value or C{default} if there is no such key.
+        """
+        key = self._key(key)
+        received = await self._fetch_values(self._get_host(key), [key])
+        if received is None:
+            raise ConnectionDeadError(
+                'no alive connetions {}'.format(
+                    self._get_host(key).disconect_reason))
+        if key not in received:
+            return default
+        return protocol.decode_value(*received[key])
+
+    async def multi_get(self, *keys, deadline=None, lazy=False, raw=False):
+        """Retrieves multiple keys, querying the servers concurrently.
+
+        @param deadline: optional number of seconds to wait for the
+            servers. Keys of the servers which did not answer in time
+            are treated as misses.
+        @param lazy: return L{LazyValue}s decoded on first access.
+        @param raw: return the C{(bytes, flags)} as stored.
+        @return: L{MultiGetResult} list of values for the specified keys.
+        """
+        if not keys:
+            return MultiGetResult()
+        keys = self.keys.batch(keys)
+        if len(set(keys)) != len(keys):
+            raise ClientException('duplicate keys passed to multi_get')
+
+        groups = collections.OrderedDict()
+        for key in keys:
+            groups.setdefault(self._get_host(key), []).append(key)
+        fetches = [
+            asyncio.ensure_future(self._fetch_values(host, host_keys))
+            for host, host_keys in groups.items()
+        ]
+        if deadline is not None:
+            await asyncio.wait(fetches, timeout=deadline)
+        else:
+            await asyncio.gather(*fetches)
+
+        received = {}
+        cut_off = []
+        dead = 0
+        for host, fetch in zip(groups, fetches):
+            if not fetch.done():
+                fetch.cancel()
+                cut_off.append(str(host))
+                continue
+            values = fetch.result()
+            if values is None:
+                dead += 1
+                continue
+            for key, item in values.items():
+                if key in received:
+                    raise ClientException('duplicate results from servers')
+                received[key] = item
+
+        if dead == len(groups):
+            raise ConnectionDeadError(
+                'no alive connetions {}'.format(
+                    ', '.join(h.disconect_reason for h in groups)))
+        decode = protocol.value_decoder(lazy, raw)
+        res = MultiGetResult(
+            decode(*received[k]) if k in received else None
+            for k in keys
+        )
+        res.cut_off = cut_off
+        return res
+
+    async def _storage_command(self, command, key, value, exptime=0,
+                               noreply=False):
+        key = self._key(key)
+        value, flags = protocol.encode_value(value)
+        cmd = protocol.storage_command(
+            command, key, value, flags, exptime, noreply) + b'\r\n'
+        resp = await self._execute(
+            self._get_host(key), cmd,
+            self._read_nothing if noreply else self._read_line)
+        return protocol.storage_result(cmd, resp, noreply)
+
+    async def set(self, key, value, exptime=0, noreply=False):
+        """Sets a key to a value on the server.
+
+        @return: bool, True in case of success.
+        """
+        return await self._storage_command(
+            b'set', key, value, exptime, noreply)
+
+    async def add(self, key, value, exptime=0, noreply=False):
+        """Stores the value only if the server doesn't hold the key."""
+        return await self._storage_command(
+            b'add', key, value, exptime, noreply)
+
+    async def replace(self, key, value, exptime=0, noreply=False):
+        """Stores the value only if the server does hold the key."""
+        return await self._storage_command(
+            b'replace', key, value, exptime, noreply)
+
+    async def append(self, key, value, exptime=0, noreply=False):
+        """Adds data to an existing key after existing data."""
+        if isinstance(value, (bytes, str)):
+            return await self._storage_command(
+                b'append', key, value, exptime, noreply)
+        old_val = await self.get(key)
+        return await self._storage_command(
+            b'set', key, old_val + value, exptime, noreply)
+
+    async def prepend(self, key, value, exptime=0, noreply=False):
+        """Adds data to an existing key before existing data."""
+        if isinstance(value, (bytes, str)):
+            return await self._storage_command(
+                b'prepend', key, value, exptime, noreply)
+        old_val = await self.get(key)
+        return await self._storage_command(
+            b'set', key, value + old_val, exptime, noreply)
+
+    async def delete(self, key, noreply=False):
+        """Deletes a key/value pair from the server.
+
+        @return: True if the value was deleted, False if it was not found.
+        """
+        key = self._key(key)
+        cmd = b'delete ' + key + (b' noreply' if noreply else b'') + b'\r\n'
+        response = await self._execute(
+            self._get_host(key), cmd,
+            self._read_nothing if noreply else self._read_line)
+        if not noreply and response not in (const.DELETED, const.NOT_FOUND):
+            raise ClientException('Memcached delete failed', response)
+        return response == const.DELETED or noreply
+
+    async def _change(self, command, key, value, noreply):
+        key = self._key(key)
+        cmd = b' '.join((command, key, str(value).encode('ascii'))) + \
+            (b' noreply' if noreply else b'') + b'\r\n'
+        response = await self._execute(
+            self._get_host(key), cmd,
+            self._read_nothing if noreply else self._read_line)
+        if noreply:
+            return None
+        if response == const.NOT_FOUND:
+            raise ClientException('Key {0} not found'.format(key))
+        return int(response)
+
+    async def incr(self, key, value=1, noreply=False):
+        """Increments a key on the server by the given amount.
+
+        @return: the new value; raises ClientException if there is no key.
+        """
+        return await self._change(b'incr', key, value, noreply)
+
+    async def decr(self, key, value=1, noreply=False):
+        """Decrements a key on the server by the given amount.
+
+        @return: the new value; raises ClientException if there is no key.
+        """
+        return await self._change(b'decr', key, value, noreply)
+
+    async def flush_all(self, noreply=False):
+        """Invalidates all existing items at every server."""
+        cmd = b'flush_all' + (b' noreply' if noreply else b'') + b'\r\n'
+        read = self._read_nothing if noreply else self._read_line
+        response = await asyncio.gather(*[
+            self._execute(host, cmd, read) for host in self.hosts
+        ])
+        if not noreply and any(r != const.OK for r in response):
+            raise ClientException('Memcached flush_all failed', response)
+
+    async def version(self):
+        """Version of the first server."""
+        response = await self._execute(
+            self.hosts[0], b'version\r\n', self._read_line)
+        if not response.startswith(const.VERSION):
+            raise ClientException('Memcached version failed', response)
+        return response.split()[1]
+
+    async def stats(self, args=None):
+        """Runs a stats command on the first server."""
+        cmd = b'stats ' + (args or b'') + b'\r\n'
+        return await self._execute(self.hosts[0], cmd, self._read_stats)
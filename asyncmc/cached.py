@@ -0,0 +1,133 @@
+"""Cache-aside decorators of coroutines.
+
+L{cached} caches the result of a coroutine under a key built from its
+arguments::
+
+    @mc.cached(lambda user_id: 'user:{}'.format(user_id), exptime=300,
+               jitter=30)
+    @gen.coroutine
+    def get_user(user_id):
+        ...
+
+L{cached_many} takes a coroutine loading many ids at once, looks all
+the ids up with a single C{multi_get}, loads only the missing ones with
+a single call and stores them with pipelined L{Client.set_many}, one per
+expiration time::
+
+    @mc.cached_many(lambda user_id: 'user:{}'.format(user_id), exptime=300)
+    @gen.coroutine
+    def get_users(user_ids):
+        users = yield db.load_users(user_ids)
+        raise gen.Return(dict((user.id, user) for user in users))
+
+    users = yield get_users([1, 2, 3])  # dict of id to user
+
+A cached None is a hit, not a miss. Failures of memcached are logged
+and the coroutine is called as if nothing was cached. C{jitter} adds
+up to that many seconds to C{exptime}, so values filled together do not
+expire together.
+"""
+import functools
+import logging
+import random
+import socket
+
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from .exceptions import ClientException
+
+CACHE_ERRORS = (ClientException, StreamClosedError, socket.error)
+
+
+def _exptime(exptime, jitter):
+    if not exptime or not jitter:
+        return exptime
+    return exptime + random.randint(0, int(jitter))
+
+
+def cached(client, key_fn, exptime=0, jitter=0):
+    """Decorator caching the result of a coroutine in the client.
+
+    @param key_fn: function of the arguments of the coroutine returning
+        the key.
+    @param exptime: expiration time of the cached results.
+    @param jitter: maximal number of seconds added to C{exptime}.
+    """
+    def decorator(func):
+
+        @gen.coroutine
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_fn(*args, **kwargs)
+            try:
+                found = yield client._found([key])
+            except CACHE_ERRORS as e:
+                logging.warning('cache lookup of %r failed: %s', key, e)
+                found = {}
+            if key in found:
+                raise gen.Return(found[key])
+
+            value = yield gen.maybe_future(func(*args, **kwargs))
+            try:
+                yield client.set(
+                    key, value, _exptime(exptime, jitter), noreply=True)
+            except CACHE_ERRORS as e:
+                logging.warning('cache fill of %r failed: %s', key, e)
+            raise gen.Return(value)
+
+        return wrapper
+    return decorator
+
+
+def cached_many(client, key_fn, exptime=0, jitter=0):
+    """Decorator caching a coroutine which loads many ids at once.
+
+    The coroutine is called with the list of the missing ids as its
+    first argument and returns a dict of the ids to their values; ids
+    left out of it are not cached. The decorated coroutine returns
+    the dict for all the ids.
+
+    @param key_fn: function of an id returning its key.
+    @param exptime: expiration time of the cached values.
+    @param jitter: maximal number of seconds added to C{exptime}.
+    """
+    def decorator(func):
+
+        @gen.coroutine
+        @functools.wraps(func)
+        def wrapper(ids, *args, **kwargs):
+            ids = list(ids)
+            keys = dict((id_, key_fn(id_)) for id_ in ids)
+            try:
+                found = yield client._found(list(keys.values()))
+            except CACHE_ERRORS as e:
+                logging.warning(
+                    'cache lookup of %d keys failed: %s', len(keys), e)
+                found = {}
+            result = dict(
+                (id_, found[keys[id_]]) for id_ in ids if keys[id_] in found)
+            missing = [id_ for id_ in ids if id_ not in result]
+            if not missing:
+                raise gen.Return(result)
+
+            loaded = yield gen.maybe_future(func(missing, *args, **kwargs))
+            result.update(loaded)
+            # a set_many per expiration time, each value jittered
+            batches = {}
+            for id_, value in loaded.items():
+                if id_ in keys:
+                    batches.setdefault(_exptime(exptime, jitter), []).append(
+                        (keys[id_], value))
+            try:
+                yield [
+                    client.set_many(items, batch_exptime, noreply=True)
+                    for batch_exptime, items in batches.items()
+                ]
+            except CACHE_ERRORS as e:
+                logging.warning(
+                    'cache fill of %d keys failed: %s', len(loaded), e)
+            raise gen.Return(result)
+
+        return wrapper
+    return decorator
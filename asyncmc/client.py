@@ -1,14 +1,26 @@
 import tornado.ioloop
 import functools
-import pickle
-import json
-import re
 import logging
+import socket
 from tornado import gen
+from tornado.iostream import StreamClosedError
 
+from . import cached
 from . import constants as const
-from .exceptions import ClientException, ValidationException
+from . import protocol
+from .admission import AdmissionControl
+from .exceptions import (
+    ClientException, ConnectionDeadError, HostOverloadedError)
+from .counters import CounterAggregator
+from .hedge import HedgePolicy
+from .host import SocketOptions
+from .keys import KeyPipeline
+from .namespace import Namespace
+from .offload import Offload
+from .writebehind import WriteBehind
 from .pool import ConnectionPool
+from .metrics import clock
+from .protocol import MultiGetResult
 
 """client module for memcached (memory cache daemon)
 
@@ -82,18 +94,73 @@ class Client(object):
     """
 
     def __init__(self, **kwargs):
+        self._options = kwargs
         self.debug = kwargs.get('debug')
         self.io_loop = kwargs.get('loop', tornado.ioloop.IOLoop.instance())
+        self.metrics = kwargs.get('metrics')
+        self.hot_keys = kwargs.get('hot_keys')
+        self.hedge = None
+        if kwargs.get('hedge_after') is not None or \
+                kwargs.get('hedge_percentile') is not None:
+            self.hedge = HedgePolicy(
+                delay=kwargs.get('hedge_after'),
+                percentile=kwargs.get('hedge_percentile'))
+        self.keys = KeyPipeline(
+            prefix=kwargs.get('key_prefix'),
+            hash_keys=kwargs.get('hash_keys', False))
+        self.socket_options = SocketOptions(
+            nodelay=kwargs.get('tcp_nodelay', True),
+            keepalive_idle=kwargs.get('keepalive_idle'),
+            keepalive_interval=kwargs.get('keepalive_interval'),
+            send_buffer=kwargs.get('send_buffer'),
+            recv_buffer=kwargs.get('recv_buffer'),
+            max_buffer_size=kwargs.get('max_buffer_size'),
+            read_chunk_size=kwargs.get('read_chunk_size'),
+        )
+        self.offload = None
+        if kwargs.get('executor') is not None:
+            self.offload = Offload(
+                kwargs['executor'],
+                encode_threshold=kwargs.get(
+                    'offload_encode_threshold', 256 * 1024),
+                decode_threshold=kwargs.get(
+                    'offload_decode_threshold', 256 * 1024))
+        self.admission = None
+        if kwargs.get('host_max_in_flight') is not None:
+            self.admission = AdmissionControl(
+                kwargs['host_max_in_flight'],
+                max_waiting=kwargs.get('host_max_waiting', 0),
+                wait_timeout=kwargs.get('host_wait_timeout', 0.1),
+                metrics=self.metrics)
         self.pool = ConnectionPool(
             kwargs.get('servers', ["localhost:11211"]),
             debug=self.debug,
             loop=self.io_loop,
             minsize=kwargs.get('pool_minsize', 1),
-            maxsize=kwargs.get('pool_size', 15)
+            maxsize=kwargs.get('pool_size', 15),
+            metrics=self.metrics,
+            socket_options=self.socket_options,
+            replicas=kwargs.get('replicas', 1),
+            distribution=kwargs.get('distribution', 'modulo'),
+            admission=self.admission
         )
+        self._last_totals = None
+        # counter aggregators and write-behind queues sent by flush
+        self._buffers = []
+        self.migration = None
+        self.migration_ends = None
+        self.migration_window = None
+        self.backfill_exptime = kwargs.get('backfill_exptime')
+        if kwargs.get('migrate_from'):
+            self._start_migration(
+                kwargs['migrate_from'], kwargs.get('migration_window', 3600))
 
         """Create a new Client object with the given list of servers.
             @param servers: C{servers} is passed to L{set_servers}.
+                Every server is C{"host:port"} or C{"unix:/path/to/socket"}
+                for a unix domain socket. C{"host:port:weight"} or
+                C{(server, weight)} gives the server a weight times bigger
+                share of the keys.
             @param loop: Event loop which is used for ansync operations.
                 It is optional but if is not defined it will be tornado
                 singletone event loop instance.
@@ -101,12 +168,59 @@ class Client(object):
                 server
             @param pool_size: Maximal number of connetions with memcashed
                 server
+            @param metrics: optional L{MetricsSink} which receives
+                latency, traffic and pool events.
+            @param hot_keys: optional L{HotKeys} which tracks the most
+                read keys and caches them locally, or a L{SharedCache}
+                shared by the processes of the machine.
+            @param tcp_nodelay: disables Nagle's algorithm, True by default.
+            @param keepalive_idle: seconds of idle connection before TCP
+                keepalive probes, keepalive is off by default.
+            @param keepalive_interval: seconds between keepalive probes.
+            @param send_buffer: C{SO_SNDBUF} of the sockets.
+            @param recv_buffer: C{SO_RCVBUF} of the sockets.
+            @param max_buffer_size: biggest reply buffered by the streams,
+                it has to fit the largest value.
+            @param read_chunk_size: bytes read from a socket at once.
+            @param distribution: C{"modulo"}, cmemcache compatible and
+                the default, or C{"ketama"}, consistent hashing which
+                keeps the placement stable when servers or their weights
+                change. See L{asyncmc.distribution}.
+            @param replicas: number of servers every key is stored at.
+                Writes go to all of them at once, reads go to the first
+                one and fall back to the next on a miss or a dead server.
+            @param hedge_after: seconds after which a read the server did
+                not answer is sent to the next replica too, see
+                L{asyncmc.hedge}.
+            @param hedge_percentile: hedge the reads slower than this
+                percentile of the recent reads instead.
+            @param migrate_from: servers the keys are moving from, see
+                L{migrate}.
+            @param migration_window: seconds the old servers are used.
+            @param backfill_exptime: exptime of the items copied from
+                the old servers, memcached does not tell the original.
+                The migration window by default, so the copies do not
+                outlive the writes mirrored to the old servers by much.
+            @param key_prefix: namespace put in front of every key.
+            @param hash_keys: keys longer than 250 bytes or with characters
+                memcached does not allow are replaced by their digest
+                instead of raising L{ValidationException}.
+            @param executor: C{concurrent.futures} executor encoding and
+                decoding the large values off the IOLoop, see
+                L{asyncmc.offload}.
+            @param offload_encode_threshold: values estimated bigger
+                than this many bytes are encoded in the executor.
+            @param offload_decode_threshold: values of more bytes than
+                this are decoded in the executor.
+            @param host_max_in_flight: commands running at a server at
+                once, unlimited by default. See L{asyncmc.admission}.
+            @param host_max_waiting: requests waiting for a server when
+                it is at the limit, the rest raise L{HostOverloadedError}
+                and reads treat their keys as misses.
+            @param host_wait_timeout: seconds a request waits.
         """
 
-    # key supports ascii sans space and control chars
-    # \x21 is !, right after space, and \x7e is -, right before DEL
-    # also 1 <= len <= 250 as per the spec
-    _valid_key_re = re.compile(b'^[\x21-\x7e]{1,250}$')
+    _valid_key_re = protocol.valid_key_re
 
     @acquire
     @gen.coroutine
@@ -125,21 +239,108 @@ class Client(object):
         resp = yield conn.send_cmd(cmd)
         result = {}
         while resp != b'END\r\n':
-            terms = resp.split()
-
-            if len(terms) == 2 and terms[0] == b'STAT':
-                result[terms[1]] = None
-            elif len(terms) == 3 and terms[0] == b'STAT':
-                result[terms[1]] = terms[2]
-            elif len(terms) >= 3 and terms[0] == b'STAT':
-                result[terms[1]] = b' '.join(terms[2:])
-            else:
-                raise ClientException('stats failed', resp)
-
+            protocol.parse_stat(resp, result)
             resp = yield conn.get_stream(cmd).read_until(b'\r\n')
 
         raise gen.Return(result)
 
+    @acquire
+    @gen.coroutine
+    def cluster_stats(self, conn, group=None):
+        """Runs a stats command on every server at once.
+
+        @param group: None for the general stats, C{b'slabs'},
+            C{b'items'}, C{b'settings'}, C{b'conns'} or another argument
+            of the stats command.
+        @return: dict with C{"hosts"}, the stats of every server (None if
+            it did not answer) parsed by L{protocol.group_stats}, and for
+            the general stats C{"totals"}, the sums of the servers with
+            C{hit_ratio} and the C{<counter>_per_sec} rates since the
+            previous call.
+        """
+        cmd = b'stats' + (b' ' + group if group else b'')
+        results = yield [self._host_stats(host, cmd) for host in conn.hosts]
+        hosts = dict(
+            (str(host), protocol.group_stats(result, group)
+             if result is not None else None)
+            for host, result in zip(conn.hosts, results)
+        )
+        stats = {'hosts': hosts}
+        if not group:
+            stats['totals'] = self._stats_totals(
+                [h for h in hosts.values() if h is not None])
+        raise gen.Return(stats)
+
+    @gen.coroutine
+    def _host_stats(self, host, cmd):
+        try:
+            stream = yield host.send_cmd(cmd, stream=True)
+            result = {}
+            line = yield stream.read_until(b'\r\n')
+            while line != b'END\r\n':
+                protocol.parse_stat(line, result)
+                line = yield stream.read_until(b'\r\n')
+        except HostOverloadedError:
+            raise gen.Return(None)
+        except (ConnectionDeadError, StreamClosedError, socket.error) as msg:
+            host.mark_dead(msg)
+            raise gen.Return(None)
+        finally:
+            host.release_slot()
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def _metadump(self, host, consume):
+        """Streams the keys of the server with C{lru_crawler metadump}.
+
+        @param consume: function called with the L{protocol.KeyInfo} of
+            every key, it may return a future to slow the stream down.
+        """
+        stream = yield host.send_cmd(b'lru_crawler metadump all', stream=True)
+        try:
+            line = yield stream.read_until(b'\n')
+            while line != b'END\r\n':
+                waiting = consume(protocol.parse_metadump(line))
+                if waiting is not None:
+                    yield waiting
+                line = yield stream.read_until(b'\n')
+        finally:
+            host.release_slot()
+
+    # counters of the general stats summed up over the servers
+    _summed_stats = (
+        'curr_items', 'total_items', 'bytes', 'limit_maxbytes',
+        'curr_connections', 'cmd_get', 'cmd_set', 'get_hits', 'get_misses',
+        'evictions', 'bytes_read', 'bytes_written',
+    )
+    # and those of them reported per second
+    _rate_stats = (
+        'cmd_get', 'cmd_set', 'get_hits', 'get_misses', 'evictions',
+        'bytes_read', 'bytes_written',
+    )
+
+    def _stats_totals(self, hosts):
+        totals = dict(
+            (name, sum(h.get(name, 0) for h in hosts))
+            for name in self._summed_stats
+        )
+        totals['servers'] = len(hosts)
+        reads = totals['get_hits'] + totals['get_misses']
+        totals['hit_ratio'] = (
+            float(totals['get_hits']) / reads if reads else 0.0)
+
+        now = self.io_loop.time()
+        if self._last_totals is not None:
+            last_time, last = self._last_totals
+            seconds = now - last_time
+            for name in self._rate_stats:
+                # a restarted server starts its counters from zero
+                delta = max(totals[name] - last[name], 0)
+                totals[name + '_per_sec'] = (
+                    delta / seconds if seconds > 0 else 0.0)
+        self._last_totals = (now, totals)
+        return totals
+
     @acquire
     @gen.coroutine
     def version(self, conn):
@@ -155,53 +356,231 @@ class Client(object):
         raise gen.Return(number)
 
     def _key_type(self, key_list=[], key=None):
-        out_keys = []
-
-        if not key_list and key:
-            if not isinstance(key, bytes):
-                key = key.encode('utf-8')
-            return key
+        """Validated memcached keys, see L{KeyPipeline}."""
+        if key is not None:
+            return self.keys(key)
+        return self.keys.batch(key_list)
 
-        for key in key_list:
-            if not isinstance(key, bytes):
-                key = key.encode('utf-8')
-            out_keys.append(key)
-        return out_keys
+    @gen.coroutine
+    def flush(self):
+        """Sends what the counter aggregators and write-behind queues
+        hold, yield it before L{close} not to lose it."""
+        for buffer in self._buffers:
+            yield buffer.flush()
 
     def close(self):
+        """Stops the counter aggregators and write-behind queues and
+        closes the connections."""
+        for buffer in self._buffers:
+            buffer.stop()
         self.pool.clear()
+        if self.migration is not None:
+            self.migration.close()
 
-    def _value_type(self, value):
-        flag = 0
-        if isinstance(value, bytes):
-            pass
-        elif isinstance(value, str):
-            flag |= const.FLAG_STRING
-            value = value.encode('utf-8')
-        elif isinstance(value, bool):
-            flag |= const.FLAG_BOOLEAN
-            value = str(int(value)).encode('utf-8')
-        elif isinstance(value, int):
-            flag |= const.FLAG_INTEGER
-            value = str(value).encode('utf-8')
-        else:
-            try:
-                value = json.dumps(value).encode('utf-8')
-                flag |= const.FLAG_JSON
-            except Exception as e:
-                logging.info(e)
-                value = pickle.dumps(value, 2)
-                flag |= const.FLAG_PICKLE
+    def counters(self, **kwargs):
+        """Starts a L{CounterAggregator} flushed through this client.
+
+        @param kwargs: options of L{CounterAggregator}.
+        """
+        aggregator = CounterAggregator(self, **kwargs)
+        aggregator.start()
+        self._buffers.append(aggregator)
+        return aggregator
+
+    def write_behind(self, **kwargs):
+        """Creates a L{WriteBehind} queue of sets through this client.
+
+        @param kwargs: options of L{WriteBehind}.
+        """
+        queue = WriteBehind(self, **kwargs)
+        self._buffers.append(queue)
+        return queue
+
+    def namespace(self, name, ttl=1.0, exptime=0):
+        """Handle of keys invalidated at once, see L{Namespace}.
+
+        @param name: bytes or string, name of the namespace.
+        @param ttl: seconds the generation of the namespace is cached.
+        @param exptime: exptime of the generation key.
+        """
+        return Namespace(self, name, ttl, exptime)
+
+    def cached(self, key_fn, exptime=0, jitter=0):
+        """Decorator caching the result of a coroutine, see L{cached}.
+
+        @param key_fn: function of the arguments returning the key.
+        @param exptime: expiration time of the cached results.
+        @param jitter: maximal number of seconds added to C{exptime}.
+        """
+        return cached.cached(self, key_fn, exptime, jitter)
+
+    def cached_many(self, key_fn, exptime=0, jitter=0):
+        """Decorator caching a coroutine which loads many ids at once,
+        see L{cached_many}.
+
+        @param key_fn: function of an id returning its key.
+        @param exptime: expiration time of the cached values.
+        @param jitter: maximal number of seconds added to C{exptime}.
+        """
+        return cached.cached_many(self, key_fn, exptime, jitter)
 
-        if not isinstance(value, bytes):
-            logging.info(value)
-            value = bytes(value)
+    def scan(self, hosts=None, prefix=None, buffer=1000):
+        """Async iterator of the keys stored at the servers, see
+        L{asyncmc.scan}.
 
-        return value, flag
+        @param hosts: C{"host:port"} of the servers to scan, all of them
+            by default.
+        @param prefix: only the keys starting with it.
+        @param buffer: keys read ahead of the consumer.
+        @return: L{KeyScan} of the L{protocol.KeyInfo} of the keys.
+        """
+        # async iterators are Python 3 syntax
+        from .scan import KeyScan
+        return KeyScan(self, hosts, prefix, buffer)
+
+    def update_servers(self, servers):
+        """Switches the client to a new list of servers.
+
+        Commands in flight finish at their servers, the sockets to the
+        servers which stay in the list are kept and the ones to the
+        removed servers are closed once their connections are released.
+        Use the C{"ketama"} distribution to move only the keys of the
+        added and removed servers.
+
+        @param servers: list of servers like the C{servers} option.
+        """
+        self.pool.update_servers(servers)
+
+    def migrate(self, servers, window=3600):
+        """Moves the client to new servers without a storm of misses.
+
+        For C{window} seconds the current servers are kept as the old
+        placement: reads missed at the new servers are looked up at the
+        old ones and copied to the new ones in the background (with
+        C{add}, so newer writes win), while writes and deletes go to
+        both placements so the old one does not serve stale values.
+
+        @param servers: the new list of servers.
+        @param window: seconds the old servers are used.
+        """
+        self._start_migration(self.pool.servers, window)
+        self.update_servers(servers)
+
+    def _start_migration(self, servers, window):
+        if self.migration is not None:
+            self.migration.close()
+        options = dict(self._options, servers=servers, loop=self.io_loop,
+                       hot_keys=None, migrate_from=None)
+        self.migration = Client(**options)
+        self.migration_ends = self.io_loop.time() + window
+        self.migration_window = window
+
+    def _migrating(self):
+        if self.migration is None:
+            return False
+        if self.io_loop.time() >= self.migration_ends:
+            self.migration.close()
+            self.migration = None
+            return False
+        return True
+
+    @gen.coroutine
+    def _read_migrated(self, keys, deadline=None):
+        """Items of the keys at the old servers of a migration."""
+        old = self.migration
+        received = {}
+        conn = yield old.pool.acquire()
+        try:
+            yield old._fetch_items(conn, keys, received, deadline)
+        except ConnectionDeadError as e:
+            logging.warning('reading the old servers failed: %s', e)
+        finally:
+            old.pool.release(conn)
+        raise gen.Return(received)
+
+    @gen.coroutine
+    def _backfill(self, items):
+        """Copies items read from the old servers to the new ones."""
+        exptime = self.backfill_exptime
+        if exptime is None:
+            exptime = int(min(
+                self.migration_window, const.MAX_RELATIVE_EXPTIME))
+        cmds = dict(
+            (key, protocol.storage_command(
+                b'add', key, value, flags, exptime, noreply=True))
+            for key, (flags, value) in items.items())
+        conn = yield self.pool.acquire()
+        try:
+            yield self._send_many(conn, cmds, noreply=True, mirror=False)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            logging.warning('backfill of the new servers failed: %s', e)
+        finally:
+            self.pool.release(conn)
+
+    @gen.coroutine
+    def _mirror(self, key, cmd, noreply):
+        """Sends a write to the old servers of a migration."""
+        old = self.migration
+        conn = yield old.pool.acquire()
+        try:
+            yield old._send_replicated(conn, key, cmd, noreply)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            logging.warning('write to the old servers failed: %s', e)
+        finally:
+            old.pool.release(conn)
+
+    @gen.coroutine
+    def _mirror_many(self, cmds, noreply):
+        """Sends writes of many keys to the old servers of a migration."""
+        old = self.migration
+        conn = yield old.pool.acquire()
+        try:
+            yield old._send_many(conn, cmds, noreply)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            logging.warning('write to the old servers failed: %s', e)
+        finally:
+            old.pool.release(conn)
+
+    def watch_servers(self, source, interval=30):
+        """Polls a source of the server list and applies its changes.
+
+        @param source: path of a file with a server per line (blank
+            lines and C{#} comments are skipped) or a callable returning
+            the list of servers or a Future of it.
+        @param interval: seconds between polls.
+        @return: the started C{PeriodicCallback}, C{stop} it to stop
+            watching.
+        """
+        @gen.coroutine
+        def poll():
+            try:
+                if callable(source):
+                    servers = yield gen.maybe_future(source())
+                else:
+                    with open(source) as f:
+                        servers = [
+                            line.strip() for line in f
+                            if line.strip() and
+                            not line.lstrip().startswith('#')
+                        ]
+            except Exception:
+                logging.exception('reading server list failed')
+                return
+            # an empty list is more likely a broken source than intent
+            if servers and list(servers) != self.pool.servers:
+                logging.info('memcached servers changed to %s', servers)
+                self.update_servers(servers)
+
+        callback = tornado.ioloop.PeriodicCallback(poll, interval * 1000)
+        callback.start()
+        return callback
+
+    def _value_type(self, value):
+        return protocol.encode_value(value)
 
     @acquire
     @gen.coroutine
-    def multi_get(self, conn, *keys):
+    def multi_get(self, conn, *keys, **kwargs):
         """Retrieves multiple keys from the memcache doing just one query.
 
         This method is recommended over regular L{get} as it lowers
@@ -210,11 +589,23 @@ class Client(object):
         for each round-trip of L{get} before sending the next one.
 
         @param keys: list keys for the item being fetched.
-        @return: list of values for the specified keys.
+        @param deadline: optional number of seconds to wait for the
+            servers. Keys of the servers which did not answer in time
+            are treated as misses and their connections are dropped.
+        @param lazy: return L{LazyValue}s decoded on first access of
+            their C{value}, for callers which use a few of the values.
+        @param raw: return the C{(bytes, flags)} as stored, without
+            decoding, for callers which pass them on.
+        @return: L{MultiGetResult} list of values for the specified keys,
+            its C{cut_off} attribute lists servers which missed the
+            deadline.
         @raises: ValidationException, ClientException,
             and socket errors
         """
-        result = yield self._multi_get(conn, *self._key_type(key_list=keys))
+        result = yield self._multi_get(
+            conn, *self._key_type(key_list=keys),
+            deadline=kwargs.get('deadline'), lazy=kwargs.get('lazy'),
+            raw=kwargs.get('raw'))
         raise gen.Return(result)
 
     @acquire
@@ -263,64 +654,400 @@ class Client(object):
             conn, b'set', self._key_type(key=key), value, exptime, noreply)
         raise gen.Return(resp)
 
+    @acquire
     @gen.coroutine
-    def _multi_get(self, conn, *keys):
+    def set_many(self, conn, items, exptime=0, noreply=False):
+        """Sets many keys with one pipelined write per server.
+
+        @param items: dict of keys to values, or list of the pairs.
+        @param exptime: expiration time of all the items.
+        @param noreply: do not wait for the servers to store them.
+        @return: bool, True if every item was stored.
+        """
+        if isinstance(items, dict):
+            items = list(items.items())
+        if not items:
+            raise gen.Return(True)
+        keys = self._key_type(key_list=[key for key, _ in items])
+        cmds = {}
+        for key, (_, value) in zip(keys, items):
+            if self.offload is not None:
+                value, flags = yield self.offload.encode(value)
+            else:
+                value, flags = self._value_type(value)
+            if self.hot_keys is not None:
+                self.hot_keys.discard(key)
+            cmds[key] = protocol.storage_command(
+                b'set', key, value, flags, exptime, noreply)
+
+        responses = yield self._send_many(conn, cmds, noreply)
+        raise gen.Return(all(
+            response == const.STORED for response in responses))
+
+    @acquire
+    @gen.coroutine
+    def delete_many(self, conn, keys, noreply=False):
+        """Deletes many keys with one pipelined write per server.
+
+        @param noreply: do not wait for the servers to delete them.
+        @return: bool, True if every key was deleted.
+        """
+        if not keys:
+            raise gen.Return(True)
+        keys = self._key_type(key_list=keys)
+        cmds = {}
+        for key in keys:
+            if self.hot_keys is not None:
+                self.hot_keys.discard(key)
+            cmds[key] = b'delete ' + key + (b' noreply' if noreply else b'')
+
+        responses = yield self._send_many(conn, cmds, noreply)
+        raise gen.Return(all(
+            response == const.DELETED for response in responses))
+
+    @gen.coroutine
+    def _send_many(self, conn, cmds, noreply=False, mirror=True, send=None):
+        """Sends write commands of many keys to every replica of the
+        keys, with one pipelined write per server.
+
+        During a migration the old servers get them as well, unless
+        C{mirror} is False.
+
+        @param cmds: dict of keys to their commands.
+        @param send: coroutine sending the keys to one server instead of
+            their commands, called with the server and its keys and
+            returning the list of replies.
+        @return: list of the replies, empty with C{noreply}.
+        """
+        mirrored = None
+        if mirror and self._migrating():
+            mirrored = self._mirror_many(cmds, noreply)
+        by_host = {}
+        for replica in range(conn.replicas):
+            for host, host_keys in conn.group_by_server(
+                    list(cmds), replica).items():
+                # a server has a single stream, so the keys it holds as
+                # different replicas go in the same write
+                by_host.setdefault(host, []).extend(host_keys)
+        if send is None:
+            def send(host, keys):
+                return self._send_pipelined(
+                    host, [cmds[key] for key in keys], noreply)
+        responses = yield [
+            send(host, host_keys) for host, host_keys in by_host.items()
+        ]
+        if mirrored is not None:
+            yield mirrored
+        raise gen.Return([
+            response
+            for host_responses in responses for response in host_responses
+        ])
+
+    @gen.coroutine
+    def _send_pipelined(self, host, cmds, noreply=False):
+        """Writes the commands at once and reads a line of reply each.
+
+        @return: list of the replies, empty with C{noreply}.
+        """
+        if noreply:
+            yield host.send_cmd(b'\r\n'.join(cmds), noreply=True)
+            raise gen.Return([])
+        stream = yield host.send_cmd(b'\r\n'.join(cmds), stream=True)
+        responses = []
+        try:
+            for _ in cmds:
+                line = yield stream.read_until(b'\r\n')
+                responses.append(line[:-2])
+        finally:
+            host.release_slot()
+        raise gen.Return(responses)
+
+    @gen.coroutine
+    def _multi_get(self, conn, *keys, **kwargs):
         # req  - get <key> [<key> ...]\r\n
         # resp - VALUE <key> <flags> <bytes> [<cas unique>]\r\n
         #        <data block>\r\n (if exists)
         #        [...]
         #        END\r\n
         if not keys:
-            raise gen.Return([])
+            raise gen.Return(MultiGetResult())
+
+        received, cut_off = yield self._get_received(
+            conn, keys, kwargs.get('deadline'))
+        if self.offload is not None and not (
+                kwargs.get('lazy') or kwargs.get('raw')):
+            values = yield self.offload.decode_many(
+                [received.get(k) for k in keys])
+            res = MultiGetResult(values)
+        else:
+            decode = protocol.value_decoder(
+                kwargs.get('lazy'), kwargs.get('raw'), self._decode_value)
+            res = MultiGetResult(
+                decode(*received[k]) if k in received else None
+                for k in keys
+            )
+        res.cut_off = cut_off
+        raise gen.Return(res)
+
+    @gen.coroutine
+    def _get_received(self, conn, keys, deadline=None):
+        """Looks the keys up in the hot keys, at the servers and at the
+        old servers of a migration.
 
-        [self._validate_key(key) for key in keys]
+        @return: C{(received, cut_off)}, dict of the found keys to their
+            C{(flags, value)} and the servers which missed the deadline.
+        """
         if len(set(keys)) != len(keys):
             raise ClientException('duplicate keys passed to multi_get')
+
+        received = {}
+        fetch_keys = keys
+        if self.hot_keys is not None:
+            for key in keys:
+                item = self.hot_keys.lookup(key)
+                if item is not None:
+                    received[key] = item
+            if received:
+                fetch_keys = [k for k in keys if k not in received]
+
+        if deadline is not None:
+            deadline += self.io_loop.time()
+        cut_off, missed = yield self._fetch_items(
+            conn, fetch_keys, received, deadline)
+
+        if missed and self._migrating():
+            items = yield self._read_migrated(missed, deadline)
+            if items:
+                received.update(items)
+                self.io_loop.spawn_callback(self._backfill, items)
+
+        if len(received) > len(keys):
+            raise ClientException('received too many responses')
+        raise gen.Return((received, cut_off))
+
+    @acquire
+    @gen.coroutine
+    def _found(self, conn, keys):
+        """Values of the keys which are stored, even when it is None.
+
+        @return: dict of the found keys, as passed, to their values.
+        """
+        if not keys:
+            raise gen.Return({})
+        memcached_keys = self._key_type(key_list=keys)
+        received, _ = yield self._get_received(conn, memcached_keys)
+        found = [
+            (key, mc_key) for key, mc_key in zip(keys, memcached_keys)
+            if mc_key in received
+        ]
+        if self.offload is not None:
+            values = yield self.offload.decode_many(
+                [received[mc_key] for _, mc_key in found])
+        else:
+            values = [
+                self._decode_value(*received[mc_key]) for _, mc_key in found
+            ]
+        raise gen.Return(dict(
+            (key, value) for (key, _), value in zip(found, values)))
+
+    @gen.coroutine
+    def _fetch_items(self, conn, fetch_keys, received, deadline=None):
+        """Reads the keys from their servers into C{received}.
+
+        @param deadline: C{IOLoop.time()} to give up at.
+        @return: C{(cut_off, missed)} the servers which missed the
+            deadline and the keys not found.
+        """
+        cut_off = []
+        dead = []
+        answered = False
+        # the misses and the keys of dead servers are asked for again
+        # at their next replica
+        for replica in range(conn.replicas):
+            if not fetch_keys:
+                break
+            hosts = conn.group_by_server(fetch_keys, replica)
+            hedged = (
+                self.hedge is not None and replica == 0 and
+                conn.replicas > 1)
+            fetches = []
+            for host, host_keys in hosts.items():
+                if hedged:
+                    fetch = self._hedged_fetch(host, host_keys, deadline)
+                else:
+                    fetch = self._fetch_values(host, host_keys)
+                    if deadline is not None:
+                        fetch = gen.with_timeout(
+                            deadline, fetch, quiet_exceptions=(
+                                StreamClosedError, ClientException))
+                fetches.append(fetch)
+
+            fetch_keys = []
+            for host, fetch in zip(hosts, fetches):
+                try:
+                    values = yield fetch
+                except gen.TimeoutError:
+                    # the reply is still on its way, so the connection can
+                    # not be reused; it is reopened on the next command
+                    host.close_socket()
+                    cut_off.append(str(host))
+                    continue
+                if values is None:
+                    dead.append(host)
+                    fetch_keys.extend(hosts[host])
+                    continue
+                answered = True
+                for key, item in values.items():
+                    if key in received:
+                        raise ClientException(
+                            'duplicate results from servers')
+                    received[key] = item
+                    if self.hot_keys is not None:
+                        self.hot_keys.offer(key, *item)
+                if len(values) < len(hosts[host]):
+                    fetch_keys.extend(
+                        k for k in hosts[host] if k not in values)
+
+        if dead and not answered and not cut_off:
+            raise ConnectionDeadError(
+                'no alive connetions {}'.format(
+                    ', '.join(h.disconect_reason for h in dead)
+                )
+            )
+        raise gen.Return((cut_off, fetch_keys))
+
+    @gen.coroutine
+    def _hedged_fetch(self, host, keys, deadline=None):
+        """Fetches the keys from their server and, when it does not
+        answer within the hedge delay, from their next replicas too.
+
+        The hedge goes over a connection of its own, the sockets of this
+        one may be busy with the other fetches of the same read. The
+        first full answer wins, the sockets of the other one are closed
+        as the rest of its reply can not be read anymore.
+
+        @param deadline: C{IOLoop.time()} to give up at, raises
+            C{gen.TimeoutError} then.
+        """
+        quiet = (StreamClosedError, ClientException)
+        primary = self._fetch_values(host, keys)
+        delay = self.hedge.delay()
+        hedge_at = None if delay is None else self.io_loop.time() + delay
+        if hedge_at is None or (deadline is not None and deadline <= hedge_at):
+            if deadline is not None:
+                primary = gen.with_timeout(
+                    deadline, primary, quiet_exceptions=quiet)
+            values = yield primary
+            raise gen.Return(values)
+        try:
+            values = yield gen.with_timeout(
+                hedge_at, primary, quiet_exceptions=quiet)
+            raise gen.Return(values)
+        except gen.TimeoutError:
+            pass
+
+        self.hedge.hedged += 1
+        conn = yield self.pool.acquire()
+        hedge = self._fetch_replicas(conn, keys)
+
+        def hedge_done(future):
+            # retrieves the StreamClosedError of a loser, so it is not
+            # logged
+            future.exception()
+            self.pool.release(conn)
+        hedge.add_done_callback(hedge_done)
+
+        waiter = gen.WaitIterator(primary, hedge)
+        values = None
+        try:
+            while not waiter.done():
+                following = waiter.next()
+                if deadline is not None:
+                    following = gen.with_timeout(
+                        deadline, following, quiet_exceptions=quiet)
+                try:
+                    values = yield following
+                except StreamClosedError:
+                    values = None
+                if values is not None:
+                    if waiter.current_index:
+                        self.hedge.won += 1
+                    break
+        finally:
+            if not primary.done():
+                host.close_socket()
+                primary.add_done_callback(lambda future: future.exception())
+            if not hedge.done():
+                conn.close_socket()
+        raise gen.Return(values)
+
+    @gen.coroutine
+    def _fetch_replicas(self, conn, keys):
+        """Reads the keys from the next replica of every key.
+
+        @return: dict of received C{(flags, value)} pairs or None if
+            one of the servers is dead.
+        """
+        groups = conn.group_by_server(keys, 1)
+        results = yield gen.multi(
+            [self._fetch_values(server, server_keys)
+             for server, server_keys in groups.items()],
+            quiet_exceptions=StreamClosedError)
+        if any(result is None for result in results):
+            raise gen.Return(None)
+        values = {}
+        for result in results:
+            values.update(result)
+        raise gen.Return(values)
+
+    @gen.coroutine
+    def _fetch_values(self, host, keys):
+        """Reads values of the keys stored at one server.
+
+        @return: dict of received C{(flags, value)} pairs or None if
+            the server is dead.
+        """
+        start = clock() if (
+            self.metrics is not None or self.hedge is not None) else None
         cmd = b'get ' + b' '.join(keys)
-        servers_resp = yield conn.send_cmd_all(cmd, stream=True)
+        try:
+            stream = yield host.send_cmd(cmd, stream=True)
+        except HostOverloadedError:
+            # shed reads are misses
+            raise gen.Return({})
+        except (ConnectionDeadError, socket.error) as msg:
+            host.mark_dead(msg)
+            raise gen.Return(None)
+
         received = {}
-        for stream in servers_resp:
+        try:
             line = yield stream.read_until(b'\n')
+            size = len(line)
             while line != b'END\r\n':
-                terms = line.split()
-
-                if len(terms) == 4 and terms[0] == b'VALUE':  # exists
-                    key = terms[1]
-                    flags = int(terms[2])
-                    length = int(terms[3])
-
-                    val = yield stream.read_bytes(length+2)
-                    val = val[:-2]
-
-                    if flags == 0:
-                        pass
-                    elif flags & const.FLAG_STRING:
-                        val = val.decode('utf-8')
-                    elif flags & const.FLAG_BOOLEAN:
-                        val = bool(int(val))
-                    elif flags & const.FLAG_INTEGER:
-                        val = int(val)
-                    elif flags & const.FLAG_JSON:
-                        val = json.loads(val.decode('utf-8'))
-                    elif flags & const.FLAG_PICKLE:
-                        val = pickle.loads(val)
-                    else:
-                        val = False
-
-                    if val is False and not flags & const.FLAG_BOOLEAN:
-                        raise ClientException('Unknown flag from server')
-                    if key in received:
-                        raise ClientException('duplicate results from servers')
+                key, flags, length = protocol.parse_value(line)
 
-                    received[key] = val
-                else:
-                    raise ClientException('get{} failed'.format(cmd), line)
-                line = yield stream.read_until(b'\n')
+                val = yield stream.read_bytes(length+2)
+                size += length + 2
 
-        if len(received) > len(keys):
-            raise ClientException('received too many responses')
-        res = [received.get(k, None) for k in keys]
-        raise gen.Return(res)
+                if key in received:
+                    raise ClientException('duplicate results from servers')
+
+                received[key] = (flags, val[:-2])
+                line = yield stream.read_until(b'\n')
+                size += len(line)
+        finally:
+            host.release_slot()
+        if self.hedge is not None:
+            self.hedge.observe(clock() - start)
+        if self.metrics is not None:
+            self.metrics.command(b'get', str(host), clock() - start)
+            self.metrics.bytes_received(str(host), size)
+            self.metrics.lookups(
+                str(host), len(received), len(keys) - len(received))
+        raise gen.Return(received)
+
+    def _decode_value(self, flags, val):
+        return protocol.decode_value(flags, val)
 
     @acquire
     @gen.coroutine
@@ -418,13 +1145,12 @@ class Client(object):
             reply.
 
         """
-        server, key = conn._get_server(key)
-
         key = self._key_type(key=key)
-        assert self._validate_key(key)
+        if self.hot_keys is not None:
+            self.hot_keys.discard(key)
 
         command = b'delete ' + key + (b' noreply' if noreply else b'')
-        response = yield server.send_cmd(command, noreply)
+        response = yield self._send_replicated(conn, key, command, noreply)
 
         if not noreply and response not in (const.DELETED, const.NOT_FOUND):
             raise ClientException('Memcached delete failed', response)
@@ -445,13 +1171,15 @@ class Client(object):
 
         Returns
         """
-        server, key = conn._get_server(key)
+        key = self._key_type(key=key)
+        if self.hot_keys is not None:
+            self.hot_keys.discard(key)
 
         value = str(value).encode('ascii')
 
         command = b'incr ' + key + b' ' + value + \
             (b' noreply' if noreply else b'')
-        response = yield server.send_cmd(command, noreply)
+        response = yield self._send_replicated(conn, key, command, noreply)
 
         if response == const.NOT_FOUND:
             raise ClientException('Key {0} not found'.format(key))
@@ -474,13 +1202,15 @@ class Client(object):
 
         Returns
         """
-        server, key = conn._get_server(key)
+        key = self._key_type(key=key)
+        if self.hot_keys is not None:
+            self.hot_keys.discard(key)
 
         value = str(value).encode('ascii')
 
         command = b'decr ' + key + b' ' + value + \
             (b' noreply' if noreply else b'')
-        response = yield server.send_cmd(command, noreply)
+        response = yield self._send_replicated(conn, key, command, noreply)
 
         if response == const.NOT_FOUND:
             raise ClientException('Key {0} not found'.format(key))
@@ -489,51 +1219,65 @@ class Client(object):
     @gen.coroutine
     def _storage_command(self, conn, command, key, value,
                          exptime=0, noreply=False):
-        # req  - set <key> <flags> <exptime> <bytes> [noreply]\r\n
-        #        <data block>\r\n
-        # resp - STORED\r\n (or others)
-
         # typically, if val is > 1024**2 bytes server returns:
         #   SERVER_ERROR object too large for cache\r\n
         # however custom-compiled memcached can have different limit
         # so, we'll let the server decide what's too much
-        server, key = conn._get_server(key)
+        if self.offload is not None:
+            value, flags = yield self.offload.encode(value)
+        else:
+            value, flags = self._value_type(value)
+        if self.hot_keys is not None:
+            self.hot_keys.discard(key)
 
-        assert self._validate_key(key)
+        cmd = protocol.storage_command(
+            command, key, value, flags, exptime, noreply)
+        resp = yield self._send_replicated(conn, key, cmd, noreply)
+        raise gen.Return(protocol.storage_result(cmd, resp, noreply))
 
-        if not isinstance(exptime, int) or isinstance(exptime, bool):
-            raise ValidationException('exptime not int', exptime)
-        elif exptime < 0:
-            raise ValidationException('exptime negative', exptime)
+    @gen.coroutine
+    def _send_replicated(self, conn, key, cmd, noreply=False, mirror=True):
+        """Sends a write command to every replica of the key at once.
 
-        value, flags = self._value_type(value)
+        During a migration the old servers get it as well, unless
+        C{mirror} is False.
 
-        args_arr = [flags, exptime, len(value)]
-        if noreply:
-            args_arr.append('noreply')
-        args = [str(a).encode('utf-8') for a in args_arr]
-        _cmd = b' '.join([command, key] + args) + b'\r\n'
-        cmd = _cmd + value
-        server, key = conn._get_server(key)
-
-        resp = yield server.send_cmd(cmd, noreply=noreply)
+        @return: the response of the first replica which answered,
+            in the order of the replicas.
+        @raises: ConnectionDeadError if none of them did.
+        """
+        mirrored = None
+        if mirror and self._migrating():
+            mirrored = self._mirror(key, cmd, noreply)
+        servers = conn.get_replicas(key)
+        if len(servers) == 1:
+            response = yield servers[0].send_cmd(cmd, noreply=noreply)
+            if mirrored is not None:
+                yield mirrored
+            raise gen.Return(response)
+
+        responses = yield [
+            self._send_quietly(server, cmd, noreply) for server in servers
+        ]
+        if mirrored is not None:
+            yield mirrored
+        for ok, response in responses:
+            if ok:
+                raise gen.Return(response)
+        raise ConnectionDeadError(
+            'no alive connetions {}'.format(
+                ', '.join(s.disconect_reason for s in servers)
+            )
+        )
 
-        if not noreply and resp not in (const.STORED, const.NOT_STORED):
-            raise ClientException('stats "{}" failed'.format(cmd), resp)
-        raise gen.Return(resp == const.STORED or noreply)
+    @gen.coroutine
+    def _send_quietly(self, server, cmd, noreply):
+        try:
+            response = yield server.send_cmd(cmd, noreply=noreply)
+        except (ConnectionDeadError, StreamClosedError, socket.error) as msg:
+            server.mark_dead(msg)
+            raise gen.Return((False, None))
+        raise gen.Return((True, response))
 
     def _validate_key(self, key):
-        if not isinstance(key, bytes):  # avoid bugs subtle and otherwise
-            raise ValidationException('key must be bytes', key)
-
-        m = self._valid_key_re.match(key)
-        if m:
-            # in python re, $ matches either end of line or right before
-            # \n at end of line. We can't allow latter case, so
-            # making sure length matches is simplest way to detect
-            if len(m.group(0)) != len(key):
-                raise ValidationException('trailing newline', key)
-        else:
-            raise ValidationException('invalid key', key)
-
-        return key
+        return protocol.validate_key(key)
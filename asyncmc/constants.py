@@ -13,3 +13,5 @@ FLAG_STRING = 1 << 4
 SERVER_RETRIES = 5
 SOCKET_TIMEOUT = 3
 DEAD_RETRY = 3
+# longer exptimes are taken for unix times by memcached
+MAX_RELATIVE_EXPTIME = 60 * 60 * 24 * 30
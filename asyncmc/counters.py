@@ -0,0 +1,191 @@
+"""Client-side aggregation of counters.
+
+L{CounterAggregator} sums up the increments of every counter in memory
+and sends them in one pipelined batch of C{incr}/C{decr} commands per
+server every C{interval} seconds, or sooner when C{max_keys} counters
+are pending::
+
+    counters = mc.counters(interval=1.0)
+    counters.incr(b'page:views')
+    counters.incr(b'page:views', 10)
+    ...
+    yield mc.flush()  # the last increments are sent
+    mc.close()
+
+Thousands of increments of a hot counter cost one command per interval,
+at the price of the counter lagging up to C{interval} seconds behind.
+Missing counters are created with C{add} and C{initial} plus the
+delta, so they read as integers through L{Client.get}.
+"""
+import logging
+import socket
+
+import tornado.ioloop
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from . import constants as const
+from . import protocol
+from .exceptions import ClientException, HostOverloadedError
+
+
+class CounterAggregator(object):
+    """Sums up counter increments and flushes them in batches.
+
+    @param client: L{Client} the counters are flushed through.
+    @param interval: seconds between flushes.
+    @param max_keys: flush early once this many counters are pending.
+    @param initial: value a missing counter starts from.
+    @param exptime: exptime of the counters created by a flush.
+    """
+
+    def __init__(self, client, interval=1.0, max_keys=1000, initial=0,
+                 exptime=0):
+        self.client = client
+        self.interval = interval
+        self.max_keys = max_keys
+        self.initial = initial
+        self.exptime = exptime
+        self.pending = {}
+        self._callback = None
+
+    def start(self):
+        if self._callback is None:
+            self._callback = tornado.ioloop.PeriodicCallback(
+                self.flush, self.interval * 1000)
+            self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    @gen.coroutine
+    def close(self):
+        """Stops the timer and flushes the pending counters."""
+        self.stop()
+        yield self.flush()
+
+    def incr(self, key, value=1):
+        """Adds C{value} to the counter at the next flush."""
+        key = self.client._key_type(key=key)
+        self.pending[key] = self.pending.get(key, 0) + value
+        if len(self.pending) >= self.max_keys:
+            tornado.ioloop.IOLoop.current().spawn_callback(self.flush)
+
+    def decr(self, key, value=1):
+        """Subtracts C{value} from the counter at the next flush."""
+        self.incr(key, -value)
+
+    @gen.coroutine
+    def flush(self):
+        """Sends the pending increments, one batch per server."""
+        pending, self.pending = self.pending, {}
+        pending = dict((k, v) for k, v in pending.items() if v)
+        if not pending:
+            return
+        if self.client.hot_keys is not None:
+            for key in pending:
+                self.client.hot_keys.discard(key)
+        conn = yield self.client.pool.acquire()
+        try:
+            def send(host, keys):
+                # only the first replica keeps what could not be sent
+                return self._flush_host(
+                    host, [(key, pending[key]) for key in keys],
+                    requeue=[
+                        key for key in keys
+                        if conn._get_server(key)[0] is host])
+
+            # the old servers of a migration get the plain changes
+            yield self.client._send_many(
+                conn, dict((key, self._change(key, value))
+                           for key, value in pending.items()),
+                send=send)
+        finally:
+            self.client.pool.release(conn)
+
+    @gen.coroutine
+    def _flush_host(self, host, items, requeue=()):
+        """Sends the changes of the counters stored at one server.
+
+        @param requeue: keys put back to the pending ones when nothing
+            could be sent.
+        @return: empty list of replies for L{Client._send_many}.
+        """
+        sent = False
+        try:
+            stream = yield host.send_cmd(self._changes(items), stream=True)
+            sent = True
+            missing = yield self._read_changes(stream, items)
+            if missing:
+                conflicts = yield self._add_missing(host, missing)
+                # created by someone else in the meantime
+                if conflicts:
+                    stream = yield host.send_cmd(
+                        self._changes(conflicts), stream=True)
+                    yield self._read_changes(stream, conflicts)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            if not isinstance(e, HostOverloadedError):
+                host.mark_dead(e)
+            if not sent:
+                # nothing was sent, the increments wait for the next flush
+                for key, value in items:
+                    if key in requeue:
+                        self.pending[key] = self.pending.get(key, 0) + value
+            else:
+                # the server may have applied a part of them already, so
+                # they are dropped rather than counted twice
+                logging.warning(
+                    'flushing %d counters to %s failed: %s',
+                    len(items), host, e)
+        finally:
+            host.release_slot()
+        raise gen.Return([])
+
+    def _change(self, key, value):
+        """incr/decr command of a counter."""
+        return ((b'incr ' if value > 0 else b'decr ') + key + b' ' +
+                str(abs(value)).encode('ascii'))
+
+    def _changes(self, items):
+        """Pipelined incr/decr commands of the items."""
+        return b'\r\n'.join(
+            self._change(key, value) for key, value in items)
+
+    @gen.coroutine
+    def _read_changes(self, stream, items):
+        """Reads the replies to L{_changes}.
+
+        @return: the items whose counters do not exist.
+        """
+        missing = []
+        for key, value in items:
+            line = yield stream.read_until(b'\r\n')
+            if line[:-2] == const.NOT_FOUND:
+                missing.append((key, value))
+            elif not line[:-2].isdigit():
+                logging.warning('counter %r not changed: %r', key, line)
+        raise gen.Return(missing)
+
+    @gen.coroutine
+    def _add_missing(self, host, items):
+        """Pipelines add of the missing counters.
+
+        @return: the items which were not stored.
+        """
+        cmds = []
+        for key, value in items:
+            data, flags = protocol.encode_value(max(self.initial + value, 0))
+            cmds.append(protocol.storage_command(
+                b'add', key, data, flags, self.exptime))
+        stream = yield host.send_cmd(b'\r\n'.join(cmds), stream=True)
+        conflicts = []
+        try:
+            for item in items:
+                line = yield stream.read_until(b'\r\n')
+                if line[:-2] != const.STORED:
+                    conflicts.append(item)
+        finally:
+            host.release_slot()
+        raise gen.Return(conflicts)
@@ -0,0 +1,120 @@
+"""Placement of the keys at the servers.
+
+L{Modulo} is the cmemcache compatible C{hash % len(servers)}, where
+a server with the weight of 3 takes three buckets like in
+python-memcached. Adding, removing or reweighting a server moves
+almost every key.
+
+L{Ketama} is the consistent hashing of libmemcached: every server gets
+points on a ring in proportion to its weight and a key is stored at the
+server of the first point after the hash of the key. Changing a server
+or its weight only moves the keys of its share of the ring.
+"""
+import bisect
+import hashlib
+import struct
+
+from .exceptions import ValidationException
+from .protocol import encode_key, server_hash
+
+# points of a server with the average weight, libmemcached uses 160
+KETAMA_POINTS = 160
+
+
+class Modulo(object):
+    """cmemcache compatible placement."""
+
+    def __init__(self, weights):
+        self.buckets = []
+        for index, weight in enumerate(weights):
+            self.buckets.extend([index] * weight)
+        self.servers = len(weights)
+
+    def index(self, key, replica=0, serverhash=None):
+        """Index of the server storing the replica of the key."""
+        if serverhash is None:
+            serverhash = server_hash(key)
+        if replica and len(self.buckets) != self.servers:
+            # the next buckets may belong to the same server
+            return self._distinct(serverhash)[replica]
+        return self.buckets[(serverhash + replica) % len(self.buckets)]
+
+    def _distinct(self, serverhash):
+        found = []
+        for offset in range(len(self.buckets)):
+            index = self.buckets[(serverhash + offset) % len(self.buckets)]
+            if index not in found:
+                found.append(index)
+        return found
+
+
+class Ketama(object):
+    """libmemcached compatible consistent hashing.
+
+    @param names: C{"host:port"} of the servers, the port is left out
+        of the points like libmemcached does for the default port.
+    @param weights: weights of the servers.
+    """
+
+    def __init__(self, names, weights):
+        total = float(sum(weights)) or 1.0
+        ring = []
+        for index, (name, weight) in enumerate(zip(names, weights)):
+            if name.endswith(':11211'):
+                name = name[:-len(':11211')]
+            count = int(weight / total * KETAMA_POINTS / 4 * len(names) +
+                        1e-10)
+            for point in range(count):
+                digest = hashlib.md5(
+                    '{}-{}'.format(name, point).encode('utf-8')).digest()
+                for value in struct.unpack('<4I', digest):
+                    ring.append((value, index))
+        ring.sort()
+        self.points = [value for value, _ in ring]
+        self.owners = [index for _, index in ring]
+        self.servers = len(names)
+
+    def index(self, key, replica=0, serverhash=None):
+        """Index of the server storing the replica of the key."""
+        if serverhash is None:
+            serverhash = struct.unpack(
+                '<I', hashlib.md5(encode_key(key)).digest()[:4])[0]
+        position = bisect.bisect_left(self.points, serverhash)
+        if not replica:
+            return self.owners[position % len(self.owners)]
+        # replicas are the next distinct servers along the ring
+        found = []
+        for offset in range(len(self.owners)):
+            index = self.owners[(position + offset) % len(self.owners)]
+            if index not in found:
+                found.append(index)
+                if len(found) > replica:
+                    break
+        return found[replica]
+
+
+def parse_weight(server):
+    """Splits C{"host:port:weight"} or C{(server, weight)} into
+    the server and its weight, which defaults to 1."""
+    if isinstance(server, (tuple, list)):
+        server, weight = server
+    else:
+        weight = 1
+        head, sep, tail = server.rpartition(':')
+        # host:port:weight and [ipv6]:port:weight, but not host:port
+        if (not server.startswith('unix:') and sep and tail.isdigit() and
+                ':' in head.rsplit(']', 1)[-1]):
+            server, weight = head, tail
+    weight = int(weight)
+    if weight < 1:
+        raise ValidationException('server weight must be positive', server)
+    return server, weight
+
+
+def make_distribution(name, names, weights):
+    """Distribution of the servers, C{"modulo"} or C{"ketama"}."""
+    if name == 'modulo':
+        return Modulo(weights)
+    elif name == 'ketama':
+        return Ketama(names, weights)
+    raise ValidationException('unknown distribution', name)
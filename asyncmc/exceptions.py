@@ -14,5 +14,10 @@ class ConnectionDeadError(ClientException):
     """Raised when can not connect to the server"""
 
 
+class HostOverloadedError(ClientException):
+    """Raised when a server has too many requests in flight, the request
+    was not sent."""
+
+
 class ValidationException(ClientException):
     """Raised when an invalid parameter is passed to a ``Client`` function."""
@@ -0,0 +1,55 @@
+"""Hedged reads.
+
+A read which got no answer from the server within the hedge delay is
+sent to the next replica of its keys as well and the first answer
+wins, so a server stalled by a pause or a noisy neighbour does not set
+the tail latency::
+
+    mc = asyncmc.Client(servers=[...], replicas=2, hedge_percentile=95)
+
+The delay is either fixed (C{hedge_after}) or follows a percentile of
+the latencies of the recent reads (C{hedge_percentile}), then about
+C{100 - percentile} percent of the reads are hedged. Hedging needs
+C{replicas} of 2 or more, otherwise there is no second server holding
+the keys.
+"""
+from .metrics import Histogram
+
+
+class HedgePolicy(object):
+    """Decides how long a read waits before it is hedged.
+
+    @param delay: seconds to wait, also used while there are not enough
+        latency samples for the percentile.
+    @param percentile: hedge the reads slower than this percentile of
+        the recent read latencies.
+    @param window: number of samples the percentile is computed from,
+        the histogram starts over after that.
+    @param min_delay: the percentile delay never drops below this.
+    """
+
+    def __init__(self, delay=None, percentile=None, window=1000,
+                 min_delay=0.001):
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.window = window
+        self.min_delay = min_delay
+        self.current = Histogram()
+        self.previous = None
+        self.hedged = 0
+        self.won = 0
+
+    def observe(self, seconds):
+        """Adds latency of a read."""
+        if self.percentile is None:
+            return
+        self.current.add(seconds)
+        if self.current.count >= self.window:
+            self.previous, self.current = self.current, Histogram()
+
+    def delay(self):
+        """Seconds to wait for the server, None means no hedging."""
+        if self.percentile is not None and self.previous is not None:
+            return max(
+                self.previous.percentile(self.percentile), self.min_delay)
+        return self.fixed_delay
@@ -6,14 +6,83 @@ import tornado.iostream
 from tornado import gen
 from . import constants
 from . import exceptions
+from .metrics import clock
+from .protocol import parse_server, format_server
+
+
+class SocketOptions(object):
+    """Options of the sockets to a server.
+
+    @param nodelay: disables Nagle's algorithm, so small commands are
+        not held back waiting for the previous reply.
+    @param keepalive_idle: seconds of idle connection before keepalive
+        probes are sent, None leaves keepalive off.
+    @param keepalive_interval: seconds between keepalive probes.
+    @param send_buffer: C{SO_SNDBUF} size in bytes.
+    @param recv_buffer: C{SO_RCVBUF} size in bytes.
+    @param max_buffer_size: biggest reply the stream buffers, it has to
+        fit the largest value.
+    @param read_chunk_size: bytes read from the socket at once.
+    """
+
+    def __init__(self, nodelay=True, keepalive_idle=None,
+                 keepalive_interval=None, send_buffer=None,
+                 recv_buffer=None, max_buffer_size=None,
+                 read_chunk_size=None):
+        self.nodelay = nodelay
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.send_buffer = send_buffer
+        self.recv_buffer = recv_buffer
+        self.max_buffer_size = max_buffer_size
+        self.read_chunk_size = read_chunk_size
+
+    def apply(self, sock):
+        """Sets the options on a socket, before it is connected so the
+        buffer sizes count for the TCP window."""
+        if self.send_buffer is not None:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        if self.recv_buffer is not None:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+        if sock.family not in (socket.AF_INET, socket.AF_INET6):
+            return
+        if self.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive_idle is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # TCP_KEEPALIVE is the name of TCP_KEEPIDLE at macOS
+            idle = getattr(socket, 'TCP_KEEPIDLE',
+                           getattr(socket, 'TCP_KEEPALIVE', None))
+            if idle is not None:
+                sock.setsockopt(
+                    socket.IPPROTO_TCP, idle, int(self.keepalive_idle))
+            if (self.keepalive_interval is not None and
+                    hasattr(socket, 'TCP_KEEPINTVL')):
+                sock.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                    int(self.keepalive_interval))
+
+    def stream_kwargs(self):
+        """Keyword arguments of C{IOStream}."""
+        kwargs = {}
+        if self.max_buffer_size is not None:
+            kwargs['max_buffer_size'] = self.max_buffer_size
+        if self.read_chunk_size is not None:
+            kwargs['read_chunk_size'] = self.read_chunk_size
+        return kwargs
 
 
 class Host(object):
 
-    def __init__(self, host, conn, debug=0):
+    def __init__(self, host, conn, debug=0, metrics=None,
+                 socket_options=None, admission=None):
         self.debug = debug
-        self.host = host
-        self.port = 11211
+        self.metrics = metrics
+        self.socket_options = socket_options or SocketOptions()
+        self.connected = False
+        self.host, self.port = parse_server(host)
         self.flush_on_reconnect = 1
         self.stream = None
 
@@ -21,14 +90,22 @@ class Host(object):
         self.dead_retry = constants.DEAD_RETRY
         self.deaduntil = 0
 
-        if ":" in self.host:
-            parts = self.host.rsplit(":", 1)
-            self.host = parts[0]
-            self.port = int(parts[1])
-        if self.host.startswith('[') and self.host.endswith(']'):
-            self.host = self.host[1:-1]
-
         self.sock = None
+        # slot of the admission control held until the connection is
+        # released to the pool
+        self.limit = None
+        if admission is not None:
+            self.limit = admission.limit(str(self))
+        self.admitted = False
+
+    def __str__(self):
+        return format_server(self.host, self.port)
+
+    def _addresses(self):
+        if self.port is None:
+            return [(socket.AF_UNIX, socket.SOCK_STREAM, 0, '', self.host)]
+        return socket.getaddrinfo(
+            self.host, self.port, socket.AF_UNSPEC, socket.SOCK_STREAM)
 
     def _ensure_connection(self):
         if self.sock:
@@ -37,14 +114,13 @@ class Host(object):
         remaining = constants.SOCKET_TIMEOUT
         last_error = None
 
-        for family, socktype, proto, _, addr in socket.getaddrinfo(
-            self.host, self.port, socket.AF_UNSPEC, socket.SOCK_STREAM
-        ):
+        for family, socktype, proto, _, addr in self._addresses():
             if not remaining:
                 self.mark_dead('connect: no time left')
                 return None
             try:
                 s = socket.socket(family, socktype, proto)
+                self.socket_options.apply(s)
                 s.settimeout(remaining)
                 start = time.time()
                 s.connect(addr)
@@ -64,8 +140,12 @@ class Host(object):
             self.mark_dead('connect: {}'.format(last_error))
             return None
         self.sock = s
-        self.stream = tornado.iostream.IOStream(s)
+        self.stream = tornado.iostream.IOStream(
+            s, **self.socket_options.stream_kwargs())
         self.stream.debug = True
+        if self.metrics is not None:
+            self.metrics.connect(str(self), reconnect=self.connected)
+        self.connected = True
         return self
 
     def _check_dead(self):
@@ -75,31 +155,51 @@ class Host(object):
         return 0
 
     def mark_dead(self, reason):
+        if self.metrics is not None and not self._check_dead():
+            self.metrics.host_dead(str(self), str(reason))
         self.disconect_reason = str(reason)
         self.deaduntil = time.time() + self.dead_retry
         if self.flush_on_reconnect:
             self.flush_on_next_connect = 1
         self.close_socket()
 
+    def release_slot(self):
+        if self.admitted:
+            self.admitted = False
+            self.limit.release()
+
     def close_socket(self):
         if self.sock:
             self.stream.close()
             self.sock.close()
             self.sock = None
+            self.stream = None
 
     @gen.coroutine
     def send_cmd(self, cmd, noreply=False, stream=False):
+        """Sends the command and reads a line of reply.
+
+        With C{stream} the stream is returned right after the write
+        instead and the caller reads the reply, then calls
+        L{release_slot}.
+        """
+        if self.limit is not None and not self.admitted:
+            yield self.limit.acquire()
+            self.admitted = True
+        try:
+            response = yield self._send_cmd(cmd, noreply, stream)
+        except Exception:
+            self.release_slot()
+            raise
+        if not stream:
+            self.release_slot()
+        raise gen.Return(response)
+
+    @gen.coroutine
+    def _send_cmd(self, cmd, noreply, stream):
+        start = clock() if self.metrics is not None else None
         self._ensure_connection()
-        cmd = cmd + "\r\n".encode()
-        if stream:
-            yield self.stream.write(cmd)
-            raise gen.Return(self.stream)
-        elif self.stream:
-            yield self.stream.write(cmd)
-        if not noreply and self.stream:
-            response = yield self.stream.read_until(b'\r\n')
-            raise gen.Return(response[:-2])
-        if hasattr(self, 'disconect_reason'):
+        if self.stream is None:
             raise exceptions.ConnectionDeadError(
                 'socket host "{}" port "{}" disconected because "{}"'.format(
                     self.host,
@@ -107,3 +207,18 @@ class Host(object):
                     self.disconect_reason
                 )
             )
+        cmd = cmd + "\r\n".encode()
+        yield self.stream.write(cmd)
+        if start is not None:
+            self.metrics.bytes_sent(str(self), len(cmd))
+        if stream:
+            raise gen.Return(self.stream)
+        response = None
+        if not noreply:
+            response = yield self.stream.read_until(b'\r\n')
+        if start is not None:
+            self.metrics.command(
+                cmd.split(b' ', 1)[0].rstrip(), str(self), clock() - start)
+            if response is not None:
+                self.metrics.bytes_received(str(self), len(response))
+        raise gen.Return(response[:-2] if response is not None else None)
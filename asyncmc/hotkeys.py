@@ -0,0 +1,152 @@
+"""Client-side hot key detection.
+
+L{HotKeys} counts every key read through L{Client.get} and
+L{Client.multi_get} with a count-min sketch and keeps the top of the
+hottest keys::
+
+    hot_keys = asyncmc.HotKeys(top=16, threshold=1000, ttl=1)
+    mc = asyncmc.Client(servers=['localhost:11211'], hot_keys=hot_keys)
+    ...
+    print(hot_keys.hottest())
+
+When C{threshold} is set the keys read more often than that within a
+counting window are promoted to a small in-process cache for C{ttl}
+seconds, so they stop hitting a single memcached server. Cached items
+are kept encoded and are decoded on every hit, writes and deletes made
+through the same client drop them from the cache.
+"""
+from collections import OrderedDict
+
+from .metrics import clock
+
+
+class CountMinSketch(object):
+    """Frequency estimator which never undercounts.
+
+    Estimates exceed the real count by at most C{2 * total / width}
+    with the probability C{1 - 0.5 ** depth}.
+    """
+
+    def __init__(self, width=1024, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key):
+        first = hash(key)
+        second = hash((key, self.width)) | 1
+        return [
+            (first + row * second) % self.width for row in range(self.depth)
+        ]
+
+    def add(self, key, count=1):
+        """Counts the key and returns its new estimate."""
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, key):
+        return min(
+            row[index] for row, index in zip(self.rows, self._indexes(key))
+        )
+
+    def decay(self):
+        """Halves all the counters."""
+        for row in self.rows:
+            for index, count in enumerate(row):
+                if count:
+                    row[index] = count >> 1
+
+
+class HotKeys(object):
+    """Tracks the hottest keys and optionally caches them locally.
+
+    @param top: how many hottest keys to report.
+    @param threshold: reads per window after which a key is promoted
+        to the local cache, None disables promotion.
+    @param ttl: seconds a promoted value is served from the local cache.
+    @param window: seconds after which all the counts are halved so
+        keys which cooled down leave the top.
+    @param max_cached: maximal number of locally cached keys.
+    """
+
+    def __init__(self, top=16, threshold=None, ttl=1.0, window=60.0,
+                 max_cached=1024, width=1024, depth=4):
+        self.top = top
+        self.threshold = threshold
+        self.ttl = ttl
+        self.window = window
+        self.max_cached = max_cached
+        self.sketch = CountMinSketch(width, depth)
+        self._top = {}
+        self._floor = 0
+        self._cache = OrderedDict()
+        self._decay_at = clock() + window
+
+    def _count(self, key):
+        now = clock()
+        if now >= self._decay_at:
+            self._decay_at = now + self.window
+            self.sketch.decay()
+            for hot_key in self._top:
+                self._top[hot_key] >>= 1
+            self._floor >>= 1
+
+        estimate = self.sketch.add(key)
+        if key in self._top:
+            self._top[key] = estimate
+        elif len(self._top) < self.top:
+            self._top[key] = estimate
+            self._floor = min(self._top.values())
+        elif estimate > self._floor:
+            coldest = min(self._top, key=self._top.get)
+            del self._top[coldest]
+            self._top[key] = estimate
+            self._floor = min(self._top.values())
+        return estimate
+
+    def lookup(self, key):
+        """Counts a read of the key.
+
+        @return: locally cached C{(flags, value)} of the key or None.
+        """
+        self._count(key)
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        expires, flags, value = item
+        if expires < clock():
+            del self._cache[key]
+            return None
+        return flags, value
+
+    def is_hot(self, key):
+        """Whether the key is read often enough to be cached."""
+        return (
+            self.threshold is not None and
+            self._top.get(key, 0) >= self.threshold)
+
+    def offer(self, key, flags, value):
+        """Caches a value read from the server if the key is hot."""
+        if key in self._cache or not self.is_hot(key):
+            return
+        while len(self._cache) >= self.max_cached:
+            self._cache.popitem(last=False)
+        self._cache[key] = (clock() + self.ttl, flags, value)
+
+    def discard(self, key):
+        """Drops a locally cached value after the key was changed."""
+        self._cache.pop(key, None)
+
+    def hottest(self, count=None):
+        """Hottest keys with their estimated reads, hottest first."""
+        keys = sorted(self._top.items(), key=lambda i: i[1], reverse=True)
+        return keys[:count] if count is not None else keys
+
+    def cached(self):
+        """Keys served from the local cache at the moment."""
+        now = clock()
+        return [k for k, item in self._cache.items() if item[0] >= now]
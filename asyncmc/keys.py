@@ -0,0 +1,75 @@
+"""Turning the keys of the callers into memcached keys.
+
+L{KeyPipeline} adds a namespace prefix to every key and, when asked to,
+replaces the keys memcached can not store (longer than 250 bytes, with
+spaces, control or non-ascii characters) by their digest, so natural
+keys like URLs can be passed as they are::
+
+    mc = asyncmc.Client(servers=['localhost:11211'],
+                        key_prefix=b'app:', hash_keys=True)
+    yield mc.set(u'https://example.com/some page', b'...')
+
+The digest keeps the prefix, C{app:} above, so the keys of a namespace
+are still recognisable in the server.
+"""
+import hashlib
+import re
+
+from .exceptions import ValidationException
+from .protocol import encode_key, validate_key
+
+try:
+    _digest = hashlib.blake2b
+except AttributeError:  # python < 3.6
+    def _digest(key, digest_size):
+        return hashlib.sha1(key)
+
+# protocol.valid_key_re without the newline $ lets through
+valid_key_re = re.compile(br'[\x21-\x7e]{1,250}\Z')
+# and the same for a whole batch of keys joined by spaces
+valid_batch_re = re.compile(
+    br'[\x21-\x7e]{1,250}(?: [\x21-\x7e]{1,250})*\Z')
+
+
+class KeyPipeline(object):
+    """Encodes, prefixes and validates keys.
+
+    @param prefix: bytes or string put in front of every key.
+    @param hash_keys: replace invalid keys by C{prefix + digest}
+        instead of raising L{ValidationException}.
+    @param digest_size: bytes of the digest, it is sent hex encoded.
+    """
+
+    def __init__(self, prefix=None, hash_keys=False, digest_size=20):
+        self.prefix = encode_key(prefix) if prefix else b''
+        self.hash_keys = hash_keys
+        self.digest_size = digest_size
+        if self.prefix and not valid_key_re.match(self.prefix):
+            raise ValidationException('invalid key prefix', self.prefix)
+
+    def digest(self, key):
+        """Valid key standing for the key which is not."""
+        return self.prefix + _digest(
+            key, digest_size=self.digest_size).hexdigest().encode('ascii')
+
+    def __call__(self, key):
+        key = encode_key(key)
+        full = self.prefix + key
+        if self.hash_keys and not valid_key_re.match(full):
+            return self.digest(key)
+        return validate_key(full)
+
+    def batch(self, keys):
+        """Memcached keys of the list of keys.
+
+        The whole batch is validated with a single regex match, the keys
+        are checked one by one only when it fails.
+        """
+        prefix = self.prefix
+        out = [prefix + encode_key(key) for key in keys]
+        joined = b' '.join(out)
+        # the regex can not tell a space in a key from a separator
+        if (valid_batch_re.match(joined) and
+                joined.count(b' ') == len(out) - 1):
+            return out
+        return [self(key) for key in keys]
@@ -0,0 +1,295 @@
+"""Load generator for sizing memcached pools and clusters.
+
+Runs concurrent coroutines doing gets and sets through L{Client} and
+prints throughput, latency percentiles and hit ratio every interval::
+
+    $ python -m asyncmc.loadgen --servers mc1:11211,mc2:11211 \\
+        --keys 100000 --distribution zipf --read-ratio 0.9 \\
+        --value-size 100-10000 --concurrency 64 --duration 60
+
+Without C{--servers} the load goes to an in-process L{StubServer}.
+
+Captured traffic is replayed with C{--trace}. Every line of the file is
+C{get <key>}, C{set <key> [<size>]}, C{delete <key>} or a bare key for
+a get; the trace is looped until the duration is over.
+
+Misses of the gets are filled with a set like a cache-aside application
+does, C{--no-fill} turns it off.
+"""
+import argparse
+import bisect
+import itertools
+import json
+import math
+import random
+import socket
+import sys
+
+import tornado.ioloop
+from tornado import gen
+
+from .client import Client
+from .exceptions import ClientException
+from .metrics import clock
+from .stubserver import StubServer
+
+
+class UniformKeys(object):
+    """Every key of the key space is equally likely."""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __call__(self):
+        return random.randrange(self.count)
+
+
+class ZipfKeys(object):
+    """Key C{n} is picked with the probability proportional to
+    C{1 / n ** s}, so a few keys get most of the traffic.
+    """
+
+    def __init__(self, count, s=1.0):
+        total = 0.0
+        self.cdf = []
+        for rank in range(1, count + 1):
+            total += 1.0 / rank ** s
+            self.cdf.append(total)
+        self.total = total
+
+    def __call__(self):
+        return bisect.bisect_left(self.cdf, random.random() * self.total)
+
+
+class ValueSizes(object):
+    """Value sizes from C{"<size>"} or a log-uniform C{"<min>-<max>"}."""
+
+    def __init__(self, spec):
+        low, _, high = spec.partition('-')
+        self.low = int(low)
+        self.high = int(high or low)
+
+    def __call__(self):
+        if self.low == self.high:
+            return self.low
+        return int(math.exp(random.uniform(
+            math.log(self.low), math.log(self.high))))
+
+
+class Workload(object):
+    """Generated traffic, yields C{(command, key, size)}.
+
+    Size of the gets is None, the value set after a miss gets a random
+    size then.
+    """
+
+    def __init__(self, keys, sizes, read_ratio):
+        self.keys = keys
+        self.sizes = sizes
+        self.read_ratio = read_ratio
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        key = 'loadgen:{}'.format(self.keys()).encode('ascii')
+        if random.random() < self.read_ratio:
+            return 'get', key, None
+        return 'set', key, self.sizes()
+
+    next = __next__
+
+
+class Trace(object):
+    """Replays commands captured in a file, in a loop."""
+
+    def __init__(self, path):
+        self.commands = []
+        with open(path, 'rb') as f:
+            for line in f:
+                terms = line.split()
+                if not terms:
+                    continue
+                if len(terms) == 1:
+                    terms.insert(0, b'get')
+                command = terms[0].decode('ascii')
+                if command not in ('get', 'set', 'delete'):
+                    raise ValueError('unknown command {!r}'.format(line))
+                size = int(terms[2]) if len(terms) > 2 else None
+                self.commands.append((command, terms[1], size))
+        if not self.commands:
+            raise ValueError('empty trace {}'.format(path))
+        self._commands = itertools.cycle(self.commands)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._commands)
+
+    next = __next__
+
+
+class Window(object):
+    """Results of the commands finished within one report interval."""
+
+    def __init__(self):
+        self.started = clock()
+        self.latencies = []
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def report(self, elapsed):
+        seconds = clock() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(percent):
+            if not latencies:
+                return 0.0
+            index = int(round(percent / 100.0 * (len(latencies) - 1)))
+            return latencies[index] * 1000
+
+        reads = self.hits + self.misses
+        return {
+            'elapsed': round(elapsed, 3),
+            'ops': len(latencies),
+            'ops_per_sec': len(latencies) / seconds if seconds else 0.0,
+            'p50_ms': percentile(50),
+            'p99_ms': percentile(99),
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+            'hit_ratio': float(self.hits) / reads if reads else 0.0,
+            'errors': self.errors,
+        }
+
+
+@gen.coroutine
+def worker(mc, workload, state, stop_at, sizes, fill=True):
+    values = {}
+
+    def value(size):
+        if size is None:
+            size = sizes()
+        if size not in values:
+            values[size] = b'x' * size
+        return values[size]
+
+    for command, key, size in workload:
+        if clock() >= stop_at:
+            break
+        window = state['window']
+        start = clock()
+        try:
+            if command == 'get':
+                result = yield mc.get(key)
+                if result is None:
+                    window.misses += 1
+                    if fill:
+                        yield mc.set(key, value(size))
+                else:
+                    window.hits += 1
+            elif command == 'set':
+                yield mc.set(key, value(size))
+            else:
+                yield mc.delete(key)
+        except (ClientException, socket.error):
+            window.errors += 1
+            continue
+        window.latencies.append(clock() - start)
+
+
+def format_report(report):
+    return (
+        '{elapsed:>8.1f}s {ops_per_sec:>10.0f} ops/s '
+        'p50 {p50_ms:>7.3f}ms p99 {p99_ms:>7.3f}ms max {max_ms:>8.3f}ms '
+        'hits {hit_ratio:>6.1%} errors {errors}'.format(**report)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('\n', 2)[2])
+    parser.add_argument(
+        '--servers', help='comma separated servers, stub server if omitted')
+    parser.add_argument(
+        '--keys', type=int, default=10000, help='size of the key space')
+    parser.add_argument(
+        '--distribution', choices=('zipf', 'uniform'), default='zipf')
+    parser.add_argument(
+        '--zipf-s', type=float, default=1.0, help='skew of zipf keys')
+    parser.add_argument('--read-ratio', type=float, default=0.9)
+    parser.add_argument(
+        '--value-size', default='100', help='<size> or <min>-<max>')
+    parser.add_argument('--trace', help='file with commands to replay')
+    parser.add_argument(
+        '--no-fill', dest='fill', action='store_false',
+        help='do not set the values of missed gets')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--pool-size', type=int, default=15)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument(
+        '--interval', type=float, default=1.0, help='seconds between reports')
+    parser.add_argument(
+        '--json', action='store_true', help='print reports as json lines')
+    args = parser.parse_args(argv)
+
+    loop = tornado.ioloop.IOLoop.current()
+    if args.servers:
+        servers = args.servers.split(',')
+    else:
+        stub = StubServer()
+        servers = ['127.0.0.1:{}'.format(stub.listen_free())]
+
+    sizes = ValueSizes(args.value_size)
+    mc = Client(servers=servers, loop=loop, pool_size=args.pool_size)
+    started = clock()
+    stop_at = started + args.duration
+    state = {'window': Window()}
+
+    def report(window):
+        report = window.report(clock() - started)
+        if args.json:
+            print(json.dumps(report, sort_keys=True))
+        else:
+            print(format_report(report))
+        sys.stdout.flush()
+
+    def tick():
+        window, state['window'] = state['window'], Window()
+        report(window)
+
+    @gen.coroutine
+    def run():
+        if args.trace:
+            workloads = [Trace(args.trace)] * args.concurrency
+        else:
+            if args.distribution == 'zipf':
+                keys = ZipfKeys(args.keys, args.zipf_s)
+            else:
+                keys = UniformKeys(args.keys)
+            workloads = [
+                Workload(keys, sizes, args.read_ratio)
+                for _ in range(args.concurrency)
+            ]
+        ticker = tornado.ioloop.PeriodicCallback(tick, args.interval * 1000)
+        ticker.start()
+        try:
+            yield [
+                worker(mc, workload, state, stop_at, sizes, args.fill)
+                for workload in workloads
+            ]
+        finally:
+            ticker.stop()
+        if state['window'].latencies:
+            tick()
+
+    try:
+        loop.run_sync(run)
+    finally:
+        mc.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Instrumentation hooks of the client.
+
+Metrics are disabled by default. Pass a L{MetricsSink} to the client to
+receive events::
+
+    stats = asyncmc.Stats()
+    mc = asyncmc.Client(servers=['localhost:11211'], metrics=stats)
+    ...
+    print(stats.snapshot())
+
+Hosts are reported as C{"host:port"} strings and command names as bytes
+(C{b'get'}, C{b'set'}, ...).
+"""
+import bisect
+import time
+from collections import defaultdict
+
+clock = getattr(time, 'monotonic', time.time)
+
+
+class MetricsSink(object):
+    """Receiver of client events.
+
+    Every method is a no-op, subclass it and override the events
+    you are interested in.
+    """
+
+    def command(self, name, host, seconds):
+        """Command C{name} sent to C{host} took C{seconds}."""
+
+    def bytes_sent(self, host, count):
+        """C{count} bytes were written to C{host}."""
+
+    def bytes_received(self, host, count):
+        """C{count} bytes were read from C{host}."""
+
+    def lookups(self, host, hits, misses):
+        """Retrieval command to C{host} found C{hits} of the keys."""
+
+    def pool_wait(self, seconds):
+        """Acquiring a connection from the pool took C{seconds}."""
+
+    def pool_size(self, size, in_use):
+        """Pool holds C{size} connections, C{in_use} of them are busy."""
+
+    def connect(self, host, reconnect=False):
+        """New socket to C{host} was opened."""
+
+    def host_dead(self, host, reason):
+        """C{host} was marked dead for C{reason}."""
+
+    def shed(self, host):
+        """Request to C{host} was rejected as it is overloaded."""
+
+    def admission_wait(self, host, seconds):
+        """Request waited C{seconds} for a slot of C{host}."""
+
+
+class Histogram(object):
+    """Latency histogram with exponential buckets.
+
+    Values are seconds, buckets cover 10us..80s with the factor of two,
+    so percentiles are accurate within 2x.
+    """
+
+    bounds = [0.00001 * 2 ** i for i in range(24)]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the C{percent} percentile."""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= rank and hits:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                break
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Stats(MetricsSink):
+    """Sink which keeps counters and histograms in memory.
+
+    Use L{snapshot} to scrape them and L{reset} to start over.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.commands = defaultdict(Histogram)
+        self.sent = defaultdict(int)
+        self.received = defaultdict(int)
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.wait = Histogram()
+        self.size = 0
+        self.in_use = 0
+        self.connects = defaultdict(int)
+        self.reconnects = defaultdict(int)
+        self.dead = defaultdict(int)
+        self.shed_requests = defaultdict(int)
+        self.admission = Histogram()
+
+    def command(self, name, host, seconds):
+        self.commands[name, host].add(seconds)
+
+    def bytes_sent(self, host, count):
+        self.sent[host] += count
+
+    def bytes_received(self, host, count):
+        self.received[host] += count
+
+    def lookups(self, host, hits, misses):
+        self.hits[host] += hits
+        self.misses[host] += misses
+
+    def pool_wait(self, seconds):
+        self.wait.add(seconds)
+
+    def pool_size(self, size, in_use):
+        self.size = size
+        self.in_use = in_use
+
+    def connect(self, host, reconnect=False):
+        if reconnect:
+            self.reconnects[host] += 1
+        else:
+            self.connects[host] += 1
+
+    def host_dead(self, host, reason):
+        self.dead[host] += 1
+
+    def shed(self, host):
+        self.shed_requests[host] += 1
+
+    def admission_wait(self, host, seconds):
+        self.admission.add(seconds)
+
+    def snapshot(self):
+        """Current values as a dict of plain python types."""
+        commands = defaultdict(dict)
+        for (name, host), histogram in self.commands.items():
+            commands[name][host] = histogram.summary()
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+        return {
+            'commands': dict(commands),
+            'bytes_sent': dict(self.sent),
+            'bytes_received': dict(self.received),
+            'hits': dict(self.hits),
+            'misses': dict(self.misses),
+            'hit_ratio': float(hits) / lookups if lookups else 0.0,
+            'pool_wait': self.wait.summary(),
+            'pool_size': self.size,
+            'pool_in_use': self.in_use,
+            'connects': dict(self.connects),
+            'reconnects': dict(self.reconnects),
+            'dead': dict(self.dead),
+            'shed': dict(self.shed_requests),
+            'admission_wait': self.admission.summary(),
+        }
@@ -0,0 +1,135 @@
+"""Namespaces of keys which are invalidated at once.
+
+A L{Namespace} keeps a generation number in memcached and puts it in
+every key of the namespace. Invalidating the namespace is a single
+C{incr} of the generation: the keys of the old generation are not read
+anymore and memcached evicts them in time::
+
+    tenant = mc.namespace(b'tenant:42')
+    yield tenant.set(b'profile', profile)
+    profile = yield tenant.get(b'profile')
+    yield tenant.invalidate()
+
+The generation is cached by every client for C{ttl} seconds, so other
+processes see an invalidation within that time. A generation which was
+evicted starts over from the current time in microseconds, not from a
+number the old keys may still use.
+"""
+import time
+
+from tornado import gen
+from tornado.concurrent import Future
+
+from .exceptions import ClientException
+from .metrics import clock
+from .protocol import encode_key
+
+
+class Namespace(object):
+    """Keys of a namespace and its generation.
+
+    @param client: L{Client} storing the keys.
+    @param name: bytes or string, name of the namespace.
+    @param ttl: seconds the generation is cached locally.
+    @param exptime: exptime of the generation key.
+    """
+
+    def __init__(self, client, name, ttl=1.0, exptime=0):
+        self.client = client
+        self.name = encode_key(name)
+        self.ttl = ttl
+        self.exptime = exptime
+        self.generation_key = self.name + b':generation'
+        self._generation = None
+        self._expires = 0
+        self._fetching = None
+
+    def _cache(self, generation):
+        self._generation = generation
+        self._expires = clock() + self.ttl
+
+    def generation(self):
+        """Future of the current generation."""
+        if self._generation is not None and clock() < self._expires:
+            future = Future()
+            future.set_result(self._generation)
+            return future
+        # concurrent callers share one fetch
+        fetching = self._fetching
+        if fetching is None:
+            fetching = self._fetching = self._fetch_generation()
+            # runs right away when the fetch is already done
+            fetching.add_done_callback(self._fetched)
+        return fetching
+
+    def _fetched(self, future):
+        if self._fetching is future:
+            self._fetching = None
+
+    @gen.coroutine
+    def _fetch_generation(self):
+        generation = yield self.client.get(self.generation_key)
+        if generation is None:
+            generation = int(time.time() * 1000000)
+            added = yield self.client.add(
+                self.generation_key, generation, self.exptime)
+            if not added:
+                generation = yield self.client.get(self.generation_key)
+        self._cache(generation)
+        raise gen.Return(generation)
+
+    def _key(self, key, generation):
+        return b':'.join((
+            self.name, str(generation).encode('ascii'), encode_key(key)))
+
+    @gen.coroutine
+    def key(self, key):
+        """Key of the current generation, as stored in memcached."""
+        generation = yield self.generation()
+        raise gen.Return(self._key(key, generation))
+
+    @gen.coroutine
+    def invalidate(self):
+        """Moves the namespace to a new generation.
+
+        @return: the new generation.
+        """
+        try:
+            generation = yield self.client.incr(self.generation_key)
+        except ClientException:
+            # evicted or never used, a new one is as good as incremented
+            self._generation = None
+            generation = yield self.generation()
+        self._cache(generation)
+        raise gen.Return(generation)
+
+    @gen.coroutine
+    def get(self, key, default=None):
+        key = yield self.key(key)
+        value = yield self.client.get(key, default)
+        raise gen.Return(value)
+
+    @gen.coroutine
+    def multi_get(self, *keys, **kwargs):
+        generation = yield self.generation()
+        values = yield self.client.multi_get(
+            *[self._key(key, generation) for key in keys], **kwargs)
+        raise gen.Return(values)
+
+    @gen.coroutine
+    def set(self, key, value, exptime=0, noreply=False):
+        key = yield self.key(key)
+        result = yield self.client.set(key, value, exptime, noreply)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def add(self, key, value, exptime=0, noreply=False):
+        key = yield self.key(key)
+        result = yield self.client.add(key, value, exptime, noreply)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def delete(self, key, noreply=False):
+        key = yield self.key(key)
+        result = yield self.client.delete(key, noreply)
+        raise gen.Return(result)
@@ -0,0 +1,131 @@
+"""Encoding and decoding of large values in an executor.
+
+json and pickle of a multi-megabyte value take tens of milliseconds
+and every other request of the process waits for them while they run
+on the IOLoop. With an executor, the values above the size thresholds
+are encoded and decoded there and the small ones, the common case,
+stay inline::
+
+    mc = asyncmc.Client(
+        servers=[...], executor=ProcessPoolExecutor(2),
+        offload_encode_threshold=256 * 1024,
+        offload_decode_threshold=256 * 1024)
+
+json and pickle hold the GIL, so a C{ThreadPoolExecutor} only moves
+them off the IOLoop callbacks, a C{ProcessPoolExecutor} runs them in
+parallel. The values sent to a process pool are pickled, which is a
+plain copy for bytes. Values returned by C{multi_get(lazy=True)} are
+decoded inline on access.
+"""
+import sys
+
+import tornado.ioloop
+from tornado import gen
+from tornado.concurrent import Future, chain_future
+
+from . import protocol
+
+# bytes counted for every number, None and bool
+SCALAR_SIZE = 8
+
+
+def size_exceeds(value, limit):
+    """Whether the encoded value is likely bigger than C{limit} bytes.
+
+    Walks the value until the estimate passes the limit, so it costs
+    next to nothing for small values and at most C{limit} worth of
+    items for big ones.
+    """
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, (bytes, bytearray, str)):
+            size += len(item)
+        elif isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+            size += 2
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+            size += 2
+        elif isinstance(item, (int, float)) or item is None:
+            size += SCALAR_SIZE
+        else:
+            size += sys.getsizeof(item)
+        if size > limit:
+            return True
+    return False
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class Offload(object):
+    """Runs the encoding and decoding of large values in an executor.
+
+    @param executor: C{concurrent.futures} executor.
+    @param encode_threshold: values estimated bigger than this many
+        bytes by L{size_exceeds} are encoded in the executor.
+    @param decode_threshold: values of more bytes than this are
+        decoded in the executor.
+    @param encode: function of a value giving C{(bytes, flags)}, it has
+        to be picklable for a process pool.
+    @param decode: function of C{(flags, bytes)} giving the value.
+    @ivar encoded: number of values encoded in the executor.
+    @ivar decoded: number of values decoded in the executor.
+    """
+
+    def __init__(self, executor, encode_threshold=256 * 1024,
+                 decode_threshold=256 * 1024,
+                 encode=protocol.encode_value, decode=protocol.decode_value):
+        self.executor = executor
+        self.encode_threshold = encode_threshold
+        self.decode_threshold = decode_threshold
+        self._encode = encode
+        self._decode = decode
+        self.encoded = 0
+        self.decoded = 0
+
+    def encode(self, value):
+        """Future of the C{(bytes, flags)} of the value."""
+        # bytes, str and numbers are encoded by a copy at most
+        if isinstance(value, (bytes, str, int)) or \
+                not size_exceeds(value, self.encode_threshold):
+            return _done(self._encode(value))
+        self.encoded += 1
+        return self._submit(self._encode, value)
+
+    def decode(self, flags, data):
+        """Future of the value stored as C{data} with the flags."""
+        if len(data) <= self.decode_threshold:
+            return _done(self._decode(flags, data))
+        self.decoded += 1
+        return self._submit(self._decode, flags, data)
+
+    def _submit(self, fn, *args):
+        # the executor completes its futures in its own threads, the
+        # result is handed over to a future of the IOLoop
+        future = Future()
+        tornado.ioloop.IOLoop.current().add_future(
+            self.executor.submit(fn, *args),
+            lambda done: chain_future(done, future))
+        return future
+
+    @gen.coroutine
+    def decode_many(self, items):
+        """Decodes the C{(flags, data)} items, the large ones at once in
+        the executor.
+
+        @param items: list of the items, None for a miss.
+        @return: list of the values, None for a miss.
+        """
+        futures = [
+            self.decode(*item) if item is not None else _done(None)
+            for item in items
+        ]
+        values = yield futures
+        raise gen.Return(values)
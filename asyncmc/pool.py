@@ -1,18 +1,23 @@
 import logging
 import tornado.ioloop
 import socket
-import binascii
+from collections import OrderedDict
 from tornado import gen
-from toro import Queue, Full, Empty
+from tornado.queues import Queue, QueueFull
 
+from .distribution import make_distribution, parse_weight
 from .host import Host
+from .metrics import clock
 from . import constants as const
-from .exceptions import ValidationException, ConnectionDeadError
+from .exceptions import ConnectionDeadError
+from .protocol import format_server, parse_server, server_hash
 
 
 class ConnectionPool(object):
 
-    def __init__(self, servers, maxsize=15, minsize=1, loop=None, debug=0):
+    def __init__(self, servers, maxsize=15, minsize=1, loop=None, debug=0,
+                 metrics=None, socket_options=None, replicas=1,
+                 distribution='modulo', admission=None):
         loop = loop if loop is not None else tornado.ioloop.IOLoop.instance()
         if debug:
             logging.basicConfig(
@@ -21,11 +26,17 @@ class ConnectionPool(object):
                 " %(module)s:%(lineno)d %(process)d %(thread)d %(message)s'"
             )
         self._loop = loop
-        self._servers = servers
+        self._servers = list(servers)
+        self._generation = 0
         self._minsize = minsize
         self._debug = debug
+        self._metrics = metrics
+        self._socket_options = socket_options
+        self._replicas = replicas
+        self._distribution = distribution
+        self._admission = admission
         self._in_use = set()
-        self._pool = Queue(maxsize, io_loop=self._loop)
+        self._pool = Queue(maxsize)
 
     @gen.coroutine
     def clear(self):
@@ -37,6 +48,25 @@ class ConnectionPool(object):
     def size(self):
         return len(self._in_use) + self._pool.qsize()
 
+    @property
+    def servers(self):
+        return list(self._servers)
+
+    def update_servers(self, servers):
+        """Switches to the new list of servers.
+
+        Connections move to it when they are acquired or released, so
+        the commands in flight finish at the servers they started at
+        and sockets to the servers staying in the list are kept.
+        """
+        self._servers = list(servers)
+        self._generation += 1
+
+    def _refresh(self, conn):
+        if conn.generation != self._generation:
+            conn.update_servers(self._servers)
+            conn.generation = self._generation
+
     @gen.coroutine
     def acquire(self):
         """Acquire connection from the pool, or spawn new one
@@ -44,6 +74,7 @@ class ConnectionPool(object):
 
         :return: ``Connetion`` (reader, writer)
         """
+        start = clock() if self._metrics is not None else None
         while self.size() < self._minsize:
             _conn = yield self._create_new_conn()
             yield self._pool.put(_conn)
@@ -52,36 +83,87 @@ class ConnectionPool(object):
         while not conn:
             if not self._pool.empty():
                 conn = yield self._pool.get()
+                self._refresh(conn)
 
             if conn is None:
                 conn = yield self._create_new_conn()
 
         self._in_use.add(conn)
+        if start is not None:
+            self._metrics.pool_wait(clock() - start)
+            self._metrics.pool_size(self.size(), len(self._in_use))
         raise gen.Return(conn)
 
     @gen.coroutine
     def _create_new_conn(self):
-        conn = yield Connection.get_conn(self._servers, self._debug)
+        conn = yield Connection.get_conn(
+            self._servers, self._debug, metrics=self._metrics,
+            socket_options=self._socket_options, replicas=self._replicas,
+            distribution=self._distribution, admission=self._admission)
+        conn.generation = self._generation
         raise gen.Return(conn)
 
     def release(self, conn):
         self._in_use.remove(conn)
+        conn.release_slots()
+        self._refresh(conn)
         try:
             self._pool.put_nowait(conn)
-        except (Empty, Full):
+        except QueueFull:
             conn.close_socket()
+        if self._metrics is not None:
+            self._metrics.pool_size(self.size(), len(self._in_use))
 
 
 class Connection(object):
 
-    def __init__(self, servers, debug=0):
+    def __init__(self, servers, debug=0, metrics=None, socket_options=None,
+                 replicas=1, distribution='modulo', admission=None):
         assert isinstance(servers, list)
-        self.hosts = [Host(s, self, debug) for s in servers]
+        self._debug = debug
+        self._metrics = metrics
+        self._socket_options = socket_options
+        self._replicas = replicas
+        self._distribution = distribution
+        self._admission = admission
+        self.generation = 0
+        self.hosts = []
+        self.update_servers(servers)
+
+    def update_servers(self, servers):
+        """Switches to the new list of servers.
+
+        Hosts of the servers staying in the list are reused with their
+        sockets, the sockets of the removed ones are closed.
+        """
+        servers = [parse_weight(s) for s in servers]
+        current = dict((str(host), host) for host in self.hosts)
+        hosts = []
+        for server, _ in servers:
+            host = current.pop(
+                format_server(*parse_server(server)), None)
+            if host is None:
+                host = Host(server, self, self._debug, self._metrics,
+                            self._socket_options, self._admission)
+            hosts.append(host)
+        distribution = make_distribution(
+            self._distribution, [str(host) for host in hosts],
+            [weight for _, weight in servers])
+
+        # swapped at once, nothing runs in between on the IOLoop
+        self.hosts, self.distribution = hosts, distribution
+        # every key is stored at its server and the replicas - 1 next ones
+        self.replicas = max(1, min(self._replicas, len(self.hosts)))
+        for host in current.values():
+            host.close_socket()
 
     @classmethod
     @gen.coroutine
-    def get_conn(cls, servers, debug=0):
-        return cls(servers, debug=debug)
+    def get_conn(cls, servers, debug=0, metrics=None, socket_options=None,
+                 replicas=1, distribution='modulo', admission=None):
+        return cls(servers, debug=debug, metrics=metrics,
+                   socket_options=socket_options, replicas=replicas,
+                   distribution=distribution, admission=admission)
 
     @gen.coroutine
     def send_cmd_all(self, cmd, *arg, **kw):
@@ -113,40 +195,53 @@ class Connection(object):
         raise gen.Return(res)
 
     def _cmemcache_hash(self, key):
-        if isinstance(key, str):
-            try:
-                key = key.encode('utf-8')
-            except UnicodeDecodeError as e:
-                raise ValidationException('Hash exception', e)
-        try:
-            res = (
-                (((
-                    binascii.crc32(key) & 0xffffffff
-                ) >> 16) & 0x7fff) or 1
-            )
-        except Exception as e:
-            raise ValidationException('Hash exception', e)
-        return res
+        return server_hash(key)
 
-    def _get_server(self, key):
+    def _get_server(self, key, replica=0):
         if isinstance(key, tuple):
             serverhash, key = key
         else:
-            serverhash = self._cmemcache_hash(key)
+            serverhash = None
 
         if not self.hosts:
             return None, None
 
         for i in range(const.SERVER_RETRIES):
-            server = self.hosts[serverhash % len(self.hosts)]
+            server = self.hosts[
+                self.distribution.index(key, replica, serverhash)]
             return server, key
         return None, None
 
+    def get_replicas(self, key):
+        """Hosts storing the key, its primary server first."""
+        return [
+            self._get_server(key, replica)[0]
+            for replica in range(self.replicas)
+        ]
+
+    def group_by_server(self, keys, replica=0):
+        """Splits keys by the servers they are stored at.
+
+        :param replica: group by the replica-th replica of the keys
+        :return: ``OrderedDict`` of ``Host`` to the list of its keys
+        """
+        groups = OrderedDict()
+        for key in keys:
+            server, key = self._get_server(key, replica)
+            groups.setdefault(server, []).append(key)
+        return groups
+
     def get_stream(self, cmd, *arg, **kw):
         hosts = self.hosts[self._cmemcache_hash(cmd) % len(self.hosts)] \
             ._ensure_connection()
         return hosts.stream
 
+    def release_slots(self):
+        """Gives back the admission slots of commands whose reply was
+        not read."""
+        for host in self.hosts:
+            host.release_slot()
+
     def close_socket(self):
         for host in self.hosts:
             host.close_socket()
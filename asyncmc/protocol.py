@@ -0,0 +1,301 @@
+"""memcached text protocol shared by the tornado and the asyncio clients.
+
+Everything here is I/O free: building command lines, validating keys,
+encoding values with their flags and parsing response lines.
+"""
+import binascii
+import collections
+import json
+import logging
+import pickle
+import re
+try:
+    from urllib.parse import unquote_to_bytes
+except ImportError:  # pragma: no cover
+    # Python 2, where str is bytes
+    from urllib import unquote as unquote_to_bytes
+
+from . import constants as const
+from .exceptions import ClientException, ValidationException
+
+# key supports ascii sans space and control chars
+# \x21 is !, right after space, and \x7e is -, right before DEL
+# also 1 <= len <= 250 as per the spec
+valid_key_re = re.compile(b'^[\x21-\x7e]{1,250}$')
+
+
+class MultiGetResult(list):
+    """List of values returned by C{multi_get}.
+
+    @ivar cut_off: list of servers (C{"host:port"}) whose keys were
+        treated as misses because they missed the deadline.
+    """
+
+    cut_off = ()
+
+
+def parse_server(server):
+    """Splits C{"host:port"} server string, port defaults to 11211.
+
+    C{"unix:/path/to/socket"} gives the path and None port.
+    """
+    if server.startswith('unix:'):
+        return server[len('unix:'):], None
+    host, port = server, 11211
+    if ":" in host:
+        host, port = host.rsplit(":", 1)
+        port = int(port)
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    return host, port
+
+
+def format_server(host, port):
+    if port is None:
+        return 'unix:' + host
+    return '{}:{}'.format(host, port)
+
+
+def server_hash(key):
+    """cmemcache compatible hash of the key."""
+    if isinstance(key, str):
+        try:
+            key = key.encode('utf-8')
+        except UnicodeDecodeError as e:
+            raise ValidationException('Hash exception', e)
+    try:
+        res = (
+            (((
+                binascii.crc32(key) & 0xffffffff
+            ) >> 16) & 0x7fff) or 1
+        )
+    except Exception as e:
+        raise ValidationException('Hash exception', e)
+    return res
+
+
+def encode_key(key):
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+    return key
+
+
+def validate_key(key):
+    if not isinstance(key, bytes):  # avoid bugs subtle and otherwise
+        raise ValidationException('key must be bytes', key)
+
+    m = valid_key_re.match(key)
+    if m:
+        # in python re, $ matches either end of line or right before
+        # \n at end of line. We can't allow latter case, so
+        # making sure length matches is simplest way to detect
+        if len(m.group(0)) != len(key):
+            raise ValidationException('trailing newline', key)
+    else:
+        raise ValidationException('invalid key', key)
+
+    return key
+
+
+def encode_value(value):
+    """Serializes the value.
+
+    @return: C{(bytes, flags)}
+    """
+    flag = 0
+    if isinstance(value, bytes):
+        pass
+    elif isinstance(value, str):
+        flag |= const.FLAG_STRING
+        value = value.encode('utf-8')
+    elif isinstance(value, bool):
+        flag |= const.FLAG_BOOLEAN
+        value = str(int(value)).encode('utf-8')
+    elif isinstance(value, int):
+        flag |= const.FLAG_INTEGER
+        value = str(value).encode('utf-8')
+    else:
+        try:
+            value = json.dumps(value).encode('utf-8')
+            flag |= const.FLAG_JSON
+        except Exception as e:
+            logging.info(e)
+            value = pickle.dumps(value, 2)
+            flag |= const.FLAG_PICKLE
+
+    if not isinstance(value, bytes):
+        logging.info(value)
+        value = bytes(value)
+
+    return value, flag
+
+
+def decode_value(flags, val):
+    """Deserializes the value stored with the flags."""
+    if flags == 0:
+        pass
+    elif flags & const.FLAG_STRING:
+        val = val.decode('utf-8')
+    elif flags & const.FLAG_BOOLEAN:
+        val = bool(int(val))
+    elif flags & const.FLAG_INTEGER:
+        val = int(val)
+    elif flags & const.FLAG_JSON:
+        val = json.loads(val.decode('utf-8'))
+    elif flags & const.FLAG_PICKLE:
+        val = pickle.loads(val)
+    else:
+        val = False
+
+    if val is False and not flags & const.FLAG_BOOLEAN:
+        raise ClientException('Unknown flag from server')
+    return val
+
+
+_UNDECODED = object()
+
+
+class LazyValue(object):
+    """Value returned by C{multi_get(lazy=True)}, decoded on first access.
+
+    @ivar data: bytes as stored at the server.
+    @ivar flags: flags stored with the data.
+    """
+
+    __slots__ = ('data', 'flags', '_decode', '_value')
+
+    def __init__(self, flags, data, decode=None):
+        self.flags = flags
+        self.data = data
+        self._decode = decode or decode_value
+        self._value = _UNDECODED
+
+    @property
+    def value(self):
+        """The decoded value."""
+        if self._value is _UNDECODED:
+            self._value = self._decode(self.flags, self.data)
+        return self._value
+
+    def __repr__(self):
+        return '<LazyValue flags={} size={}>'.format(
+            self.flags, len(self.data))
+
+
+def value_decoder(lazy=False, raw=False, decode=decode_value):
+    """Function of the C{(flags, data)} of a found key giving the value
+    C{multi_get} returns for it.
+
+    @param lazy: L{LazyValue} decoded on first access.
+    @param raw: C{(data, flags)} as given by L{encode_value}, without
+        decoding.
+    """
+    if raw:
+        return lambda flags, data: (data, flags)
+    if lazy:
+        return lambda flags, data: LazyValue(flags, data, decode)
+    return decode
+
+
+def validate_exptime(exptime):
+    if not isinstance(exptime, int) or isinstance(exptime, bool):
+        raise ValidationException('exptime not int', exptime)
+    elif exptime < 0:
+        raise ValidationException('exptime negative', exptime)
+
+
+def storage_command(command, key, value, flags, exptime=0, noreply=False):
+    # req  - set <key> <flags> <exptime> <bytes> [noreply]\r\n
+    #        <data block>\r\n
+    validate_exptime(exptime)
+
+    args_arr = [flags, exptime, len(value)]
+    if noreply:
+        args_arr.append('noreply')
+    args = [str(a).encode('utf-8') for a in args_arr]
+    return b' '.join([command, key] + args) + b'\r\n' + value
+
+
+def storage_result(cmd, resp, noreply=False):
+    # resp - STORED\r\n (or others)
+    if not noreply and resp not in (const.STORED, const.NOT_STORED):
+        raise ClientException('stats "{}" failed'.format(cmd), resp)
+    return resp == const.STORED or noreply
+
+
+def parse_value(line):
+    """Parses C{VALUE <key> <flags> <bytes>} line of a get response.
+
+    @return: C{(key, flags, length)}
+    """
+    terms = line.split()
+    if len(terms) != 4 or terms[0] != b'VALUE':
+        raise ClientException('get failed', line)
+    return terms[1], int(terms[2]), int(terms[3])
+
+
+KeyInfo = collections.namedtuple(
+    'KeyInfo', ('key', 'exptime', 'last_access', 'size'))
+
+
+def parse_metadump(line):
+    """Parses a line of the C{lru_crawler metadump} response.
+
+    @return: L{KeyInfo}, C{exptime} and C{last_access} are unix times,
+        C{exptime} is -1 for the items which never expire.
+    """
+    if not line.startswith(b'key='):
+        raise ClientException('metadump failed', line)
+    fields = dict(field.split(b'=', 1) for field in line.split())
+    return KeyInfo(
+        unquote_to_bytes(fields[b'key']), int(fields[b'exp']),
+        int(fields[b'la']), int(fields.get(b'size', 0)))
+
+
+def parse_stat(line, result):
+    """Adds C{STAT <name> <value>} line of a stats response to result."""
+    terms = line.split()
+
+    if len(terms) == 2 and terms[0] == b'STAT':
+        result[terms[1]] = None
+    elif len(terms) == 3 and terms[0] == b'STAT':
+        result[terms[1]] = terms[2]
+    elif len(terms) >= 3 and terms[0] == b'STAT':
+        result[terms[1]] = b' '.join(terms[2:])
+    else:
+        raise ClientException('stats failed', line)
+
+
+def stat_value(value):
+    """Number in a stats value, or the value as text."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value.decode('utf-8', 'replace')
+
+
+def group_stats(stats, group=None):
+    """Parsed C{stats [group]} result.
+
+    Names are decoded and values turned to numbers by L{stat_value}.
+    Per slab (C{slabs}, C{items}) and per connection (C{conns}) names
+    like C{b'items:1:number'} are nested as C{result[1]['number']}.
+    """
+    result = {}
+    for name, value in stats.items():
+        parts = name.decode('utf-8', 'replace').split(':')
+        if group == b'items' and parts[0] == 'items':
+            parts = parts[1:]
+        value = stat_value(value)
+        if len(parts) == 2:
+            index = stat_value(parts[0].encode('utf-8'))
+            result.setdefault(index, {})[parts[1]] = value
+        else:
+            result[':'.join(parts)] = value
+    return result
@@ -0,0 +1,116 @@
+"""Scan of the keys stored at the servers.
+
+L{KeyScan} streams C{lru_crawler metadump} of every server at once and
+yields the L{KeyInfo} of the keys as they arrive, so a scan of millions
+of keys takes the memory of C{buffer} of them::
+
+    async for info in mc.scan(prefix=b'session:'):
+        if info.last_access < cutoff:
+            expired.append(info.key)
+    await mc.delete_many(expired)
+
+The keys are reported without the C{key_prefix} of the client and the
+keys without it are skipped, so they can be passed back to the client.
+With C{replicas}, a key is reported by every server holding it. Leaving
+the loop early, call L{KeyScan.close} to stop the dumps.
+"""
+import logging
+import socket
+
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.queues import Queue
+
+from .exceptions import ClientException
+from .protocol import encode_key
+
+_DONE = object()
+
+
+class KeyScan(object):
+    """Async iterator of the L{KeyInfo} of the keys of the servers.
+
+    @param client: L{Client} of the servers.
+    @param hosts: C{"host:port"} of the servers to scan, all of them
+        by default.
+    @param prefix: only the keys starting with it.
+    @param buffer: keys read ahead of the consumer.
+    """
+
+    def __init__(self, client, hosts=None, prefix=None, buffer=1000):
+        self.client = client
+        self.hosts = hosts
+        self.prefix = client.keys.prefix + (
+            encode_key(prefix) if prefix else b'')
+        self.queue = Queue(maxsize=buffer)
+        self.closed = False
+        self._running = None
+        self._scanned = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._running is None:
+            self._running = self._run()
+        entry = await self.queue.get()
+        if entry is _DONE:
+            self.closed = True
+            raise StopAsyncIteration
+        if isinstance(entry, Exception):
+            self.close()
+            raise entry
+        return entry
+
+    def close(self):
+        """Stops the dumps which did not finish yet."""
+        if self.closed:
+            return
+        self.closed = True
+        # the rest of a dump can not be read from the socket anymore
+        for host in self._scanned:
+            host.close_socket()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    @gen.coroutine
+    def _run(self):
+        result = _DONE
+        try:
+            conn = yield self.client.pool.acquire()
+            try:
+                self._scanned = [
+                    host for host in conn.hosts
+                    if self.hosts is None or str(host) in self.hosts
+                ]
+                yield [self._dump(host) for host in self._scanned]
+            finally:
+                self._scanned = []
+                self.client.pool.release(conn)
+        except Exception as e:
+            # raised by the iterator rather than lost here
+            result = e
+        if not self.closed:
+            yield self.queue.put(result)
+
+    @gen.coroutine
+    def _dump(self, host):
+        prefix = self.prefix
+        strip = len(self.client.keys.prefix)
+
+        def consume(info):
+            if self.closed:
+                return None
+            if info.key.startswith(prefix):
+                if strip:
+                    info = info._replace(key=info.key[strip:])
+                return self.queue.put(info)
+
+        try:
+            yield self.client._metadump(host, consume)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            if self.closed:
+                return
+            logging.warning('metadump of %s failed: %s', host, e)
+            host.close_socket()
+            yield self.queue.put(e)
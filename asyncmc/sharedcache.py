@@ -0,0 +1,234 @@
+"""Near-cache shared by the processes of a machine.
+
+L{SharedCache} is a hash table in a memory mapped file. Pre-forked
+workers opening the same file share the values any of them read, so a
+hot key is fetched once per machine and C{ttl} instead of once per
+process. It plugs in as the C{hot_keys} of the client::
+
+    near = asyncmc.SharedCache(
+        '/dev/shm/asyncmc', slots=65536, slot_size=1024, ttl=1,
+        hot_keys=asyncmc.HotKeys(threshold=100))
+    mc = asyncmc.Client(servers=[...], hot_keys=near)
+
+Values are kept encoded with their flags, the client decodes them like
+the ones read from the servers. Every key has C{ways} slots it may be
+stored at, an expired or the least recently read one is replaced when
+they are taken. Values which do not fit a slot are not cached.
+
+It needs a POSIX system. Writers lock the slots of the key with
+C{fcntl.lockf}, readers take no lock: a slot carries a sequence number
+which is odd while it is written and a checksum, a reader which sees
+either change or mismatch treats the key as a miss. Writes and deletes
+made through a client drop the key for all the processes, writes made
+elsewhere are seen after C{ttl}.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from .exceptions import ValidationException
+
+MAGIC = b'AMC1'
+# magic, number of slots, slot size, ways
+FILE_HEADER = struct.Struct('<4sIII')
+HEADER_SIZE = 64
+# sequence number of the slot, written before and after the rest
+SEQUENCE = struct.Struct('<I')
+# checksum, key hash, expires, read at, flags, key size, value size
+SLOT = struct.Struct('<IQddIHI')
+SLOT_HEADER_SIZE = SEQUENCE.size + SLOT.size
+READ_AT = SEQUENCE.size + struct.calcsize('<IQd')
+
+
+def key_hash(key):
+    """Hash of the key, the same in every process, never 0."""
+    digest = hashlib.md5(key).digest()
+    return struct.unpack('<Q', digest[:8])[0] | 1
+
+
+class SharedCache(object):
+    """Memory mapped table of encoded values with their flags.
+
+    @param path: file of the table, processes opening the same file
+        share it. A file on tmpfs like C{/dev/shm} is never written to
+        a disk.
+    @param slots: number of values the table holds.
+    @param slot_size: bytes of a slot, the key and value have to fit
+        with 42 bytes of header.
+    @param ttl: seconds a value is served from the table.
+    @param ways: slots a key may be stored at.
+    @param hot_keys: optional L{HotKeys}, only its hot keys are stored
+        then, otherwise every value read is.
+    @ivar hits: lookups of this process found in the table.
+    @ivar misses: lookups of this process not found.
+    """
+
+    def __init__(self, path, slots=4096, slot_size=1024, ttl=1.0, ways=4,
+                 hot_keys=None):
+        if fcntl is None:
+            raise ValidationException('SharedCache needs a POSIX system')
+        if slots % ways:
+            raise ValidationException('slots must be a multiple of ways')
+        if slot_size <= SLOT_HEADER_SIZE:
+            raise ValidationException('slot_size too small', slot_size)
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ttl = ttl
+        self.ways = ways
+        self.hot_keys = hot_keys
+        self.buckets = slots // ways
+        self.hits = 0
+        self.misses = 0
+        size = HEADER_SIZE + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._init_file(size)
+            self._map = mmap.mmap(self._fd, size)
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def _init_file(self, size):
+        self._lock(0, HEADER_SIZE)
+        try:
+            header = os.pread(self._fd, FILE_HEADER.size, 0)
+            layout = (MAGIC, self.slots, self.slot_size, self.ways)
+            if len(header) == FILE_HEADER.size and header[:4] == MAGIC:
+                if FILE_HEADER.unpack(header) != layout:
+                    raise ValidationException(
+                        'shared cache file has another layout', self.path)
+                return
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, size)
+            os.pwrite(self._fd, FILE_HEADER.pack(*layout), 0)
+        finally:
+            self._unlock(0, HEADER_SIZE)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _lock(self, start, length):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+
+    def _unlock(self, start, length):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _offsets(self, hashed):
+        first = hashed % self.buckets * self.ways
+        return [
+            HEADER_SIZE + (first + way) * self.slot_size
+            for way in range(self.ways)
+        ]
+
+    def _read(self, offset, hashed, key, now):
+        """Flags and value of the key in the slot or None."""
+        mm = self._map
+        sequence, = SEQUENCE.unpack_from(mm, offset)
+        if sequence & 1:
+            return None
+        checksum, slot_hash, expires, _, flags, key_size, value_size = \
+            SLOT.unpack_from(mm, offset + SEQUENCE.size)
+        if slot_hash != hashed or expires < now or \
+                SLOT_HEADER_SIZE + key_size + value_size > self.slot_size:
+            return None
+        start = offset + SLOT_HEADER_SIZE
+        data = mm[start:start + key_size + value_size]
+        # changed by a writer in the meantime
+        if SEQUENCE.unpack_from(mm, offset)[0] != sequence:
+            return None
+        if data[:key_size] != key or zlib.crc32(data) != checksum:
+            return None
+        return flags, data[key_size:]
+
+    def lookup(self, key):
+        """Counts a read of the key with the C{hot_keys}.
+
+        @return: C{(flags, value)} of the key stored by any process
+            or None.
+        """
+        if self.hot_keys is not None:
+            self.hot_keys.lookup(key)
+        hashed = key_hash(key)
+        now = time.time()
+        for offset in self._offsets(hashed):
+            item = self._read(offset, hashed, key, now)
+            if item is not None:
+                # read time of the eviction, racing writers do no harm
+                struct.pack_into('<d', self._map, offset + READ_AT, now)
+                self.hits += 1
+                return item
+        self.misses += 1
+        return None
+
+    def offer(self, key, flags, value):
+        """Stores a value read from the server, if it is hot and fits."""
+        if self.hot_keys is not None and not self.hot_keys.is_hot(key):
+            return
+        if SLOT_HEADER_SIZE + len(key) + len(value) > self.slot_size:
+            return
+        hashed = key_hash(key)
+        offsets = self._offsets(hashed)
+        self._lock(offsets[0], self.ways * self.slot_size)
+        try:
+            now = time.time()
+            self._write(
+                self._victim(offsets, hashed, key, now), hashed, key, flags,
+                value, now)
+        finally:
+            self._unlock(offsets[0], self.ways * self.slot_size)
+
+    def _victim(self, offsets, hashed, key, now):
+        """Slot of the key, an empty or expired one or the least
+        recently read one."""
+        victim = None
+        oldest = None
+        for offset in offsets:
+            _, slot_hash, expires, read_at, _, key_size, _ = \
+                SLOT.unpack_from(self._map, offset + SEQUENCE.size)
+            start = offset + SLOT_HEADER_SIZE
+            if slot_hash == hashed and \
+                    self._map[start:start + key_size] == key:
+                return offset
+            if not slot_hash or expires < now:
+                read_at = 0
+            if oldest is None or read_at < oldest:
+                victim, oldest = offset, read_at
+        return victim
+
+    def _write(self, offset, hashed, key, flags, value, now):
+        mm = self._map
+        sequence, = SEQUENCE.unpack_from(mm, offset)
+        SEQUENCE.pack_into(mm, offset, (sequence | 1) & 0xffffffff)
+        data = key + value
+        start = offset + SLOT_HEADER_SIZE
+        mm[start:start + len(data)] = data
+        SLOT.pack_into(
+            mm, offset + SEQUENCE.size, zlib.crc32(data), hashed,
+            now + self.ttl, now, flags, len(key), len(value))
+        SEQUENCE.pack_into(mm, offset, ((sequence | 1) + 1) & 0xffffffff)
+
+    def discard(self, key):
+        """Drops the key for all the processes after it was changed."""
+        hashed = key_hash(key)
+        offsets = self._offsets(hashed)
+        self._lock(offsets[0], self.ways * self.slot_size)
+        try:
+            for offset in offsets:
+                _, slot_hash, _, _, _, key_size, _ = SLOT.unpack_from(
+                    self._map, offset + SEQUENCE.size)
+                start = offset + SLOT_HEADER_SIZE
+                if slot_hash == hashed and \
+                        self._map[start:start + key_size] == key:
+                    self._write(offset, 0, b'', 0, b'', 0)
+        finally:
+            self._unlock(offsets[0], self.ways * self.slot_size)
@@ -0,0 +1,372 @@
+"""In-process memcached stand-in.
+
+Pure python server of the memcached text protocol running on the tornado
+IOLoop. It is meant for benchmarks, load tests and development machines
+without memcached, not for production::
+
+    server = StubServer()
+    port = server.listen_free()
+    mc = asyncmc.Client(servers=['127.0.0.1:{}'.format(port)])
+
+or as a separate process::
+
+    $ python -m asyncmc.stubserver --port 11211 --unix /tmp/memcached.sock
+
+Supported commands are get, gets, set, add, replace, append, prepend, cas,
+delete, incr, decr, touch, flush_all, version, stats (also settings, slabs,
+items and conns), lru_crawler metadump and quit.
+"""
+import argparse
+import os
+import socket
+import time
+try:
+    from urllib.parse import quote_from_bytes
+except ImportError:  # pragma: no cover
+    # Python 2, where str is bytes
+    from urllib import quote as quote_from_bytes
+
+import tornado.ioloop
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+from tornado.netutil import bind_sockets, bind_unix_socket
+
+VERSION = b'1.6.0-asyncmc-stub'
+# exptime bigger than this is an absolute unix time
+RELATIVE_EXPTIME = 60 * 60 * 24 * 30
+MAXBYTES = 64 * 1024 * 1024
+
+
+class StubServer(TCPServer):
+    """Memcached server keeping items in a dict.
+
+    @param latency: seconds to wait before every reply, to play
+        a slow server.
+    """
+
+    def __init__(self, latency=0, **kwargs):
+        super(StubServer, self).__init__(**kwargs)
+        self.latency = latency
+        self.items = {}
+        self.oldest_live = -1
+        # last time the keys were stored or read
+        self.accessed = {}
+        self.cas_id = 0
+        self.started = time.time()
+        self.connections = {}
+        self.counters = dict.fromkeys((
+            'cmd_get', 'cmd_set', 'cmd_touch', 'get_hits', 'get_misses',
+            'curr_connections', 'total_connections', 'bytes_read',
+            'bytes_written'
+        ), 0)
+
+    def listen_free(self, address='127.0.0.1'):
+        """Listens at a free port and returns it."""
+        sockets = bind_sockets(0, address, family=socket.AF_INET)
+        self.add_sockets(sockets)
+        return sockets[0].getsockname()[1]
+
+    def listen_unix(self, path):
+        """Listens at a unix socket and returns its server string."""
+        self.add_socket(bind_unix_socket(path))
+        return 'unix:' + path
+
+    def _get_item(self, key):
+        item = self.items.get(key)
+        if item is not None and (
+            item[2] and item[2] <= time.time() or
+            item[4] <= self.oldest_live
+        ):
+            del self.items[key]
+            item = None
+        return item
+
+    def _store(self, key, flags, exptime, value):
+        exptime = int(exptime)
+        if exptime < 0:
+            expires = time.time() - 1
+        elif not exptime:
+            expires = 0
+        elif exptime > RELATIVE_EXPTIME:
+            expires = exptime
+        else:
+            expires = time.time() + exptime
+        self.cas_id += 1
+        self.items[key] = (
+            int(flags), value, expires, self.cas_id, int(time.time()))
+        self.accessed[key] = time.time()
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        self.counters['curr_connections'] += 1
+        self.counters['total_connections'] += 1
+        conn_id = self.counters['total_connections']
+        self.connections[conn_id] = address
+        try:
+            while True:
+                line = yield stream.read_until(b'\r\n')
+                self.counters['bytes_read'] += len(line)
+                terms = line.split()
+                if not terms:
+                    reply = b'ERROR\r\n'
+                elif terms[0] == b'quit':
+                    break
+                else:
+                    handler = getattr(
+                        self, 'cmd_' + terms[0].decode('ascii', 'replace'),
+                        None)
+                    if handler is None:
+                        reply = b'ERROR\r\n'
+                    else:
+                        reply = yield handler(stream, *terms[1:])
+                if self.latency:
+                    yield gen.sleep(self.latency)
+                if reply and not (len(terms) > 1 and terms[-1] == b'noreply'):
+                    self.counters['bytes_written'] += len(reply)
+                    yield stream.write(reply)
+        except StreamClosedError:
+            pass
+        finally:
+            self.counters['curr_connections'] -= 1
+            del self.connections[conn_id]
+            stream.close()
+
+    @gen.coroutine
+    def cmd_get(self, stream, *keys):
+        reply = []
+        for key in keys:
+            self.counters['cmd_get'] += 1
+            item = self._get_item(key)
+            if item is None:
+                self.counters['get_misses'] += 1
+                continue
+            self.counters['get_hits'] += 1
+            self.accessed[key] = time.time()
+            flags, value = item[:2]
+            reply.append(b'VALUE ' + key + ' {} {}\r\n'.format(
+                flags, len(value)).encode('ascii') + value + b'\r\n')
+        reply.append(b'END\r\n')
+        raise gen.Return(b''.join(reply))
+
+    @gen.coroutine
+    def cmd_gets(self, stream, *keys):
+        reply = []
+        for key in keys:
+            item = self._get_item(key)
+            if item is None:
+                continue
+            flags, value, _, cas = item[:4]
+            reply.append(b'VALUE ' + key + ' {} {} {}\r\n'.format(
+                flags, len(value), cas).encode('ascii') + value + b'\r\n')
+        reply.append(b'END\r\n')
+        raise gen.Return(b''.join(reply))
+
+    @gen.coroutine
+    def _read_data(self, stream, length):
+        data = yield stream.read_bytes(int(length) + 2)
+        self.counters['bytes_read'] += len(data)
+        self.counters['cmd_set'] += 1
+        raise gen.Return(data[:-2])
+
+    @gen.coroutine
+    def cmd_set(self, stream, key, flags, exptime, length, *args):
+        value = yield self._read_data(stream, length)
+        self._store(key, flags, exptime, value)
+        raise gen.Return(b'STORED\r\n')
+
+    @gen.coroutine
+    def cmd_add(self, stream, key, flags, exptime, length, *args):
+        value = yield self._read_data(stream, length)
+        if self._get_item(key) is not None:
+            raise gen.Return(b'NOT_STORED\r\n')
+        self._store(key, flags, exptime, value)
+        raise gen.Return(b'STORED\r\n')
+
+    @gen.coroutine
+    def cmd_replace(self, stream, key, flags, exptime, length, *args):
+        value = yield self._read_data(stream, length)
+        if self._get_item(key) is None:
+            raise gen.Return(b'NOT_STORED\r\n')
+        self._store(key, flags, exptime, value)
+        raise gen.Return(b'STORED\r\n')
+
+    @gen.coroutine
+    def cmd_append(self, stream, key, flags, exptime, length, *args):
+        value = yield self._read_data(stream, length)
+        item = self._get_item(key)
+        if item is None:
+            raise gen.Return(b'NOT_STORED\r\n')
+        self.items[key] = (item[0], item[1] + value) + item[2:]
+        raise gen.Return(b'STORED\r\n')
+
+    @gen.coroutine
+    def cmd_prepend(self, stream, key, flags, exptime, length, *args):
+        value = yield self._read_data(stream, length)
+        item = self._get_item(key)
+        if item is None:
+            raise gen.Return(b'NOT_STORED\r\n')
+        self.items[key] = (item[0], value + item[1]) + item[2:]
+        raise gen.Return(b'STORED\r\n')
+
+    @gen.coroutine
+    def cmd_cas(self, stream, key, flags, exptime, length, cas, *args):
+        value = yield self._read_data(stream, length)
+        item = self._get_item(key)
+        if item is None:
+            raise gen.Return(b'NOT_FOUND\r\n')
+        if item[3] != int(cas):
+            raise gen.Return(b'EXISTS\r\n')
+        self._store(key, flags, exptime, value)
+        raise gen.Return(b'STORED\r\n')
+
+    @gen.coroutine
+    def cmd_delete(self, stream, key, *args):
+        if self._get_item(key) is None:
+            raise gen.Return(b'NOT_FOUND\r\n')
+        del self.items[key]
+        raise gen.Return(b'DELETED\r\n')
+
+    @gen.coroutine
+    def cmd_touch(self, stream, key, exptime, *args):
+        self.counters['cmd_touch'] += 1
+        item = self._get_item(key)
+        if item is None:
+            raise gen.Return(b'NOT_FOUND\r\n')
+        self._store(key, item[0], exptime, item[1])
+        raise gen.Return(b'TOUCHED\r\n')
+
+    @gen.coroutine
+    def _change(self, key, delta):
+        item = self._get_item(key)
+        if item is None:
+            raise gen.Return(b'NOT_FOUND\r\n')
+        if not item[1].isdigit():
+            raise gen.Return(
+                b'CLIENT_ERROR cannot increment or decrement '
+                b'non-numeric value\r\n')
+        value = str(max(int(item[1]) + delta, 0) % 2 ** 64).encode('ascii')
+        self.items[key] = (item[0], value) + item[2:]
+        raise gen.Return(value + b'\r\n')
+
+    def cmd_incr(self, stream, key, value, *args):
+        return self._change(key, int(value))
+
+    def cmd_decr(self, stream, key, value, *args):
+        return self._change(key, -int(value))
+
+    @gen.coroutine
+    def cmd_flush_all(self, stream, *args):
+        # like memcached, the items stored within the current second
+        # survive, so a flush racing with a set does not drop it
+        self.oldest_live = int(time.time()) - 1
+        for key in list(self.items):
+            self._get_item(key)
+        raise gen.Return(b'OK\r\n')
+
+    @gen.coroutine
+    def cmd_version(self, stream, *args):
+        raise gen.Return(b'VERSION ' + VERSION + b'\r\n')
+
+    @gen.coroutine
+    def cmd_lru_crawler(self, stream, *args):
+        if args[:1] != (b'metadump',) or len(args) != 2:
+            raise gen.Return(b'CLIENT_ERROR bad command line format\r\n')
+        reply = []
+        for key in list(self.items):
+            item = self._get_item(key)
+            if item is None:
+                continue
+            reply.append(
+                'key={} exp={} la={} cas={} fetch=no cls=1 size={}\n'.format(
+                    quote_from_bytes(key, safe=''),
+                    int(item[2]) if item[2] else -1,
+                    int(self.accessed.get(key, item[4])), item[3],
+                    len(key) + len(item[1]) + 48,
+                ).encode('ascii'))
+        reply.append(b'END\r\n')
+        raise gen.Return(b''.join(reply))
+
+    @gen.coroutine
+    def cmd_stats(self, stream, *args):
+        group = args[0].decode('ascii', 'replace') if args else 'general'
+        handler = getattr(self, '_stats_' + group, None)
+        if handler is None:
+            raise gen.Return(b'ERROR\r\n')
+        raise gen.Return(b''.join(
+            'STAT {} {}\r\n'.format(*stat).encode('ascii')
+            for stat in handler()
+        ) + b'END\r\n')
+
+    def _stats_general(self):
+        return [
+            ('pid', os.getpid()),
+            ('uptime', int(time.time() - self.started)),
+            ('time', int(time.time())),
+            ('version', VERSION.decode('ascii')),
+            ('curr_items', len(self.items)),
+            ('bytes', sum(len(i[1]) for i in self.items.values())),
+            ('limit_maxbytes', MAXBYTES),
+            ('evictions', 0),
+        ] + sorted(self.counters.items())
+
+    def _stats_settings(self):
+        return [
+            ('maxbytes', MAXBYTES),
+            ('maxconns', 1024),
+            ('evictions', 'on'),
+            ('cas_enabled', 'yes'),
+            ('item_size_max', 1024 * 1024),
+        ]
+
+    def _stats_slabs(self):
+        # every item lives in the one slab class of the stub
+        size = sum(len(i[1]) for i in self.items.values())
+        return [
+            ('1:chunk_size', 96),
+            ('1:used_chunks', len(self.items)),
+            ('active_slabs', 1 if self.items else 0),
+            ('total_malloced', size),
+        ]
+
+    def _stats_items(self):
+        if not self.items:
+            return []
+        now = int(time.time())
+        return [
+            ('items:1:number', len(self.items)),
+            ('items:1:age', now - min(i[4] for i in self.items.values())),
+            ('items:1:evicted', 0),
+        ]
+
+    def _stats_conns(self):
+        stats = []
+        for conn_id, address in sorted(self.connections.items()):
+            if isinstance(address, tuple):
+                address = 'tcp:{}:{}'.format(*address[:2])
+            else:
+                address = 'unix:{}'.format(address)
+            stats.append(('{}:addr'.format(conn_id), address))
+            stats.append(('{}:state'.format(conn_id), 'conn_parse_cmd'))
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11211)
+    parser.add_argument('--unix', help='path of a unix socket to listen at')
+    parser.add_argument(
+        '--latency', type=float, default=0,
+        help='seconds to wait before every reply')
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency)
+    server.listen(args.port, args.host)
+    if args.unix:
+        server.listen_unix(args.unix)
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
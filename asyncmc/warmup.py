@@ -0,0 +1,259 @@
+"""Snapshot of the hot set of the servers and re-warming from it.
+
+A restarted memcached is empty and the database takes the load until
+the cache warms up again. L{HotSet} saves the most recently used items
+of the servers, found with C{lru_crawler metadump}, to a compact local
+file and adds them back to the fresh servers later, hottest first and
+at a limited rate::
+
+    hot_set = HotSet(mc)
+    count = yield hot_set.save('/var/tmp/memcached.snapshot', limit=100000)
+    ...  # the servers restart
+    count = yield hot_set.restore('/var/tmp/memcached.snapshot', rate=5000)
+
+or from the command line::
+
+    $ python -m asyncmc.warmup save --servers 10.0.0.1:11211 hot.snapshot
+    $ python -m asyncmc.warmup restore --rate 5000 hot.snapshot
+
+Items are stored as read, with their flags, and keep their expiration
+time, expired ones are skipped. Restoring uses C{add}, so items written
+since the restart win over the snapshot.
+"""
+import argparse
+import gzip
+import heapq
+import logging
+import os
+import socket
+import struct
+import time
+
+import tornado.ioloop
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from . import constants as const
+from . import protocol
+from .client import Client
+from .exceptions import ClientException, HostOverloadedError
+
+MAGIC = b'asyncmc-snapshot 1\n'
+# key size, flags, expiration unix time or -1, value size
+RECORD = struct.Struct('<HIqI')
+
+
+class HotSet(object):
+    """Saves and restores the hot set of the servers of a client.
+
+    @param client: L{Client} of the servers.
+    @param batch: keys read or added with one command.
+    """
+
+    def __init__(self, client, batch=100):
+        self.client = client
+        self.batch = batch
+
+    @gen.coroutine
+    def save(self, path, limit=10000, servers=None):
+        """Saves the C{limit} most recently used items to a file.
+
+        @param servers: C{"host:port"} of the servers to read, all of
+            them by default.
+        @return: number of the items saved.
+        """
+        conn = yield self.client.pool.acquire()
+        try:
+            hosts = [
+                host for host in conn.hosts
+                if servers is None or str(host) in servers
+            ]
+            dumps = yield [self._hottest(host, limit) for host in hosts]
+            # replicas are dumped by every server holding them
+            newest = {}
+            for host, entries in zip(hosts, dumps):
+                for entry in entries:
+                    if entry.key not in newest or \
+                            newest[entry.key][0].last_access < \
+                            entry.last_access:
+                        newest[entry.key] = (entry, host)
+            chosen = heapq.nlargest(
+                limit, newest.values(), key=lambda e: e[0].last_access)
+
+            by_host = {}
+            for entry, host in chosen:
+                by_host.setdefault(host, []).append(entry.key)
+            values = {}
+            yield [
+                self._fetch(host, keys, values)
+                for host, keys in by_host.items()
+            ]
+        finally:
+            self.client.pool.release(conn)
+
+        count = 0
+        with gzip.open(path + '.tmp', 'wb') as snapshot:
+            snapshot.write(MAGIC)
+            for entry, _ in chosen:
+                item = values.get(entry.key)
+                if item is None:
+                    continue
+                flags, value = item
+                snapshot.write(RECORD.pack(
+                    len(entry.key), flags, entry.exptime, len(value)))
+                snapshot.write(entry.key)
+                snapshot.write(value)
+                count += 1
+        os.rename(path + '.tmp', path)
+        raise gen.Return(count)
+
+    @gen.coroutine
+    def _hottest(self, host, limit):
+        """Most recently used keys of the server, not expired."""
+        now = time.time()
+        heap = []
+
+        def consume(entry):
+            if 0 <= entry.exptime <= now:
+                return
+            if len(heap) < limit:
+                heapq.heappush(heap, (entry.last_access, entry))
+            elif entry.last_access > heap[0][0]:
+                heapq.heapreplace(heap, (entry.last_access, entry))
+
+        try:
+            yield self.client._metadump(host, consume)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            logging.warning('metadump of %s failed: %s', host, e)
+            host.close_socket()
+            raise gen.Return([])
+        raise gen.Return([entry for _, entry in heap])
+
+    @gen.coroutine
+    def _fetch(self, host, keys, values):
+        for start in range(0, len(keys), self.batch):
+            received = yield self.client._fetch_values(
+                host, keys[start:start + self.batch])
+            if received is None:
+                logging.warning('reading the hot set of %s failed', host)
+                return
+            values.update(received)
+
+    @gen.coroutine
+    def restore(self, path, rate=1000):
+        """Adds the items of a snapshot to the servers, hottest first.
+
+        @param rate: items added per second at most.
+        @return: number of the items stored.
+        """
+        loop = tornado.ioloop.IOLoop.current()
+        start = loop.time()
+        sent = 0
+        stored = 0
+        for items in self._read(path):
+            now = time.time()
+            cmds = []
+            for key, flags, exptime, value in items:
+                if 0 <= exptime <= now:
+                    continue
+                # exptime of memcached is a unix time when this big
+                cmds.append((key, protocol.storage_command(
+                    b'add', key, value, flags, max(exptime, 0))))
+            if cmds:
+                count = yield self._add(cmds)
+                stored += count
+            sent += len(items)
+            delay = start + float(sent) / rate - loop.time()
+            if delay > 0:
+                yield gen.sleep(delay)
+        raise gen.Return(stored)
+
+    def _read(self, path):
+        """Batches of C{(key, flags, exptime, value)} of a snapshot."""
+        with gzip.open(path, 'rb') as snapshot:
+            if snapshot.read(len(MAGIC)) != MAGIC:
+                raise ClientException('not a snapshot', path)
+            items = []
+            header = snapshot.read(RECORD.size)
+            while header:
+                key_size, flags, exptime, value_size = RECORD.unpack(header)
+                key = snapshot.read(key_size)
+                items.append((key, flags, exptime, snapshot.read(value_size)))
+                if len(items) == self.batch:
+                    yield items
+                    items = []
+                header = snapshot.read(RECORD.size)
+            if items:
+                yield items
+
+    @gen.coroutine
+    def _add(self, cmds):
+        """Sends the add commands to the replicas of their keys.
+
+        @return: number of the items stored at their first replica.
+        """
+        commands = dict(cmds)
+        conn = yield self.client.pool.acquire()
+        try:
+            def send(host, keys):
+                return self._add_host(
+                    host, [commands[key] for key in keys],
+                    [conn._get_server(key)[0] is host for key in keys])
+
+            # every server gets the keys of all its replicas at once
+            stored = yield self.client._send_many(
+                conn, commands, mirror=False, send=send)
+        finally:
+            self.client.pool.release(conn)
+        raise gen.Return(sum(stored))
+
+    @gen.coroutine
+    def _add_host(self, host, cmds, counted):
+        """Sends the add commands to one server.
+
+        @param counted: whether the server is the first replica of the
+            key, for every command.
+        @return: list of 1 for the counted items stored, 0 else.
+        """
+        try:
+            responses = yield self.client._send_pipelined(host, cmds)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            if not isinstance(e, HostOverloadedError):
+                host.mark_dead(e)
+            logging.warning(
+                'restoring %d items to %s failed: %s', len(cmds), host, e)
+            raise gen.Return([])
+        raise gen.Return([
+            int(count and response == const.STORED)
+            for count, response in zip(counted, responses)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', choices=('save', 'restore'))
+    parser.add_argument('path', help='snapshot file')
+    parser.add_argument(
+        '--servers', default='localhost:11211',
+        help='comma separated servers')
+    parser.add_argument(
+        '--limit', type=int, default=10000, help='items to save')
+    parser.add_argument(
+        '--rate', type=int, default=1000, help='items restored per second')
+    args = parser.parse_args()
+
+    client = Client(servers=args.servers.split(','))
+    hot_set = HotSet(client)
+
+    def run():
+        if args.command == 'save':
+            return hot_set.save(args.path, args.limit)
+        return hot_set.restore(args.path, args.rate)
+
+    count = tornado.ioloop.IOLoop.current().run_sync(run)
+    print('{} {} items'.format(
+        'saved' if args.command == 'save' else 'restored', count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Write-behind queue of cache fills.
+
+L{WriteBehind} takes sets without making the caller wait for the
+server. Values are encoded right away, or in the C{executor} of the
+client at the flush, and kept in a bounded buffer where a newer set of
+the same key replaces the older one; every C{interval} seconds the
+buffer is sent as one pipelined batch of C{noreply} sets per server,
+and to the old servers too during a migration::
+
+    writes = mc.write_behind(interval=0.01, max_items=10000)
+    writes.set(b'user:1', profile, exptime=300)
+    ...
+    yield mc.flush()  # the buffer is sent
+    mc.close()
+
+Nothing tells the caller whether a value made it to the server, use
+it for cache fills which may be lost, not for data which must be there.
+"""
+import logging
+import socket
+from collections import OrderedDict
+
+import tornado.ioloop
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from . import protocol
+from .exceptions import (
+    ClientException, HostOverloadedError, ValidationException)
+
+DROP_NEW = 'drop_new'
+DROP_OLDEST = 'drop_oldest'
+
+
+class WriteBehind(object):
+    """Bounded buffer of sets flushed in batches.
+
+    @param client: L{Client} the sets are flushed through.
+    @param interval: seconds a set may wait in the buffer.
+    @param max_items: number of keys the buffer holds.
+    @param policy: what to do with a set when the buffer is full,
+        C{"drop_new"} drops it and C{"drop_oldest"} drops the set
+        waiting the longest.
+    @ivar dropped: number of sets dropped by the policy or by a failure
+        of their server.
+    @ivar coalesced: number of sets replaced by a newer set of the key.
+    """
+
+    def __init__(self, client, interval=0.01, max_items=10000,
+                 policy=DROP_OLDEST):
+        if policy not in (DROP_NEW, DROP_OLDEST):
+            raise ValidationException('unknown policy', policy)
+        self.client = client
+        self.interval = interval
+        self.max_items = max_items
+        self.policy = policy
+        self.buffer = OrderedDict()
+        self.dropped = 0
+        self.coalesced = 0
+        self._timeout = None
+
+    def set(self, key, value, exptime=0):
+        """Queues a set of the key.
+
+        @return: False if the set was dropped as the buffer is full.
+        """
+        key = self.client._key_type(key=key)
+        if self.client.hot_keys is not None:
+            self.client.hot_keys.discard(key)
+        # validated now rather than failing the whole batch later
+        if self.client.offload is None:
+            value, flags = protocol.encode_value(value)
+            cmd = protocol.storage_command(
+                b'set', key, value, flags, exptime, noreply=True)
+        else:
+            # encoded in the executor at the flush
+            protocol.validate_exptime(exptime)
+            cmd = (value, exptime)
+
+        if key in self.buffer:
+            del self.buffer[key]
+            self.coalesced += 1
+        elif len(self.buffer) >= self.max_items:
+            self.dropped += 1
+            if self.policy == DROP_NEW:
+                return False
+            self.buffer.popitem(last=False)
+        self.buffer[key] = cmd
+
+        if self._timeout is None:
+            loop = tornado.ioloop.IOLoop.current()
+            self._timeout = loop.call_later(self.interval, self._flush)
+        return True
+
+    def _flush(self):
+        self._timeout = None
+        tornado.ioloop.IOLoop.current().spawn_callback(self.flush)
+
+    def stop(self):
+        """Cancels the scheduled flush."""
+        if self._timeout is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._timeout)
+            self._timeout = None
+
+    @gen.coroutine
+    def flush(self):
+        """Sends the buffered sets, one batch per server."""
+        self.stop()
+        buffer, self.buffer = self.buffer, OrderedDict()
+        if not buffer:
+            return
+        cmds = yield self._encode(buffer)
+        if not cmds:
+            return
+        conn = yield self.client.pool.acquire()
+        try:
+            def send(host, keys):
+                return self._send(host, [cmds[key] for key in keys])
+
+            yield self.client._send_many(conn, cmds, noreply=True, send=send)
+        finally:
+            self.client.pool.release(conn)
+
+    @gen.coroutine
+    def _encode(self, buffer):
+        """Set commands of the buffered sets whose values were left to
+        the executor."""
+        cmds = OrderedDict()
+        for key, cmd in buffer.items():
+            if isinstance(cmd, tuple):
+                value, exptime = cmd
+                try:
+                    value, flags = yield self.client.offload.encode(value)
+                except Exception as e:
+                    self.dropped += 1
+                    logging.warning('encoding %r failed: %s', key, e)
+                    continue
+                cmd = protocol.storage_command(
+                    b'set', key, value, flags, exptime, noreply=True)
+            cmds[key] = cmd
+        raise gen.Return(cmds)
+
+    @gen.coroutine
+    def close(self):
+        """Flushes the buffer."""
+        yield self.flush()
+
+    @gen.coroutine
+    def _send(self, host, cmds):
+        try:
+            yield host.send_cmd(b'\r\n'.join(cmds), noreply=True)
+        except (ClientException, StreamClosedError, socket.error) as e:
+            if not isinstance(e, HostOverloadedError):
+                host.mark_dead(e)
+            self.dropped += len(cmds)
+            logging.warning(
+                'write-behind of %d sets to %s failed: %s',
+                len(cmds), host, e)
+        raise gen.Return([])
@@ -0,0 +1,267 @@
+"""Benchmarks of asyncmc.
+
+Every scenario runs a number of concurrent coroutines doing one kind of
+command for a fixed time and reports ops/sec and latency percentiles.
+Without C{--server} a L{StubServer} is started in a separate process::
+
+    $ python benchmarks/bench.py
+    $ python benchmarks/bench.py --server localhost:11211 --op get,set
+    $ python benchmarks/bench.py -o new.json --compare old.json
+    $ python benchmarks/bench.py --client tornado,asyncio
+    $ python benchmarks/bench.py --transport tcp,unix
+
+Results are written as JSON so the runs of two versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tornado  # noqa: E402
+import tornado.ioloop  # noqa: E402
+from tornado import gen  # noqa: E402
+
+import asyncmc  # noqa: E402
+from asyncmc.metrics import clock  # noqa: E402
+
+if sys.version_info >= (3, 5):
+    # asyncmc.aio is async def syntax
+    import bench_aio
+else:
+    bench_aio = None
+
+# op, number of keys, value size
+SCENARIOS = [
+    ('get', 1, 100),
+    ('get', 1, 10000),
+    ('get', 1, 100000),
+    ('set', 1, 100),
+    ('set', 1, 10000),
+    ('set', 1, 100000),
+    ('multi_get', 10, 100),
+    ('multi_get', 100, 100),
+    ('multi_get', 1000, 100),
+]
+CONCURRENCY = [1, 16, 64]
+POOL_SIZES = [1, 15]
+# keys touched by get and set
+KEY_SPACE = 100
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+def start_stub_server(unix_path):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    process = subprocess.Popen([
+        sys.executable, '-m', 'asyncmc.stubserver', '--port', str(port),
+        '--unix', unix_path
+    ], cwd=ROOT)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            break
+        except socket.error:
+            time.sleep(0.05)
+    return process, {
+        'tcp': '127.0.0.1:{}'.format(port),
+        'unix': 'unix:' + unix_path,
+    }
+
+
+@gen.coroutine
+def run_scenario(server, op, keys, value_size, concurrency, pool_size,
+                 duration):
+    mc = asyncmc.Client(servers=[server], pool_size=pool_size)
+    value = b'x' * value_size
+    names = [
+        'bench:{}:{}'.format(value_size, i).encode('ascii')
+        for i in range(max(keys, KEY_SPACE))
+    ]
+    if op != 'set':
+        for name in names:
+            yield mc.set(name, value)
+    batch = names[:keys]
+
+    latencies = []
+    stop_at = clock() + duration
+
+    @gen.coroutine
+    def worker(index):
+        while clock() < stop_at:
+            name = names[index % KEY_SPACE]
+            start = clock()
+            if op == 'get':
+                yield mc.get(name)
+            elif op == 'set':
+                yield mc.set(name, value)
+            else:
+                yield mc.multi_get(*batch)
+            latencies.append(clock() - start)
+            index += concurrency
+
+    start = clock()
+    yield [worker(index) for index in range(concurrency)]
+    seconds = clock() - start
+    mc.close()
+    raise gen.Return(result(
+        'tornado', server, op, keys, value_size, concurrency, pool_size,
+        latencies, seconds))
+
+
+def result(client, server, op, keys, value_size, concurrency, pool_size,
+           latencies, seconds):
+    latencies.sort()
+    transport = 'unix' if server.startswith('unix:') else 'tcp'
+    return {
+        'name': '{}:{}[keys={},size={},c={},pool={}]{}'.format(
+            client, op, keys, value_size, concurrency, pool_size,
+            '@unix' if transport == 'unix' else ''),
+        'client': client,
+        'transport': transport,
+        'op': op,
+        'keys': keys,
+        'value_size': value_size,
+        'concurrency': concurrency,
+        'pool_size': pool_size,
+        'ops': len(latencies),
+        'seconds': seconds,
+        'ops_per_sec': len(latencies) / seconds,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def compare(old, new):
+    old = dict((r['name'], r) for r in old['results'])
+    print('{:<58} {:>12} {:>12} {:>8}'.format(
+        'scenario', 'old ops/s', 'new ops/s', 'change'))
+    for result in new['results']:
+        before = old.get(result['name'])
+        if before is None:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        print('{:<58} {:>12.0f} {:>12.0f} {:>+7.1%}'.format(
+            result['name'], before['ops_per_sec'], result['ops_per_sec'],
+            change))
+
+
+def split(value, cast=str):
+    return [cast(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--server', type=split, default=None,
+        help='comma separated memcached servers (host:port or unix:/path) '
+        'to benchmark one by one instead of the stub server')
+    parser.add_argument(
+        '--transport', type=split, default=['tcp'],
+        help='tcp,unix transports of the stub server')
+    parser.add_argument(
+        '--client', type=split, default=['tornado'], help='tornado,asyncio')
+    parser.add_argument(
+        '--op', type=split, default=None, help='get,set,multi_get')
+    parser.add_argument(
+        '--keys', type=lambda v: split(v, int), default=None,
+        help='multi_get batch sizes')
+    parser.add_argument(
+        '--value-size', type=lambda v: split(v, int), default=None)
+    parser.add_argument(
+        '--concurrency', type=lambda v: split(v, int), default=CONCURRENCY)
+    parser.add_argument(
+        '--pool-size', type=lambda v: split(v, int), default=POOL_SIZES)
+    parser.add_argument(
+        '--duration', type=float, default=1.0,
+        help='seconds every scenario runs')
+    parser.add_argument('-o', '--output', help='file to write results to')
+    parser.add_argument('--compare', help='results of a previous run')
+    args = parser.parse_args()
+    if 'asyncio' in args.client and bench_aio is None:
+        parser.error('the asyncio client needs Python 3.5')
+
+    process = None
+    servers = args.server
+    if servers is None:
+        tmp = tempfile.mkdtemp()
+        process, stub = start_stub_server(os.path.join(tmp, 'stub.sock'))
+        servers = [stub[transport] for transport in args.transport]
+
+    scenarios = [
+        s for s in SCENARIOS
+        if (args.op is None or s[0] in args.op) and
+        (args.keys is None or s[0] != 'multi_get' or s[1] in args.keys) and
+        (args.value_size is None or s[2] in args.value_size)
+    ]
+
+    results = []
+    runs = [
+        (client, server, scenario, concurrency, pool_size)
+        for scenario in scenarios
+        for concurrency in args.concurrency
+        for pool_size in args.pool_size
+        for client in args.client
+        for server in servers
+    ]
+    try:
+        for client, server, (op, keys, size), concurrency, pool_size in runs:
+            scenario_args = (
+                server, op, keys, size, concurrency, pool_size, args.duration)
+            if client == 'asyncio':
+                latencies, seconds = bench_aio.run_scenario(
+                    *scenario_args, key_space=KEY_SPACE)
+                res = result(
+                    'asyncio', server, op, keys, size, concurrency,
+                    pool_size, latencies, seconds)
+            else:
+                res = tornado.ioloop.IOLoop.current().run_sync(
+                    lambda: run_scenario(*scenario_args))
+            sys.stderr.write(
+                '{name:<58} {ops_per_sec:>10.0f} ops/s '
+                'p50 {p50_ms:.3f}ms p99 {p99_ms:.3f}ms\n'.format(**res))
+            results.append(res)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(tmp)
+
+    report = {
+        'time': int(time.time()),
+        'python': platform.python_version(),
+        'tornado': tornado.version,
+        'server': 'stub' if process is not None else ','.join(servers),
+        'duration': args.duration,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Scenario of the asyncio client of L{bench}, async def syntax needs
+Python 3.5."""
+import asyncio
+
+import asyncmc.aio
+from asyncmc.metrics import clock
+
+
+async def _run(server, op, keys, value_size, concurrency, pool_size,
+               duration, key_space):
+    mc = asyncmc.aio.Client(servers=[server], pool_size=pool_size)
+    value = b'x' * value_size
+    names = [
+        'bench:{}:{}'.format(value_size, i).encode('ascii')
+        for i in range(max(keys, key_space))
+    ]
+    if op != 'set':
+        for name in names:
+            await mc.set(name, value)
+    batch = names[:keys]
+
+    latencies = []
+    stop_at = clock() + duration
+
+    async def worker(index):
+        while clock() < stop_at:
+            name = names[index % key_space]
+            start = clock()
+            if op == 'get':
+                await mc.get(name)
+            elif op == 'set':
+                await mc.set(name, value)
+            else:
+                await mc.multi_get(*batch)
+            latencies.append(clock() - start)
+            index += concurrency
+
+    start = clock()
+    await asyncio.gather(*[worker(index) for index in range(concurrency)])
+    seconds = clock() - start
+    mc.close()
+    return latencies, seconds
+
+
+def run_scenario(*args, **kwargs):
+    """Runs the scenario on a new event loop.
+
+    @return: C{(latencies, seconds)} of the commands.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_run(*args, **kwargs))
+    finally:
+        loop.close()
@@ -8,8 +8,7 @@ def read(f):
     return open(os.path.join(os.path.dirname(__file__), f)).read().strip()
 
 install_requires = [
-    'tornado>=4.1',
-    'toro>=0.8'
+    'tornado>=4.2',
 ]
 
 setup(name='asyncmc',
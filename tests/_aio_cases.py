@@ -0,0 +1,150 @@
+"""Tests of asyncmc.aio, imported by test_aio on Python 3.5+ as they
+are async def syntax."""
+import asyncio
+import socket
+import subprocess
+import sys
+import unittest
+from functools import wraps
+
+from asyncmc import constants as const
+from asyncmc.aio import Client
+from asyncmc.exceptions import (ClientException, ConnectionDeadError,
+                                ValidationException)
+
+
+def run_until_complete(fun):
+
+    @wraps(fun)
+    def wrapper(test, *args, **kw):
+        test.loop.run_until_complete(fun(test, *args, **kw))
+    return wrapper
+
+
+async def wait_listening(server, timeout=5):
+    """Waits for a server started in a subprocess to accept
+    connections."""
+    host, port = server.rsplit(':', 1)
+    deadline = asyncio.get_event_loop().time() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, int(port))
+        except OSError:
+            if asyncio.get_event_loop().time() > deadline:
+                raise
+            await asyncio.sleep(0.01)
+        else:
+            writer.close()
+            return
+
+
+class AioClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.mcache = Client(servers=['localhost:11211'])
+        self.loop.run_until_complete(self.mcache.flush_all())
+
+    def tearDown(self):
+        self.mcache.close()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    @run_until_complete
+    async def test_set_get(self):
+        values = [b'1', 'str', 42, True, {'a': [1, 2]}, set([1, 2])]
+        for index, value in enumerate(values):
+            key = 'key:aio:{}'.format(index)
+            self.assertTrue(await self.mcache.set(key, value))
+            self.assertEqual(await self.mcache.get(key), value)
+        self.assertEqual(await self.mcache.get(b'not:key:aio', 1), 1)
+        self.assertTrue(await self.mcache.set(b'key:aio', b'1', noreply=True))
+        self.assertEqual(await self.mcache.get(b'key:aio'), b'1')
+
+    @run_until_complete
+    async def test_storage(self):
+        key = b'key:aio:storage'
+        self.assertTrue(await self.mcache.add(key, 'a'))
+        self.assertFalse(await self.mcache.add(key, 'b'))
+        self.assertTrue(await self.mcache.replace(key, 'b'))
+        self.assertFalse(await self.mcache.replace(b'not:' + key, 'b'))
+        self.assertTrue(await self.mcache.append(key, 'c'))
+        self.assertTrue(await self.mcache.prepend(key, 'a'))
+        self.assertEqual(await self.mcache.get(key), 'abc')
+
+        self.assertTrue(await self.mcache.set(key, [1]))
+        self.assertTrue(await self.mcache.append(key, [2]))
+        self.assertEqual(await self.mcache.get(key), [1, 2])
+
+        self.assertTrue(await self.mcache.delete(key))
+        self.assertFalse(await self.mcache.delete(key))
+
+    @run_until_complete
+    async def test_incr_decr(self):
+        key = b'key:aio:counter'
+        await self.mcache.set(key, 1)
+        self.assertEqual(await self.mcache.incr(key, 10), 11)
+        self.assertEqual(await self.mcache.decr(key), 10)
+        with self.assertRaises(ClientException):
+            await self.mcache.incr(b'not:' + key)
+
+    @run_until_complete
+    async def test_multi_get(self):
+        await self.mcache.set(b'key:aio:1', b'1')
+        await self.mcache.set(b'key:aio:2', 2)
+        values = await self.mcache.multi_get(
+            b'key:aio:1', 'not:key:aio', 'key:aio:2')
+        self.assertEqual(values, [b'1', None, 2])
+        self.assertEqual(values.cut_off, [])
+        self.assertEqual(await self.mcache.multi_get(), [])
+        with self.assertRaises(ClientException):
+            await self.mcache.multi_get(b'key:aio:1', b'key:aio:1')
+
+        values = await self.mcache.multi_get(
+            b'key:aio:1', 'key:aio:2', lazy=True)
+        self.assertEqual([v.value for v in values], [b'1', 2])
+        values = await self.mcache.multi_get(b'key:aio:2', raw=True)
+        self.assertEqual(values, [(b'2', const.FLAG_INTEGER)])
+
+    @run_until_complete
+    async def test_multi_get_deadline(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        slow_server = '127.0.0.1:{}'.format(sock.getsockname()[1])
+        sock.close()
+        slow = subprocess.Popen([
+            sys.executable, '-m', 'asyncmc.stubserver', '--latency', '0.5',
+            '--port', slow_server.split(':')[1]
+        ])
+        self.addCleanup(slow.wait)
+        self.addCleanup(slow.terminate)
+        await wait_listening(slow_server)
+        mcache = Client(servers=['localhost:11211', slow_server])
+        await mcache.set(b'key:multi_get:1', b'1')
+
+        # key:multi_get:2 is stored at the slow server
+        values = await mcache.multi_get(
+            b'key:multi_get:1', b'key:multi_get:2', deadline=0.1)
+        self.assertEqual(values, [b'1', None])
+        self.assertEqual(values.cut_off, [slow_server])
+        mcache.close()
+
+    @run_until_complete
+    async def test_dead_host(self):
+        mcache = Client(servers=['localhost:1'])
+        with self.assertRaises(ConnectionDeadError):
+            await mcache.get(b'key')
+
+    def test_weights(self):
+        mcache = Client(servers=['localhost:11211:1', ('[::1]:11211', 1)])
+        self.assertEqual([str(host) for host in mcache.hosts],
+                         ['localhost:11211', '::1:11211'])
+        with self.assertRaises(ValidationException):
+            Client(servers=['localhost:11211:2'])
+
+    @run_until_complete
+    async def test_version(self):
+        version = await self.mcache.version()
+        stats = await self.mcache.stats()
+        self.assertEqual(version, stats[b'version'].split()[0])
@@ -0,0 +1,16 @@
+"""Helper of test_scan, async for syntax needs Python 3.5."""
+from tornado import gen
+
+
+@gen.coroutine
+def collect(scan, limit=None):
+    async def run():
+        infos = []
+        async for info in scan:
+            infos.append(info)
+            if limit is not None and len(infos) == limit:
+                scan.close()
+                break
+        return infos
+    infos = yield gen.convert_yielded(run())
+    raise gen.Return(infos)
@@ -0,0 +1,90 @@
+from asyncmc.admission import HostLimit
+from asyncmc.client import Client
+from asyncmc.exceptions import HostOverloadedError
+from asyncmc.metrics import Stats
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+class HostLimitTest(BaseTest):
+
+    @run_until_complete
+    def test_limit(self):
+        limit = HostLimit('server', 1, max_waiting=1, wait_timeout=0.05)
+        yield limit.acquire()
+        waiting = limit.acquire()
+        self.assertEqual(limit.waiting, 1)
+        with self.assertRaises(HostOverloadedError):
+            limit.acquire()
+        self.assertEqual(limit.shed, 1)
+
+        # the slot goes to the waiter
+        limit.release()
+        yield waiting
+        self.assertEqual((limit.in_flight, limit.waiting), (1, 0))
+
+        waiting = limit.acquire()
+        with self.assertRaises(HostOverloadedError):
+            yield waiting
+        self.assertEqual((limit.in_flight, limit.waiting), (1, 0))
+        self.assertEqual(limit.shed, 2)
+        limit.release()
+        self.assertEqual(limit.in_flight, 0)
+
+
+class AdmissionTest(BaseTest):
+
+    def setUp(self):
+        super(AdmissionTest, self).setUp()
+        self.stub = StubServer(latency=0.1)
+        self.stats = Stats()
+        self.mcache = Client(
+            servers=['127.0.0.1:{}'.format(self.stub.listen_free())],
+            host_max_in_flight=1, metrics=self.stats)
+
+    def tearDown(self):
+        self.mcache.close()
+        self.stub.stop()
+        super(AdmissionTest, self).tearDown()
+
+    @run_until_complete
+    def test_shed(self):
+        yield self.mcache.set(b'admission', b'1')
+        first = self.mcache.get(b'admission')
+        second = self.mcache.get(b'admission')
+        # shed reads are misses
+        test_value = yield second
+        self.assertIsNone(test_value)
+        with self.assertRaises(HostOverloadedError):
+            yield self.mcache.set(b'admission', b'2')
+        test_value = yield first
+        self.assertEqual(test_value, b'1')
+
+        test_value = yield self.mcache.get(b'admission')
+        self.assertEqual(test_value, b'1')
+        self.assertEqual(
+            self.stats.snapshot()['shed'], {self.mcache.pool.servers[0]: 2})
+        self.assertEqual(self.stats.dead, {})
+
+    @run_until_complete
+    def test_wait(self):
+        mcache = Client(
+            servers=self.mcache.pool.servers, host_max_in_flight=1,
+            host_max_waiting=1, host_wait_timeout=1)
+        yield mcache.set(b'admission', b'1')
+        first = mcache.get(b'admission')
+        # waits for the first get to read its reply
+        test_value = yield mcache.get(b'admission')
+        self.assertEqual(test_value, b'1')
+        test_value = yield first
+        self.assertEqual(test_value, b'1')
+
+        # the slot is given back with the reply, not with the connection
+        conn = yield mcache.pool.acquire()
+        host = conn.hosts[0]
+        yield host.send_cmd(b'version')
+        self.assertEqual(host.limit.in_flight, 0)
+        test_value = yield mcache.get(b'admission')
+        self.assertEqual(test_value, b'1')
+        mcache.pool.release(conn)
+        mcache.close()
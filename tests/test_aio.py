@@ -0,0 +1,6 @@
+import sys
+
+if sys.version_info >= (3, 5):
+    # async def syntax
+    from ._aio_cases import AioClientTest
+    __all__ = ['AioClientTest']
@@ -0,0 +1,98 @@
+import time
+
+from tornado import gen
+
+from asyncmc.client import Client
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+class CachedTest(BaseTest):
+
+    def setUp(self):
+        super(CachedTest, self).setUp()
+        self.stub = StubServer()
+        self.mcache = Client(
+            servers=['127.0.0.1:{}'.format(self.stub.listen_free())])
+
+    def tearDown(self):
+        self.mcache.close()
+        self.stub.stop()
+        super(CachedTest, self).tearDown()
+
+    @run_until_complete
+    def test_cached(self):
+        calls = []
+
+        @self.mcache.cached(lambda name: 'cached:' + name, exptime=60)
+        @gen.coroutine
+        def load(name):
+            calls.append(name)
+            raise gen.Return(None if name == 'none' else name.upper())
+
+        test_value = yield load('a')
+        self.assertEqual(test_value, 'A')
+        yield gen.sleep(0.01)
+        test_value = yield load('a')
+        self.assertEqual(test_value, 'A')
+        self.assertEqual(calls, ['a'])
+
+        # None is cached as well
+        yield load('none')
+        yield gen.sleep(0.01)
+        test_value = yield load('none')
+        self.assertIsNone(test_value)
+        self.assertEqual(calls, ['a', 'none'])
+
+    @run_until_complete
+    def test_cached_many(self):
+        calls = []
+
+        @self.mcache.cached_many(lambda id_: 'many:{}'.format(id_))
+        @gen.coroutine
+        def load(ids):
+            calls.append(ids)
+            # 3 does not exist
+            raise gen.Return(dict((i, i * 10) for i in ids if i != 3))
+
+        yield self.mcache.set(b'many:1', 'cached')
+        test_value = yield load([1, 2, 3])
+        self.assertEqual(test_value, {1: 'cached', 2: 20})
+        self.assertEqual(calls, [[2, 3]])
+        yield gen.sleep(0.01)
+
+        test_value = yield load([1, 2])
+        self.assertEqual(test_value, {1: 'cached', 2: 20})
+        self.assertEqual(calls, [[2, 3]])
+        # one get of every key for each call
+        self.assertEqual(self.stub.counters['cmd_get'], 5)
+
+    @run_until_complete
+    def test_jitter(self):
+
+        @self.mcache.cached_many(str, exptime=100, jitter=50)
+        @gen.coroutine
+        def load(ids):
+            raise gen.Return(dict((i, i) for i in ids))
+
+        yield load(range(20))
+        yield gen.sleep(0.01)
+        now = time.time()
+        expires = [self.stub.items[str(i).encode()][2] for i in range(20)]
+        for expire in expires:
+            self.assertTrue(now + 90 < expire < now + 151)
+        # every value is jittered on its own
+        self.assertGreater(
+            len(set(round(expire - now) for expire in expires)), 1)
+
+    @run_until_complete
+    def test_server_down(self):
+        self.stub.stop()
+
+        @self.mcache.cached(str)
+        @gen.coroutine
+        def load(value):
+            raise gen.Return(value * 2)
+
+        test_value = yield load(21)
+        self.assertEqual(test_value, 42)
@@ -1,9 +1,13 @@
 # -*- coding:utf-8 -*-
+import tempfile
+import time
 from time import sleep
 from tornado import gen
 
+from asyncmc import constants as const
 from asyncmc.client import Client
 from asyncmc.exceptions import ClientException, ValidationException
+from asyncmc.stubserver import StubServer
 from ._testutil import BaseTest, run_until_complete
 
 
@@ -408,6 +412,49 @@ class ConnectionCommandsTest(BaseTest):
         test_value = yield self.mcache.multi_get()
         self.assertEqual(test_value, [])
 
+    @run_until_complete
+    def test_multi_get_lazy(self):
+        key1, key2 = b'key:multi_get:lazy:1', b'key:multi_get:lazy:2'
+        yield self.mcache.set(key1, {'a': 1})
+        yield self.mcache.set(key2, 'text')
+        test_value = yield self.mcache.multi_get(
+            key1, b'not' + key1, key2, lazy=True)
+        self.assertIsNone(test_value[1])
+        self.assertEqual(test_value[0].data, b'{"a": 1}')
+        self.assertEqual(test_value[0].value, {'a': 1})
+        self.assertIs(test_value[0].value, test_value[0].value)
+        self.assertEqual(test_value[2].value, 'text')
+
+        test_value = yield self.mcache.multi_get(key1, key2, raw=True)
+        self.assertEqual(test_value, [
+            (b'{"a": 1}', const.FLAG_JSON), (b'text', const.FLAG_STRING)])
+
+    @run_until_complete
+    def test_multi_get_deadline(self):
+        key1, value1 = b'key:multi_get:1', b'1'
+        key2, value2 = b'key:multi_get:2', b'2'
+        yield self.mcache.set(key1, value1)
+        yield self.mcache.set(key2, value2)
+        test_value = yield self.mcache.multi_get(key1, key2, deadline=5)
+        self.assertEqual(test_value, [value1, value2])
+        self.assertEqual(test_value.cut_off, [])
+
+        slow = StubServer(latency=0.5)
+        slow_server = '127.0.0.1:{}'.format(slow.listen_free())
+        mcache = Client(servers=['localhost:11211', slow_server])
+        yield mcache.set(key1, value1)
+        yield mcache.set(key2, value2)
+        # key2 is stored at the slow server
+        test_value = yield mcache.multi_get(key1, key2, deadline=0.1)
+        self.assertEqual(test_value, [value1, None])
+        self.assertEqual(test_value.cut_off, [slow_server])
+
+        # dropped connection is reopened by the next command
+        test_value = yield mcache.multi_get(key1, key2)
+        self.assertEqual(test_value, [value1, value2])
+        mcache.close()
+        slow.stop()
+
     @run_until_complete
     def test_incr(self):
         key = b'key1'
@@ -423,3 +470,289 @@ class ConnectionCommandsTest(BaseTest):
         yield self.mcache.decr(key)
         found_value = int((yield self.mcache.get(key)))
         self.assertEqual(found_value, 1)
+
+    @run_until_complete
+    def test_replicas(self):
+        stubs = [StubServer(), StubServer()]
+        servers = ['127.0.0.1:{}'.format(s.listen_free()) for s in stubs]
+        mcache = Client(servers=servers, replicas=2)
+        key, value = b'key:replicas', b'1'
+        yield mcache.set(key, value)
+        self.assertEqual([key in s.items for s in stubs], [True, True])
+
+        # a miss at the primary is read from the replica
+        conn = yield mcache.pool.acquire()
+        primary = servers.index(str(conn.get_replicas(key)[0]))
+        mcache.pool.release(conn)
+        del stubs[primary].items[key]
+        test_value = yield mcache.multi_get(key, b'not:' + key)
+        self.assertEqual(test_value, [value, None])
+
+        # and so are the keys of a dead server
+        yield mcache.set(key, value)
+        stubs[primary].stop()
+        mcache.close()
+        test_value = yield mcache.get(key)
+        self.assertEqual(test_value, value)
+        is_deleted = yield mcache.delete(key)
+        self.assertTrue(is_deleted)
+        mcache.close()
+        stubs[1 - primary].stop()
+
+    @run_until_complete
+    def test_hedged_get(self):
+        slow, fast = StubServer(latency=0.5), StubServer()
+        servers = [
+            '127.0.0.1:{}'.format(slow.listen_free()),
+            '127.0.0.1:{}'.format(fast.listen_free()),
+        ]
+        mcache = Client(servers=servers, replicas=2, hedge_after=0.05)
+        conn = yield mcache.pool.acquire()
+        key = next(
+            k for k in (b'key:hedge:' + str(i).encode() for i in range(10))
+            if str(conn.get_replicas(k)[0]) == servers[0])
+        mcache.pool.release(conn)
+        yield mcache.set(key, b'1')
+
+        start = self.loop.time()
+        test_value = yield mcache.get(key)
+        self.assertEqual(test_value, b'1')
+        self.assertLess(self.loop.time() - start, 0.4)
+        self.assertEqual((mcache.hedge.hedged, mcache.hedge.won), (1, 1))
+
+        # the socket of the slow server was dropped and is reopened
+        test_value = yield mcache.multi_get(key, b'not:' + key)
+        self.assertEqual(test_value, [b'1', None])
+        mcache.close()
+        slow.stop()
+        fast.stop()
+
+    @run_until_complete
+    def test_hedged_multi_get(self):
+        # every server is the replica of the other one and answers late
+        stubs = [StubServer(latency=0.2), StubServer(latency=0.2)]
+        servers = [
+            '127.0.0.1:{}'.format(stub.listen_free()) for stub in stubs]
+        mcache = Client(servers=servers, replicas=2, hedge_after=0.05)
+        conn = yield mcache.pool.acquire()
+        keys = [
+            next(k for k in (b'key:' + str(i).encode() for i in range(20))
+                 if str(conn.get_replicas(k)[0]) == server)
+            for server in servers]
+        mcache.pool.release(conn)
+        for stub in stubs:
+            stub.latency = 0
+        for key in keys:
+            yield mcache.set(key, key)
+        for stub in stubs:
+            stub.latency = 0.2
+
+        test_value = yield mcache.multi_get(*keys)
+        self.assertEqual(test_value, keys)
+        self.assertEqual(mcache.hedge.hedged, 2)
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_hedged_multi_get_replicas(self):
+        stubs = [StubServer(), StubServer(), StubServer()]
+        servers = [
+            '127.0.0.1:{}'.format(stub.listen_free()) for stub in stubs]
+        mcache = Client(
+            servers=servers, replicas=2, hedge_after=0.05,
+            distribution='ketama')
+        conn = yield mcache.pool.acquire()
+        keys = [
+            k for k in (b'key:' + str(i).encode() for i in range(200))
+            if str(conn.get_replicas(k)[0]) == servers[0]]
+        replicas = set(str(conn.get_replicas(k)[1]) for k in keys)
+        mcache.pool.release(conn)
+        # the hedged keys have replicas at both of the other servers
+        self.assertEqual(replicas, set(servers[1:]))
+        for key in keys:
+            yield mcache.set(key, key)
+        stubs[0].latency = 0.5
+
+        start = self.loop.time()
+        test_value = yield mcache.multi_get(*keys)
+        self.assertEqual(test_value, keys)
+        self.assertLess(self.loop.time() - start, 0.4)
+        self.assertEqual((mcache.hedge.hedged, mcache.hedge.won), (1, 1))
+        # every key was read from its own replica
+        for stub in stubs[1:]:
+            self.assertEqual(stub.counters['get_misses'], 0)
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_update_servers(self):
+        stubs = [StubServer(), StubServer()]
+        servers = ['127.0.0.1:{}'.format(s.listen_free()) for s in stubs]
+        mcache = Client(servers=servers[:1], distribution='ketama')
+        yield mcache.set(b'key:update', b'1')
+        conn = yield mcache.pool.acquire()
+        first = conn.hosts[0]
+        mcache.pool.release(conn)
+
+        mcache.update_servers(servers)
+        conn = yield mcache.pool.acquire()
+        self.assertEqual([str(h) for h in conn.hosts], servers)
+        # the socket to the server which stays is kept
+        self.assertIs(conn.hosts[0], first)
+        self.assertIsNotNone(first.sock)
+
+        mcache.update_servers(servers[1:])
+        # the connection in use keeps its servers until released
+        self.assertEqual(len(conn.hosts), 2)
+        mcache.pool.release(conn)
+        self.assertEqual([str(h) for h in conn.hosts], servers[1:])
+        self.assertIsNone(first.sock)
+        test_value = yield mcache.get(b'key:update')
+        self.assertEqual(test_value, None)
+        mcache.close()
+
+        callback = mcache.watch_servers(lambda: servers, interval=0.01)
+        yield gen.sleep(0.05)
+        callback.stop()
+        self.assertEqual(mcache.pool.servers, servers)
+
+        with tempfile.NamedTemporaryFile('w') as f:
+            f.write('# memcached\n\n{}\n'.format(servers[0]))
+            f.flush()
+            callback = mcache.watch_servers(f.name, interval=0.01)
+            yield gen.sleep(0.05)
+            callback.stop()
+        self.assertEqual(mcache.pool.servers, servers[:1])
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_migrate(self):
+        old, new = StubServer(), StubServer()
+        old_server = '127.0.0.1:{}'.format(old.listen_free())
+        new_server = '127.0.0.1:{}'.format(new.listen_free())
+        mcache = Client(servers=[old_server])
+        yield mcache.set(b'key:migrate:1', b'1')
+        mcache.migrate([new_server], window=60)
+
+        # a miss at the new server is read from the old one and copied
+        test_value = yield mcache.multi_get(
+            b'key:migrate:1', b'key:migrate:2')
+        self.assertEqual(test_value, [b'1', None])
+        yield gen.sleep(0.01)
+        self.assertEqual(new.items[b'key:migrate:1'][1], b'1')
+        # the copy expires with the window
+        expires = new.items[b'key:migrate:1'][2]
+        self.assertTrue(time.time() + 50 < expires <= time.time() + 60)
+
+        # writes go to both
+        yield mcache.set(b'key:migrate:2', b'2')
+        self.assertIn(b'key:migrate:2', old.items)
+        self.assertIn(b'key:migrate:2', new.items)
+        test_value = yield mcache.set_many({b'key:migrate:4': b'4'})
+        self.assertTrue(test_value)
+        self.assertIn(b'key:migrate:4', old.items)
+        self.assertIn(b'key:migrate:4', new.items)
+        is_deleted = yield mcache.delete(b'key:migrate:1')
+        self.assertTrue(is_deleted)
+        self.assertNotIn(b'key:migrate:1', old.items)
+        self.assertNotIn(b'key:migrate:1', new.items)
+        test_value = yield mcache.delete_many([b'key:migrate:2'])
+        self.assertTrue(test_value)
+        self.assertNotIn(b'key:migrate:2', old.items)
+        self.assertNotIn(b'key:migrate:2', new.items)
+
+        # and the old server is left alone after the window
+        mcache.migration_ends = self.loop.time()
+        yield mcache.set(b'key:migrate:3', b'3')
+        self.assertNotIn(b'key:migrate:3', old.items)
+        self.assertIsNone(mcache.migration)
+        mcache.close()
+        old.stop()
+        new.stop()
+
+    @run_until_complete
+    def test_migrate_backfill_replicas(self):
+        old = StubServer()
+        old_server = '127.0.0.1:{}'.format(old.listen_free())
+        stubs = [StubServer(), StubServer()]
+        servers = ['127.0.0.1:{}'.format(s.listen_free()) for s in stubs]
+        mcache = Client(servers=[old_server], replicas=2)
+        keys = [b'key:backfill:%d' % i for i in range(10)]
+        yield mcache.set_many(dict((key, key) for key in keys))
+        mcache.migrate(servers, window=60)
+
+        # every miss is copied to both replicas
+        test_value = yield mcache.multi_get(*keys)
+        self.assertEqual(test_value, keys)
+        yield gen.sleep(0.01)
+        for stub in stubs:
+            self.assertEqual(sorted(stub.items), keys)
+        mcache.close()
+        old.stop()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_set_delete_many_replicas(self):
+        stubs = [StubServer(), StubServer()]
+        servers = ['127.0.0.1:{}'.format(s.listen_free()) for s in stubs]
+        mcache = Client(servers=servers, replicas=2)
+        keys = [b'key:replicas:' + str(i).encode() for i in range(10)]
+        # every server holds first and second replicas of the keys
+        test_value = yield mcache.set_many(dict((key, b'1') for key in keys))
+        self.assertTrue(test_value)
+        for stub in stubs:
+            self.assertEqual(len(stub.items), len(keys))
+        test_value = yield mcache.delete_many(keys)
+        self.assertTrue(test_value)
+        for stub in stubs:
+            self.assertEqual(stub.items, {})
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_cluster_stats(self):
+        stubs = [StubServer(), StubServer()]
+        servers = ['127.0.0.1:{}'.format(s.listen_free()) for s in stubs]
+        mcache = Client(servers=servers)
+        stats = yield mcache.cluster_stats()
+        self.assertEqual(sorted(stats['hosts']), sorted(servers))
+        self.assertNotIn('cmd_get_per_sec', stats['totals'])
+
+        yield mcache.set(b'key:stats', b'1')
+        yield mcache.multi_get(b'key:stats', b'not:key:stats')
+        stats = yield mcache.cluster_stats()
+        totals = stats['totals']
+        self.assertEqual(totals['servers'], 2)
+        self.assertEqual((totals['get_hits'], totals['get_misses']), (1, 1))
+        self.assertEqual(totals['hit_ratio'], 0.5)
+        self.assertGreater(totals['cmd_get_per_sec'], 0)
+        self.assertEqual(totals['evictions_per_sec'], 0)
+        self.assertIsInstance(
+            stats['hosts'][servers[0]]['version'], type(u''))
+
+        stats = yield mcache.cluster_stats(b'settings')
+        self.assertEqual(stats['hosts'][servers[0]]['maxconns'], 1024)
+        self.assertNotIn('totals', stats)
+        stats = yield mcache.cluster_stats(b'items')
+        self.assertEqual(
+            sum(h[1]['number'] for h in stats['hosts'].values() if h), 1)
+        stats = yield mcache.cluster_stats(b'slabs')
+        self.assertEqual(stats['hosts'][servers[0]][1]['chunk_size'], 96)
+        stats = yield mcache.cluster_stats(b'conns')
+        self.assertEqual(
+            stats['hosts'][servers[0]][1]['state'], u'conn_parse_cmd')
+
+        stubs[1].stop()
+        mcache.close()
+        yield gen.sleep(0.01)
+        stats = yield mcache.cluster_stats()
+        self.assertIsNone(stats['hosts'][servers[1]])
+        self.assertEqual(stats['totals']['servers'], 1)
+        mcache.close()
+        stubs[0].stop()
@@ -0,0 +1,102 @@
+from asyncmc.client import Client
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+class CounterAggregatorTest(BaseTest):
+
+    def setUp(self):
+        super(CounterAggregatorTest, self).setUp()
+        self.stub = StubServer()
+        self.mcache = Client(
+            servers=['127.0.0.1:{}'.format(self.stub.listen_free())])
+
+    def tearDown(self):
+        self.mcache.close()
+        self.stub.stop()
+        super(CounterAggregatorTest, self).tearDown()
+
+    @run_until_complete
+    def test_flush(self):
+        counters = self.mcache.counters(interval=60)
+        yield self.mcache.set(b'counter:a', 10)
+        for i in range(1000):
+            counters.incr(b'counter:a')
+            counters.incr(b'counter:b', 2)
+        counters.decr(b'counter:c', 5)
+        self.assertEqual(self.stub.items[b'counter:a'][1], b'10')
+
+        yield counters.flush()
+        test_value = yield self.mcache.multi_get(
+            b'counter:a', b'counter:b', b'counter:c')
+        # missing counters are created, decr stops at zero
+        self.assertEqual(test_value, [1010, 2000, 0])
+        self.assertEqual(counters.pending, {})
+
+        counters.incr(b'counter:b')
+        yield self.mcache.flush()
+        test_value = yield self.mcache.get(b'counter:b')
+        self.assertEqual(test_value, 2001)
+        # close does not wait and stops the timer
+        self.mcache.close()
+        self.assertIsNone(counters._callback)
+
+    @run_until_complete
+    def test_max_keys(self):
+        counters = self.mcache.counters(interval=60, max_keys=2)
+        counters.incr(b'counter:d')
+        counters.incr(b'counter:e')
+        self.assertEqual(len(counters.pending), 2)
+        yield self.mcache.get(b'counter:d')
+        self.assertEqual(counters.pending, {})
+        test_value = yield self.mcache.get(b'counter:e')
+        self.assertEqual(test_value, 1)
+        yield self.mcache.flush()
+
+    @run_until_complete
+    def test_dead_server(self):
+        mcache = Client(servers=['some_host:1233123'])
+        counters = mcache.counters(interval=60)
+        counters.incr(b'counter:f', 3)
+        yield counters.flush()
+        # nothing was sent, so the increment waits for the next flush
+        self.assertEqual(counters.pending, {b'counter:f': 3})
+        counters.stop()
+
+    @run_until_complete
+    def test_replicas(self):
+        stubs = [StubServer(), StubServer()]
+        mcache = Client(
+            servers=['127.0.0.1:{}'.format(s.listen_free()) for s in stubs],
+            replicas=2)
+        counters = mcache.counters(interval=60)
+        keys = [b'counter:r:' + str(i).encode('ascii') for i in range(10)]
+        for key in keys:
+            counters.incr(key, 2)
+        # the adds of the missing counters, then the incrs
+        yield counters.flush()
+        for key in keys:
+            counters.incr(key)
+        yield counters.flush()
+        for stub in stubs:
+            self.assertEqual(
+                sorted(stub.items), sorted(keys))
+        test_value = yield mcache.multi_get(*keys)
+        self.assertEqual(test_value, [3] * len(keys))
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_migrate(self):
+        new = StubServer()
+        yield self.mcache.set(b'counter:m', 1)
+        self.mcache.migrate(['127.0.0.1:{}'.format(new.listen_free())])
+        counters = self.mcache.counters(interval=60)
+        counters.incr(b'counter:m', 5)
+        yield counters.flush()
+        # the old server does not keep a stale counter
+        self.assertEqual(self.stub.items[b'counter:m'][1], b'6')
+        self.assertIn(b'counter:m', new.items)
+        self.mcache.close()
+        new.stop()
@@ -0,0 +1,63 @@
+from collections import Counter
+
+from asyncmc.distribution import Ketama, Modulo, parse_weight
+from asyncmc.exceptions import ValidationException
+from asyncmc.pool import Connection
+from asyncmc.protocol import server_hash
+from ._testutil import BaseTest
+
+KEYS = [b'key:' + str(i).encode('ascii') for i in range(10000)]
+NAMES = ['10.0.0.1:11211', '10.0.0.2:11211', '10.0.0.3:11212']
+
+
+class DistributionTest(BaseTest):
+
+    def test_parse_weight(self):
+        self.assertEqual(parse_weight('host:11211'), ('host:11211', 1))
+        self.assertEqual(parse_weight('host:11211:3'), ('host:11211', 3))
+        self.assertEqual(parse_weight('[::1]:11211'), ('[::1]:11211', 1))
+        self.assertEqual(parse_weight('[::1]:11211:2'), ('[::1]:11211', 2))
+        self.assertEqual(parse_weight(('unix:/a:1', 4)), ('unix:/a:1', 4))
+        self.assertEqual(parse_weight('unix:/a:1'), ('unix:/a:1', 1))
+        self.assertRaises(ValidationException, parse_weight, ('host', 0))
+
+    def test_modulo(self):
+        modulo = Modulo([1, 1, 1])
+        for key in KEYS[:100]:
+            self.assertEqual(modulo.index(key), server_hash(key) % 3)
+            self.assertEqual(modulo.index(key, 1), (server_hash(key) + 1) % 3)
+        modulo = Modulo([1, 3])
+        for key in KEYS[:100]:
+            self.assertNotEqual(modulo.index(key), modulo.index(key, 1))
+
+    def test_ketama_weights(self):
+        ring = Ketama(NAMES, [1, 1, 2])
+        shares = Counter(ring.index(key) for key in KEYS)
+        for index, share in ((0, 0.25), (1, 0.25), (2, 0.5)):
+            self.assertAlmostEqual(
+                shares[index] / float(len(KEYS)), share, delta=0.05)
+        for key in KEYS[:100]:
+            self.assertEqual(
+                len(set(ring.index(key, r) for r in range(3))), 3)
+
+    def test_ketama_stable(self):
+        before = Ketama(NAMES, [1, 1, 1])
+        after = Ketama(NAMES, [1, 1, 2])
+        moved = sum(
+            before.index(key) != after.index(key) for key in KEYS)
+        # only the keys taken over by the third server move
+        self.assertLess(moved / float(len(KEYS)), 0.25)
+        moved_away = sum(
+            before.index(key) == 2 and after.index(key) != 2 for key in KEYS)
+        self.assertEqual(moved_away, 0)
+
+    def test_connection(self):
+        # weights do not change the distribution
+        conn = Connection(['localhost:11211:1', 'localhost:11212:3'])
+        self.assertIsInstance(conn.distribution, Modulo)
+        self.assertEqual(
+            [str(h) for h in conn.hosts],
+            ['localhost:11211', 'localhost:11212'])
+        conn = Connection(
+            ['localhost:11211', 'localhost:11212'], distribution='ketama')
+        self.assertIsInstance(conn.distribution, Ketama)
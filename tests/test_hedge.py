@@ -0,0 +1,22 @@
+from asyncmc.hedge import HedgePolicy
+from ._testutil import BaseTest
+
+
+class HedgePolicyTest(BaseTest):
+
+    def test_fixed_delay(self):
+        self.assertEqual(HedgePolicy().delay(), None)
+        self.assertEqual(HedgePolicy(delay=0.01).delay(), 0.01)
+
+    def test_percentile(self):
+        hedge = HedgePolicy(delay=0.5, percentile=90, window=100)
+        for i in range(99):
+            hedge.observe(0.001)
+        # not enough samples yet
+        self.assertEqual(hedge.delay(), 0.5)
+        hedge.observe(0.1)
+        self.assertTrue(0.001 <= hedge.delay() < 0.01)
+
+        for i in range(100):
+            hedge.observe(0.05)
+        self.assertTrue(0.05 <= hedge.delay() <= 0.1)
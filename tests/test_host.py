@@ -1,7 +1,26 @@
+import os
+import shutil
+import socket
+import tempfile
+
+from asyncmc.client import Client
+from asyncmc.host import SocketOptions
 from asyncmc.pool import Connection
+from asyncmc.stubserver import StubServer
 from ._testutil import BaseTest, run_until_complete
 
 
+class RecordingSocket(object):
+    """Socket of a family recording the options set on it."""
+
+    def __init__(self, family):
+        self.family = family
+        self.options = []
+
+    def setsockopt(self, level, option, value):
+        self.options.append((level, option, value))
+
+
 class HostTests(BaseTest):
     def setUp(self):
         super(HostTests, self).setUp()
@@ -22,3 +41,57 @@ class HostTests(BaseTest):
         s3, _ = conn._get_server('12')
         self.assertNotEqual(s1, s3)
         conn.close_socket()
+
+    def test_unix_server(self):
+        conn = Connection(servers=['unix:/tmp/memcached.sock'])
+        host = conn.hosts[0]
+        self.assertEqual((host.host, host.port), ('/tmp/memcached.sock', None))
+        self.assertEqual(str(host), 'unix:/tmp/memcached.sock')
+
+    @run_until_complete
+    def test_unix_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'memcached.sock')
+        server = StubServer()
+        mcache = Client(servers=[server.listen_unix(path)])
+        yield mcache.set(b'key:unix', b'1')
+        test_value = yield mcache.get(b'key:unix')
+        self.assertEqual(test_value, b'1')
+        mcache.close()
+        server.stop()
+        shutil.rmtree(os.path.dirname(path))
+
+    @run_until_complete
+    def test_socket_options(self):
+        server = StubServer()
+        port = server.listen_free()
+        mcache = Client(
+            servers=['127.0.0.1:{}'.format(port)], keepalive_idle=30,
+            keepalive_interval=5, recv_buffer=65536, read_chunk_size=4096)
+        yield mcache.set(b'key:options', b'1')
+        conn = yield mcache.pool.acquire()
+        host = conn.hosts[0]
+        sock = host.sock
+        self.assertTrue(
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        self.assertGreaterEqual(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 65536)
+        self.assertEqual(host.stream.read_chunk_size, 4096)
+        mcache.pool.release(conn)
+        mcache.close()
+        server.stop()
+
+    def test_socket_options_unix(self):
+        sock = RecordingSocket(socket.AF_UNIX)
+        SocketOptions(keepalive_idle=30, recv_buffer=65536).apply(sock)
+        # TCP options are skipped for unix sockets
+        self.assertEqual(
+            sock.options, [(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)])
+
+        sock = RecordingSocket(socket.AF_INET)
+        SocketOptions(keepalive_idle=30).apply(sock)
+        self.assertIn(
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), sock.options)
+        self.assertIn(
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), sock.options)
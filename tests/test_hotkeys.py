@@ -0,0 +1,75 @@
+from asyncmc.client import Client
+from asyncmc.hotkeys import CountMinSketch, HotKeys
+from ._testutil import BaseTest, run_until_complete
+
+
+class CountMinSketchTest(BaseTest):
+
+    def test_estimate(self):
+        sketch = CountMinSketch(width=64, depth=4)
+        for i in range(100):
+            sketch.add(b'hot')
+        sketch.add(b'cold')
+        self.assertTrue(sketch.estimate(b'hot') >= 100)
+        self.assertTrue(sketch.estimate(b'cold') >= 1)
+        sketch.decay()
+        self.assertTrue(sketch.estimate(b'hot') >= 50)
+
+
+class HotKeysTest(BaseTest):
+
+    def test_hottest(self):
+        hot_keys = HotKeys(top=2)
+        for key, reads in ((b'a', 5), (b'b', 1), (b'c', 3)):
+            for i in range(reads):
+                hot_keys.lookup(key)
+        self.assertEqual(
+            [key for key, count in hot_keys.hottest()], [b'a', b'c'])
+        self.assertEqual(hot_keys.hottest(1), [(b'a', 5)])
+
+    def test_promotion(self):
+        hot_keys = HotKeys(threshold=2, ttl=60)
+        self.assertEqual(hot_keys.lookup(b'key'), None)
+        hot_keys.offer(b'key', 0, b'value')
+        self.assertEqual(hot_keys.cached(), [])
+
+        self.assertEqual(hot_keys.lookup(b'key'), None)
+        hot_keys.offer(b'key', 0, b'value')
+        self.assertEqual(hot_keys.cached(), [b'key'])
+        self.assertEqual(hot_keys.lookup(b'key'), (0, b'value'))
+
+        hot_keys.discard(b'key')
+        self.assertEqual(hot_keys.lookup(b'key'), None)
+
+
+class ClientHotKeysTest(BaseTest):
+
+    def setUp(self):
+        super(ClientHotKeysTest, self).setUp()
+        self.hot_keys = HotKeys(threshold=1, ttl=60)
+        self.mcache = Client(
+            servers=['localhost:11211'], hot_keys=self.hot_keys)
+
+    def tearDown(self):
+        super(ClientHotKeysTest, self).tearDown()
+        self.mcache.close()
+
+    @run_until_complete
+    def test_local_cache(self):
+        key = b'key:hot'
+        yield self.mcache.set(key, [1, 2])
+        test_value = yield self.mcache.get(key)
+        self.assertEqual(test_value, [1, 2])
+        self.assertEqual(self.hot_keys.cached(), [key])
+
+        # served locally, so the value changed by other clients is stale
+        other = Client(servers=['localhost:11211'])
+        yield other.set(key, [3])
+        test_value = yield self.mcache.get(key)
+        self.assertEqual(test_value, [1, 2])
+        other.close()
+
+        # own writes drop the local copy
+        yield self.mcache.set(key, [4])
+        test_value = yield self.mcache.get(key)
+        self.assertEqual(test_value, [4])
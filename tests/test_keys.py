@@ -0,0 +1,59 @@
+# -*- coding:utf-8 -*-
+from asyncmc.client import Client
+from asyncmc.exceptions import ValidationException
+from asyncmc.keys import KeyPipeline
+from ._testutil import BaseTest, run_until_complete
+
+
+class KeyPipelineTest(BaseTest):
+
+    def test_prefix(self):
+        keys = KeyPipeline(prefix='app:')
+        self.assertEqual(keys(u'user:1'), b'app:user:1')
+        self.assertEqual(keys.batch([b'a', 'b']), [b'app:a', b'app:b'])
+        self.assertRaises(ValidationException, KeyPipeline, prefix=b'a b')
+
+    def test_validation(self):
+        keys = KeyPipeline()
+        for key in (b'a b', b'a\n', u'ва', b'a' * 251, b''):
+            self.assertRaises(ValidationException, keys, key)
+            self.assertRaises(ValidationException, keys.batch, [b'a', key])
+        self.assertEqual(keys.batch([b'a' * 250]), [b'a' * 250])
+
+    def test_hash_keys(self):
+        keys = KeyPipeline(prefix=b'app:', hash_keys=True)
+        self.assertEqual(keys(b'short'), b'app:short')
+        long_key = b'a' * 300
+        digest = keys(long_key)
+        self.assertTrue(digest.startswith(b'app:'))
+        self.assertTrue(len(digest) <= 250)
+        self.assertEqual(digest, keys(long_key))
+        self.assertNotEqual(keys(b'a b'), keys(b'a  b'))
+        self.assertEqual(
+            keys.batch([b'short', u'ва', long_key]),
+            [b'app:short', keys(u'ва'), digest])
+
+
+class ClientKeysTest(BaseTest):
+
+    @run_until_complete
+    def test_client(self):
+        mcache = Client(
+            servers=['localhost:11211'], key_prefix=b'keys:', hash_keys=True)
+        plain = Client(servers=['localhost:11211'])
+        key = u'https://example.com/some page'
+        yield mcache.set(key, b'1')
+        yield mcache.set(b'short', b'2')
+        test_value = yield mcache.get(key)
+        self.assertEqual(test_value, b'1')
+        test_value = yield plain.get(b'keys:short')
+        self.assertEqual(test_value, b'2')
+        test_value = yield mcache.multi_get(key, b'short', b'x' * 300)
+        self.assertEqual(test_value, [b'1', b'2', None])
+        yield mcache.set(b'counter', 1)
+        test_value = yield mcache.incr(b'counter')
+        self.assertEqual(test_value, 2)
+        is_deleted = yield mcache.delete(key)
+        self.assertTrue(is_deleted)
+        mcache.close()
+        plain.close()
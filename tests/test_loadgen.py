@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+
+from asyncmc.loadgen import ZipfKeys, ValueSizes, Trace, main
+from ._testutil import BaseTest
+
+
+class LoadgenTest(BaseTest):
+
+    def test_zipf(self):
+        keys = ZipfKeys(1000)
+        picks = [keys() for _ in range(10000)]
+        self.assertTrue(all(0 <= k < 1000 for k in picks))
+        self.assertTrue(picks.count(0) > picks.count(999) * 10)
+
+    def test_value_sizes(self):
+        self.assertEqual(ValueSizes('100')(), 100)
+        sizes = ValueSizes('10-1000')
+        self.assertTrue(all(10 <= sizes() <= 1000 for _ in range(100)))
+
+    def test_trace(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'key:1\nset key:2 10\n\ndelete key:1\n')
+        try:
+            trace = Trace(path)
+        finally:
+            os.remove(path)
+        self.assertEqual([next(trace) for _ in range(4)], [
+            ('get', b'key:1', None),
+            ('set', b'key:2', 10),
+            ('delete', b'key:1', None),
+            ('get', b'key:1', None),
+        ])
+
+    def test_main(self):
+        # main runs the shared IOLoop, left stopped by the tearDown of the
+        # tests before
+        self.loop._stopped = False
+        stdout, sys.stdout = sys.stdout, tempfile.TemporaryFile('w+')
+        try:
+            main(['--duration', '0.3', '--interval', '0.1', '--json'])
+            sys.stdout.seek(0)
+            reports = sys.stdout.readlines()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        self.assertTrue(reports)
@@ -0,0 +1,58 @@
+from asyncmc.client import Client
+from asyncmc.exceptions import ConnectionDeadError
+from asyncmc.metrics import Histogram, Stats
+from ._testutil import BaseTest, run_until_complete
+
+
+class HistogramTest(BaseTest):
+
+    def test_percentile(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(99), 0.0)
+        for i in range(99):
+            histogram.add(0.001)
+        histogram.add(1)
+        self.assertEqual(histogram.count, 100)
+        self.assertTrue(0.001 <= histogram.percentile(50) < 0.002)
+        self.assertTrue(histogram.percentile(99) < 0.002)
+        self.assertEqual(histogram.percentile(100), 1)
+        self.assertEqual(histogram.summary()['max'], 1)
+
+
+class StatsTest(BaseTest):
+
+    def setUp(self):
+        super(StatsTest, self).setUp()
+        self.stats = Stats()
+        self.mcache = Client(servers=['localhost:11211'], metrics=self.stats)
+
+    def tearDown(self):
+        super(StatsTest, self).tearDown()
+        self.mcache.close()
+
+    @run_until_complete
+    def test_client_events(self):
+        yield self.mcache.set(b'key:metrics', b'1')
+        yield self.mcache.multi_get(b'key:metrics', b'not:key:metrics')
+        snapshot = self.stats.snapshot()
+
+        host = 'localhost:11211'
+        self.assertEqual(snapshot['commands'][b'set'][host]['count'], 1)
+        self.assertEqual(snapshot['commands'][b'get'][host]['count'], 1)
+        self.assertEqual(snapshot['hits'][host], 1)
+        self.assertEqual(snapshot['misses'][host], 1)
+        self.assertEqual(snapshot['hit_ratio'], 0.5)
+        self.assertEqual(snapshot['connects'][host], 1)
+        self.assertTrue(snapshot['bytes_sent'][host] > 0)
+        self.assertTrue(snapshot['bytes_received'][host] > 0)
+        self.assertEqual(snapshot['pool_wait']['count'], 2)
+        self.assertEqual(snapshot['pool_in_use'], 0)
+
+    @run_until_complete
+    def test_dead_host(self):
+        mcache = Client(servers=['some_host:1233123'], metrics=self.stats)
+        with self.assertRaises(ConnectionDeadError):
+            yield mcache.multi_get(b'key:metrics')
+        self.assertEqual(self.stats.snapshot()['dead'], {
+            'some_host:1233123': 1
+        })
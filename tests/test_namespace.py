@@ -0,0 +1,81 @@
+from tornado import gen
+
+from asyncmc.client import Client
+from asyncmc.hotkeys import HotKeys
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+class NamespaceTest(BaseTest):
+
+    def setUp(self):
+        super(NamespaceTest, self).setUp()
+        self.stub = StubServer()
+        self.mcache = Client(
+            servers=['127.0.0.1:{}'.format(self.stub.listen_free())])
+
+    def tearDown(self):
+        self.mcache.close()
+        self.stub.stop()
+        super(NamespaceTest, self).tearDown()
+
+    @run_until_complete
+    def test_invalidate(self):
+        tenant = self.mcache.namespace(b'tenant:1')
+        other = self.mcache.namespace(b'tenant:2')
+        yield tenant.set(b'profile', b'1')
+        yield other.set(b'profile', b'2')
+        test_value = yield tenant.multi_get(b'profile', b'missing')
+        self.assertEqual(test_value, [b'1', None])
+
+        generation = yield tenant.generation()
+        new_generation = yield tenant.invalidate()
+        self.assertEqual(new_generation, generation + 1)
+        test_value = yield tenant.get(b'profile')
+        self.assertEqual(test_value, None)
+        test_value = yield other.get(b'profile')
+        self.assertEqual(test_value, b'2')
+
+    @run_until_complete
+    def test_ttl(self):
+        first = self.mcache.namespace(b'tenant:3', ttl=0.05)
+        second = self.mcache.namespace(b'tenant:3', ttl=0.05)
+        # concurrent callers share the fetch of the generation
+        generations = yield [first.generation(), first.generation()]
+        self.assertEqual(generations[0], generations[1])
+        yield first.set(b'profile', b'1')
+
+        yield second.invalidate()
+        # the invalidation shows after the ttl of the cached generation
+        test_value = yield first.get(b'profile')
+        self.assertEqual(test_value, b'1')
+        yield gen.sleep(0.06)
+        test_value = yield first.get(b'profile')
+        self.assertEqual(test_value, None)
+
+    @run_until_complete
+    def test_evicted_generation(self):
+        tenant = self.mcache.namespace(b'tenant:4', ttl=0)
+        yield tenant.set(b'profile', b'1')
+        old_key = yield tenant.key(b'profile')
+        yield self.mcache.delete(tenant.generation_key)
+        new_key = yield tenant.key(b'profile')
+        self.assertNotEqual(old_key, new_key)
+        test_value = yield tenant.delete(b'profile')
+        self.assertFalse(test_value)
+
+    @run_until_complete
+    def test_hot_keys(self):
+        # the generation is read from the local cache without a yield
+        mcache = Client(
+            servers=self.mcache.pool.servers,
+            hot_keys=HotKeys(threshold=1, ttl=60))
+        tenant = mcache.namespace(b'tenant:hot', ttl=0)
+        for _ in range(4):
+            key = yield tenant.key(b'profile')
+            self.assertNotIn(b'None', key)
+        generation = yield tenant.invalidate()
+        key = yield tenant.key(b'profile')
+        self.assertEqual(
+            key, b'tenant:hot:' + str(generation).encode() + b':profile')
+        mcache.close()
@@ -0,0 +1,68 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from asyncmc.client import Client
+from asyncmc.offload import size_exceeds
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+class SizeExceedsTest(unittest.TestCase):
+
+    def test_size_exceeds(self):
+        self.assertFalse(size_exceeds({'a': [1, 2, 3]}, 100))
+        self.assertTrue(size_exceeds({'a': 'x' * 101}, 100))
+        self.assertTrue(size_exceeds([[1] * 10] * 10, 100))
+        self.assertFalse(size_exceeds(None, 100))
+
+
+class OffloadTest(BaseTest):
+
+    def setUp(self):
+        super(OffloadTest, self).setUp()
+        self.stub = StubServer()
+        self.server = '127.0.0.1:{}'.format(self.stub.listen_free())
+
+    def tearDown(self):
+        self.stub.stop()
+        super(OffloadTest, self).tearDown()
+
+    @run_until_complete
+    def test_thread_pool(self):
+        executor = ThreadPoolExecutor(2)
+        mcache = Client(
+            servers=[self.server], executor=executor,
+            offload_encode_threshold=100, offload_decode_threshold=100)
+        large = {'list': list(range(100))}
+        yield mcache.set(b'offload:small', {'a': 1})
+        yield mcache.set(b'offload:large', large)
+        yield mcache.set_many({b'offload:many': large, b'offload:str': 'x'})
+        self.assertEqual(mcache.offload.encoded, 2)
+
+        test_value = yield mcache.multi_get(
+            b'offload:small', b'offload:large', b'offload:missing',
+            b'offload:many')
+        self.assertEqual(test_value, [{'a': 1}, large, None, large])
+        self.assertEqual(mcache.offload.decoded, 2)
+        test_value = yield mcache.get(b'offload:large')
+        self.assertEqual(test_value, large)
+        self.assertEqual(mcache.offload.decoded, 3)
+
+        mcache.close()
+        executor.shutdown()
+
+    @run_until_complete
+    def test_process_pool(self):
+        executor = ProcessPoolExecutor(1)
+        mcache = Client(
+            servers=[self.server], executor=executor,
+            offload_encode_threshold=10, offload_decode_threshold=10)
+        value = [{'id': i} for i in range(10)]
+        yield mcache.set(b'offload:process', value)
+        test_value = yield mcache.get(b'offload:process')
+        self.assertEqual(test_value, value)
+        self.assertEqual(mcache.offload.encoded, 1)
+        self.assertEqual(mcache.offload.decoded, 1)
+
+        mcache.close()
+        executor.shutdown()
@@ -0,0 +1,76 @@
+import sys
+import unittest
+
+from tornado import gen
+
+from asyncmc.client import Client
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+if sys.version_info >= (3, 5):
+    # async for syntax
+    from ._scanutil import collect
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'scans are async iterators')
+class ScanTest(BaseTest):
+
+    def setUp(self):
+        super(ScanTest, self).setUp()
+        self.stubs = [StubServer(), StubServer()]
+        self.servers = [
+            '127.0.0.1:{}'.format(stub.listen_free()) for stub in self.stubs]
+        self.mcache = Client(servers=self.servers)
+
+    def tearDown(self):
+        self.mcache.close()
+        for stub in self.stubs:
+            stub.stop()
+        super(ScanTest, self).tearDown()
+
+    @run_until_complete
+    def test_scan(self):
+        keys = [b'scan:' + str(i).encode('ascii') for i in range(20)]
+        yield self.mcache.set_many(dict((key, b'x') for key in keys))
+        yield self.mcache.set(b'other', b'x', exptime=600)
+
+        infos = yield collect(self.mcache.scan())
+        self.assertEqual(
+            sorted(info.key for info in infos), sorted(keys + [b'other']))
+        other, = [info for info in infos if info.key == b'other']
+        self.assertTrue(other.exptime > 0)
+        self.assertTrue(other.last_access > 0)
+
+        infos = yield collect(self.mcache.scan(prefix='scan:'))
+        self.assertEqual(sorted(info.key for info in infos), sorted(keys))
+        infos = yield collect(self.mcache.scan(hosts=self.servers[:1]))
+        self.assertEqual(
+            len(infos), len(self.stubs[0].items))
+
+        test_value = yield self.mcache.delete_many(
+            [info.key for info in infos])
+        self.assertTrue(test_value)
+        self.assertEqual(self.stubs[0].items, {})
+
+    @run_until_complete
+    def test_key_prefix(self):
+        yield self.mcache.set(b'outside', b'x')
+        mcache = Client(servers=self.servers, key_prefix=b'app:')
+        yield mcache.set(b'inside', b'x')
+        infos = yield collect(mcache.scan())
+        self.assertEqual([info.key for info in infos], [b'inside'])
+        mcache.close()
+
+    @run_until_complete
+    def test_close(self):
+        yield self.mcache.set_many(
+            dict((b'close:' + str(i).encode('ascii'), b'x')
+                 for i in range(50)))
+        scan = self.mcache.scan(buffer=2)
+        infos = yield collect(scan, limit=3)
+        self.assertEqual(len(infos), 3)
+        yield gen.sleep(0.01)
+        # the dumps stopped and the connection is back
+        self.assertEqual(len(self.mcache.pool._in_use), 0)
+        test_value = yield self.mcache.get(b'close:1')
+        self.assertEqual(test_value, b'x')
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from asyncmc.client import Client
+from asyncmc.exceptions import ValidationException
+from asyncmc.hotkeys import HotKeys
+from asyncmc.sharedcache import SharedCache
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+def write_values(path, count):
+    cache = SharedCache(path, slots=8, slot_size=256)
+    for i in range(count):
+        cache.offer(b'key', 0, b'a' * 10 if i % 2 else b'b' * 100)
+    cache.close()
+
+
+class SharedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared(self):
+        first = SharedCache(self.path, slots=8, slot_size=128, ttl=60)
+        second = SharedCache(self.path, slots=8, slot_size=128, ttl=60)
+        self.assertIsNone(first.lookup(b'key'))
+        first.offer(b'key', 2, b'value')
+        self.assertEqual(second.lookup(b'key'), (2, b'value'))
+        second.offer(b'key', 0, b'other')
+        self.assertEqual(first.lookup(b'key'), (0, b'other'))
+        self.assertEqual((first.hits, first.misses), (1, 1))
+
+        # does not fit the slot
+        first.offer(b'large', 0, b'x' * 128)
+        self.assertIsNone(second.lookup(b'large'))
+
+        second.discard(b'key')
+        self.assertIsNone(first.lookup(b'key'))
+        first.close()
+        second.close()
+
+        with self.assertRaises(ValidationException):
+            SharedCache(self.path, slots=16, slot_size=128)
+
+    def test_expire_and_evict(self):
+        cache = SharedCache(self.path, slots=4, slot_size=128, ttl=60)
+        for i in range(4):
+            cache.offer(b'key:' + str(i).encode('ascii'), 0, b'value')
+        for i in (0, 2, 3):
+            cache.lookup(b'key:' + str(i).encode('ascii'))
+        # key:1 was read the longest ago
+        cache.offer(b'key:4', 0, b'value')
+        self.assertIsNone(cache.lookup(b'key:1'))
+        self.assertIsNotNone(cache.lookup(b'key:0'))
+        self.assertIsNotNone(cache.lookup(b'key:4'))
+
+        cache.ttl = 0.01
+        cache.offer(b'key:0', 0, b'value')
+        time.sleep(0.02)
+        self.assertIsNone(cache.lookup(b'key:0'))
+        cache.close()
+
+    def test_hot_keys(self):
+        cache = SharedCache(
+            self.path, hot_keys=HotKeys(threshold=2))
+        cache.lookup(b'key')
+        cache.offer(b'key', 0, b'value')
+        self.assertIsNone(cache.lookup(b'key'))
+        cache.offer(b'key', 0, b'value')
+        self.assertEqual(cache.lookup(b'key'), (0, b'value'))
+        cache.close()
+
+    def test_concurrent_writer(self):
+        cache = SharedCache(self.path, slots=8, slot_size=256)
+        writer = multiprocessing.Process(
+            target=write_values, args=(self.path, 20000))
+        writer.start()
+        seen = set()
+        while writer.is_alive():
+            item = cache.lookup(b'key')
+            if item is not None:
+                seen.add(item[1])
+        writer.join()
+        # never a torn value
+        self.assertTrue(seen <= {b'a' * 10, b'b' * 100})
+        cache.close()
+
+
+class SharedCacheClientTest(BaseTest):
+
+    @run_until_complete
+    def test_client(self):
+        directory = tempfile.mkdtemp()
+        stub = StubServer()
+        server = '127.0.0.1:{}'.format(stub.listen_free())
+        caches = [
+            SharedCache(os.path.join(directory, 'cache')) for _ in range(2)]
+        first, second = [
+            Client(servers=[server], hot_keys=cache) for cache in caches]
+        try:
+            yield first.set(b'shared', {'a': 1})
+            test_value = yield first.get(b'shared')
+            self.assertEqual(test_value, {'a': 1})
+            test_value = yield second.get(b'shared')
+            self.assertEqual(test_value, {'a': 1})
+            self.assertEqual(stub.counters['cmd_get'], 1)
+
+            yield second.set(b'shared', 2)
+            test_value = yield first.get(b'shared')
+            self.assertEqual(test_value, 2)
+        finally:
+            first.close()
+            second.close()
+            for cache in caches:
+                cache.close()
+            stub.stop()
+            shutil.rmtree(directory)
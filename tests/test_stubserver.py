@@ -0,0 +1,67 @@
+import time
+
+from tornado import gen
+
+from asyncmc.client import Client
+from asyncmc.stubserver import StubServer
+from ._testutil import BaseTest, run_until_complete
+
+
+class StubServerTest(BaseTest):
+
+    def setUp(self):
+        super(StubServerTest, self).setUp()
+        self.server = StubServer()
+        port = self.server.listen_free()
+        self.mcache = Client(servers=['127.0.0.1:{}'.format(port)])
+
+    def tearDown(self):
+        self.mcache.close()
+        self.server.stop()
+        super(StubServerTest, self).tearDown()
+
+    @run_until_complete
+    def test_commands(self):
+        yield self.mcache.set(b'key:stub', {'a': 1})
+        test_value = yield self.mcache.get(b'key:stub')
+        self.assertEqual(test_value, {'a': 1})
+
+        test_value = yield self.mcache.add(b'key:stub', 1)
+        self.assertEqual(test_value, False)
+
+        yield self.mcache.set(b'key:stub:str', 'a')
+        yield self.mcache.append(b'key:stub:str', 'b')
+        yield self.mcache.prepend(b'key:stub:str', 'c')
+        test_value = yield self.mcache.multi_get(
+            b'key:stub:str', b'not:key:stub')
+        self.assertEqual(test_value, ['cab', None])
+
+        yield self.mcache.set(b'key:stub:int', 1)
+        test_value = yield self.mcache.incr(b'key:stub:int', 10)
+        self.assertEqual(test_value, 11)
+        test_value = yield self.mcache.decr(b'key:stub:int', 20)
+        self.assertEqual(test_value, 0)
+
+        test_value = yield self.mcache.delete(b'key:stub')
+        self.assertEqual(test_value, True)
+        test_value = yield self.mcache.delete(b'key:stub')
+        self.assertEqual(test_value, False)
+
+        version = yield self.mcache.version()
+        stats = yield self.mcache.stats()
+        self.assertEqual(version, stats[b'version'])
+
+    @run_until_complete
+    def test_flush_all(self):
+        # at the start of a second
+        yield gen.sleep(1 - time.time() % 1)
+        yield self.mcache.set(b'key:stub', 1)
+        yield self.mcache.flush_all()
+        # like memcached, items stored within the current second survive
+        self.assertIn(b'key:stub', self.server.items)
+
+        yield gen.sleep(1 - time.time() % 1)
+        yield self.mcache.flush_all()
+        self.assertEqual(self.server.items, {})
+        test_value = yield self.mcache.get(b'key:stub')
+        self.assertEqual(test_value, None)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+
+from asyncmc import constants as const
+from asyncmc.client import Client
+from asyncmc.protocol import parse_metadump
+from asyncmc.stubserver import StubServer
+from asyncmc.warmup import HotSet
+from ._testutil import BaseTest, run_until_complete
+
+
+class HotSetTest(BaseTest):
+
+    def setUp(self):
+        super(HotSetTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'hot.snapshot')
+        self.stub = StubServer()
+        self.mcache = Client(
+            servers=['127.0.0.1:{}'.format(self.stub.listen_free())])
+
+    def tearDown(self):
+        self.mcache.close()
+        self.stub.stop()
+        shutil.rmtree(self.directory)
+        super(HotSetTest, self).tearDown()
+
+    def test_parse_metadump(self):
+        entry = parse_metadump(
+            b'key=user%3A1 exp=-1 la=1500000000 cas=3 fetch=no cls=1 '
+            b'size=70\n')
+        self.assertEqual(entry.key, b'user:1')
+        self.assertEqual(entry.exptime, -1)
+        self.assertEqual(entry.last_access, 1500000000)
+        self.assertEqual(entry.size, 70)
+
+    @run_until_complete
+    def test_save_restore(self):
+        yield self.mcache.set(b'warm:1', {'a': 1})
+        yield self.mcache.set(b'warm:2', 'two', exptime=600)
+        yield self.mcache.set(b'warm:3', b'three')
+        yield self.mcache.set(b'warm:cold', b'cold')
+        now = time.time()
+        for key, ago in ((b'warm:1', 1), (b'warm:2', 2), (b'warm:3', 3),
+                         (b'warm:cold', 100)):
+            self.stub.accessed[key] = now - ago
+
+        count = yield HotSet(self.mcache).save(self.path, limit=3)
+        self.assertEqual(count, 3)
+
+        # the server restarted
+        self.stub.items.clear()
+        yield self.mcache.set(b'warm:3', b'newer')
+        start = time.time()
+        count = yield HotSet(self.mcache, batch=1).restore(
+            self.path, rate=20)
+        self.assertTrue(time.time() - start >= 0.1)
+        # warm:3 was written since the restart
+        self.assertEqual(count, 2)
+
+        test_value = yield self.mcache.multi_get(
+            b'warm:1', b'warm:2', b'warm:3', b'warm:cold')
+        self.assertEqual(test_value, [{'a': 1}, 'two', b'newer', None])
+        flags, _, expires = self.stub.items[b'warm:2'][:3]
+        self.assertEqual(flags, const.FLAG_STRING)
+        self.assertTrue(now + 590 < expires <= now + 600)
+        self.assertEqual(self.stub.items[b'warm:1'][2], 0)
+
+    @run_until_complete
+    def test_restore_replicas(self):
+        stubs = [StubServer(), StubServer()]
+        mcache = Client(
+            servers=['127.0.0.1:{}'.format(s.listen_free()) for s in stubs],
+            replicas=2)
+        keys = [b'warm:r:' + str(i).encode('ascii') for i in range(10)]
+        for key in keys:
+            yield mcache.set(key, key)
+        count = yield HotSet(mcache).save(self.path)
+        self.assertEqual(count, len(keys))
+
+        for stub in stubs:
+            stub.items.clear()
+        count = yield HotSet(mcache).restore(self.path)
+        self.assertEqual(count, len(keys))
+        for stub in stubs:
+            self.assertEqual(sorted(stub.items), sorted(keys))
+        test_value = yield mcache.multi_get(*keys)
+        self.assertEqual(test_value, keys)
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from tornado import gen
+
+from asyncmc.client import Client
+from asyncmc.exceptions import ValidationException
+from asyncmc.stubserver import StubServer
+from asyncmc.writebehind import DROP_NEW
+from ._testutil import BaseTest, run_until_complete
+
+
+class WriteBehindTest(BaseTest):
+
+    def setUp(self):
+        super(WriteBehindTest, self).setUp()
+        self.stub = StubServer()
+        self.mcache = Client(
+            servers=['127.0.0.1:{}'.format(self.stub.listen_free())])
+
+    def tearDown(self):
+        self.mcache.close()
+        self.stub.stop()
+        super(WriteBehindTest, self).tearDown()
+
+    @run_until_complete
+    def test_flush(self):
+        writes = self.mcache.write_behind(interval=0.01)
+        self.assertTrue(writes.set(b'wb:1', b'old'))
+        writes.set(b'wb:1', b'1')
+        writes.set(b'wb:2', {'a': 1}, exptime=60)
+        self.assertEqual(writes.coalesced, 1)
+        self.assertEqual(self.stub.items, {})
+
+        yield gen.sleep(0.05)
+        test_value = yield self.mcache.multi_get(b'wb:1', b'wb:2')
+        self.assertEqual(test_value, [b'1', {'a': 1}])
+        self.assertEqual(self.stub.counters['cmd_set'], 2)
+
+        writes.set(b'wb:3', b'3')
+        yield self.mcache.flush()
+        # noreply sets are not waited for
+        yield gen.sleep(0.01)
+        test_value = yield self.mcache.get(b'wb:3')
+        self.assertEqual(test_value, b'3')
+
+    @run_until_complete
+    def test_full(self):
+        writes = self.mcache.write_behind(interval=60, max_items=2)
+        for i in range(3):
+            writes.set(b'wb:old:' + str(i).encode('ascii'), i)
+        self.assertEqual(list(writes.buffer), [b'wb:old:1', b'wb:old:2'])
+
+        writes = self.mcache.write_behind(
+            interval=60, max_items=2, policy=DROP_NEW)
+        for i in range(3):
+            writes.set(b'wb:new:' + str(i).encode('ascii'), i)
+        self.assertEqual(list(writes.buffer), [b'wb:new:0', b'wb:new:1'])
+        self.assertEqual(writes.dropped, 1)
+        yield self.mcache.flush()
+        yield gen.sleep(0.01)
+        test_value = yield self.mcache.multi_get(
+            b'wb:old:0', b'wb:old:2', b'wb:new:1', b'wb:new:2')
+        self.assertEqual(test_value, [None, 2, 1, None])
+        self.mcache.close()
+
+    @run_until_complete
+    def test_replicas(self):
+        stubs = [StubServer(), StubServer()]
+        mcache = Client(
+            servers=['127.0.0.1:{}'.format(s.listen_free()) for s in stubs],
+            replicas=2)
+        writes = mcache.write_behind(interval=60)
+        keys = [b'wb:r:' + str(i).encode('ascii') for i in range(10)]
+        for key in keys:
+            writes.set(key, key)
+        yield mcache.flush()
+        test_value = yield mcache.multi_get(*keys)
+        self.assertEqual(test_value, keys)
+        for stub in stubs:
+            self.assertEqual(sorted(stub.items), sorted(keys))
+        mcache.close()
+        for stub in stubs:
+            stub.stop()
+
+    @run_until_complete
+    def test_migrate(self):
+        new = StubServer()
+        yield self.mcache.set(b'wb:m1', b'old')
+        self.mcache.migrate(['127.0.0.1:{}'.format(new.listen_free())])
+        writes = self.mcache.write_behind(interval=60)
+        writes.set(b'wb:m1', b'new')
+        yield self.mcache.flush()
+        yield gen.sleep(0.01)
+        # the old server does not keep the stale value
+        self.assertEqual(self.stub.items[b'wb:m1'][1], b'new')
+        self.assertEqual(new.items[b'wb:m1'][1], b'new')
+        self.mcache.close()
+        new.stop()
+
+    @run_until_complete
+    def test_offload(self):
+        executor = ThreadPoolExecutor(1)
+        mcache = Client(
+            servers=self.mcache.pool.servers, executor=executor,
+            offload_encode_threshold=100)
+        writes = mcache.write_behind(interval=60)
+        large = {'list': list(range(100))}
+        writes.set(b'wb:large', large)
+        writes.set(b'wb:small', {'a': 1})
+        writes.set(b'wb:bad', lambda: None)
+        with self.assertRaises(ValidationException):
+            writes.set(b'wb:exptime', 1, exptime=-1)
+        yield mcache.flush()
+        yield gen.sleep(0.01)
+        self.assertGreaterEqual(mcache.offload.encoded, 1)
+        self.assertEqual(writes.dropped, 1)
+        test_value = yield mcache.multi_get(b'wb:large', b'wb:small')
+        self.assertEqual(test_value, [large, {'a': 1}])
+        mcache.close()
+        executor.shutdown()